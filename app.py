@@ -1,22 +1,44 @@
 import os
-from datetime import timedelta
-from flask import Flask, jsonify, request, make_response
+import base64
+import hashlib
+import io
+import json
+from collections import namedtuple
+
+import click
+from datetime import datetime, timedelta
+from flask import Flask, Response, current_app, jsonify, request, make_response, stream_with_context
+from flask.cli import with_appcontext
 from flask_marshmallow import Marshmallow
 from flask_migrate import Migrate
 from flask_restful import Api, Resource
 from werkzeug.exceptions import NotFound
-import requests
+from werkzeug.test import EnvironBuilder
 from flask_cors import CORS
 from sqlalchemy.exc import IntegrityError
-from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity, create_access_token
-
-from models import db , User , BookClub , ClubMember , Book , CurrentBook , PrevioislyReadBook , BookComment , Message
+from sqlalchemy import and_, case, func, literal, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity, get_current_user, create_access_token
+
+from archive import archive_anchor, archive_messages_command, archived_batches, archived_messages
+from broker import get_broker
+from cache import ResponseCache, TTLCache
+from index_audit import index_audit_command
+from instrumentation import RequestMetrics
+from passwords import ExecutorSaturated, PasswordExecutor
+from replicas import ReplicaRouter, replica_binds
+from search import search
+from serialization import ColumnSerializer, FastJSONProvider, dumps
+from url_verifier import URLVerifier
+from models import db , User , BookClub , ClubMember , Book , CurrentBook , PrevioislyReadBook , BookComment , Message , MessageArchive , ClubReadCursor
 
 # These Configerations are for when  running the server locally for deployment configerations look at create_app function
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///story_circle.db'
+app.config['SQLALCHEMY_BINDS'] = replica_binds(os.environ.get('DATABASE_REPLICA_URIS'))  # Comma separated read replica URIs
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.json.compact = False
+app.config['PROPAGATE_EXCEPTIONS'] = True  # Lets flask_jwt_extended's error handlers answer instead of Flask-RESTful's generic 500
+app.json = FastJSONProvider(app)  # Compact JSON through orjson
 
 CORS(app)
 CORS(app, resources={r"/*": {"origins": "http://localhost:5173"}})
@@ -28,12 +50,768 @@ api = Api(app)
 app.config['JWT_SECRET_KEY'] = '$2a$10$Xs1h0711a6I8n4c9179t0u.h773sj7/Xc2.0737j5r6v996349/Hm0j6z3yM'  # Personal / Owner Key For JWT locked resources
 jwt = JWTManager(app)
 
-def is_valid_url(url):
+# Request latency, SQL statement counts and slow queries, exported on /metrics
+request_metrics = RequestMetrics(slow_query_ms=float(os.environ.get('SLOW_QUERY_MS', 200)))
+request_metrics.init_app(app)
+
+# GET requests read from the replicas in DATABASE_REPLICA_URIS, callers who just wrote
+# something read from the primary for REPLICA_STICKY_SECONDS
+replica_router = ReplicaRouter(
+    db,
+    sticky_seconds=float(os.environ.get('REPLICA_STICKY_SECONDS', 5)),
+    dispatch_endpoints=('batch',),  # Its sub-requests are routed one by one
+)
+replica_router.init_app(app)
+
+# Protected handlers get the caller from get_current_user(), served from this cache instead of
+# a users query per request. Profile.patch/delete evict their entry, the TTL bounds how long
+# other workers can keep serving a stale one
+CachedUser = namedtuple('CachedUser', 'id username email first_name last_name profile_pic profile_pic_status')
+current_user_cache = TTLCache(maxsize=4096, ttl=60)
+
+def find_cached_user(username, session=None):
+    # The caller's CachedUser, read through `session` (db.session by default) on a cache miss
+    user = current_user_cache.get(username)
+
+    if user is None:
+        row = (db.session if session is None else session).query(User).filter_by(username=username).first()
+        if not row:
+            return None
+
+        user = CachedUser(
+            id=row.id,
+            username=row.username,
+            email=row.email,
+            first_name=row.first_name,
+            last_name=row.last_name,
+            profile_pic=row.profile_pic,
+            profile_pic_status=row.profile_pic_status,
+        )
+        current_user_cache.set(username, user)
+
+    return user
+
+@jwt.user_lookup_loader
+def load_current_user(jwt_header, jwt_data):
+    return find_cached_user(jwt_data["sub"])
+
+@jwt.user_lookup_error_loader
+def current_user_not_found(jwt_header, jwt_data):
+    response = make_response(jsonify({"message": "User not found"}), 404)
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+# Password hashing runs on its own small pool so login bursts cannot take every worker.
+# Changing PASSWORD_HASH_METHOD makes LogIn rehash each user's password on their next login
+password_executor = PasswordExecutor(
+    max_workers=int(os.environ.get('PASSWORD_HASH_WORKERS', 2)),
+    max_queue=int(os.environ.get('PASSWORD_HASH_QUEUE', 16)),
+    method=os.environ.get('PASSWORD_HASH_METHOD', 'scrypt'),
+)
+
+def saturated_response():
+    response = make_response(
+        jsonify({"errors": ["Too many login attempts in progress, try again shortly"]}),
+        503
+    )
+    response.headers["Content-Type"] = "application/json"
+    response.headers["Retry-After"] = "1"
+    return response
+
+# Profile picture URLs are checked in the background, see Profile.patch
+url_verifier = URLVerifier(max_workers=4, max_pending=256, timeout=(2, 3), ttl=3600)
+
+def apply_profile_pic_verdict(app, user_id, url, valid):
+    # Runs on a verifier thread once the URL submitted through Profile.patch has been checked
+    with app.app_context():
+        user = db.session.get(User, user_id)
+
+        # The user was deleted or submitted another picture in the meantime
+        if not user or user.pending_profile_pic != url:
+            return
+
+        touched = ([], [])
+        if valid:
+            user.profile_pic = url
+            touched = touch_user_content(user_id)
+        user.pending_profile_pic = None
+        user.profile_pic_status = "valid" if valid else "invalid"
+
+        db.session.commit()
+
+        current_user_cache.delete(user.username)
+        invalidate_user_content(touched)
+
+# Every list endpoint is served in pages of at most PAGE_SIZE_MAX rows
+PAGE_SIZE_DEFAULT = 20
+PAGE_SIZE_MAX = 100
+
+# With ?stream=1 list endpoints send the whole collection instead, fetching and encoding this many rows at a time
+STREAM_BATCH_SIZE = 1000
+
+# Search results are ranked, so they are paged by offset, this bounds how deep a client can go
+SEARCH_MAX_OFFSET = 1000
+
+# POST /books/bulk inserts and commits this many catalog lines at a time
+BULK_BATCH_SIZE = 1000
+
+# Number of most recent messages embedded in the club page, older ones are read through /clubs/<id>/messages
+CLUB_MESSAGE_WINDOW = 50
+
+# Members without a read cursor in a club have read nothing in it
+NEVER_READ = datetime(1970, 1, 1)
+
+# Unread messages are counted up to this many per club, more are shown as "99+"
+UNREAD_COUNT_MAX = 99
+
+# Live chat: SSE streams send a keepalive comment this often, long polls wait at most LONG_POLL_MAX_SECONDS
+SSE_KEEPALIVE_SECONDS = 15
+LONG_POLL_MAX_SECONDS = 25
+
+# POST /batch runs at most BATCH_MAX_REQUESTS sub-requests. The live chat feeds hold their request
+# open so they cannot be batched, and neither can /batch itself
+BATCH_MAX_REQUESTS = 25
+BATCH_METHODS = ('GET', 'POST', 'PATCH', 'DELETE')
+BATCH_EXCLUDED_ENDPOINTS = ('batch', 'clubstream', 'clubpoll')
+BATCH_RESPONSE_HEADERS = ('ETag', 'Retry-After')
+
+# POST and DELETE /clubs/<id>/members change at most this many memberships in one statement
+MEMBERS_BULK_MAX = 1000
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    # Raises ValueError for anything that was not produced by encode_cursor
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception as e:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, dict):
+        raise ValueError("Invalid cursor")
+    return values
+
+def cursor_id(cursor):
+    value = decode_cursor(cursor).get('id')
+    if not isinstance(value, int):
+        raise ValueError("Invalid cursor")
+    return value
+
+def message_cursor(cursor):
+    # (id, created_at) of the message a club messages cursor points at. Cursors issued before
+    # messages could be archived only carry the id, created_at is None for those
+    values = decode_cursor(cursor)
+    message_id, created_at = values.get('id'), values.get('created_at')
+    if not isinstance(message_id, int) or not isinstance(created_at, (str, type(None))):
+        raise ValueError("Invalid cursor")
+    try:
+        return message_id, datetime.fromisoformat(created_at) if created_at else None
+    except ValueError as e:
+        raise ValueError("Invalid cursor")
+
+def message_cursor_for(message):
+    return encode_cursor({
+        "id": message["id"],
+        "created_at": message["created_at"].isoformat() if message["created_at"] else None,
+    })
+
+def page_limit():
+    limit = request.args.get('limit', PAGE_SIZE_DEFAULT, type=int)
+    return max(1, min(limit, PAGE_SIZE_MAX))
+
+def rows_after_cursor(model, columns=None):
+    # The model's rows, or rows of just `columns`, in primary key order after the ?after cursor
+    query = (db.session.query(*columns) if columns else model.query).order_by(model.id)
+
+    after = request.args.get('after')
+    if after:
+        last_id = decode_cursor(after).get('id')
+        if not isinstance(last_id, int):
+            raise ValueError("Invalid cursor")
+        query = query.filter(model.id > last_id)
+
+    return query
+
+def paginate_by_id(model, columns=None):
+    # Keyset pagination over the primary key: each page seeks past the last id of the
+    # previous one instead of using OFFSET, so it is a bounded range scan of the index.
+    # With `columns` the page is rows of just those columns instead of model instances
+    limit = page_limit()
+    rows = rows_after_cursor(model, columns).limit(limit + 1).all()
+    next_cursor = encode_cursor({"id": rows[limit - 1].id}) if len(rows) > limit else None
+
+    return rows[:limit], next_cursor
+
+def club_messages_query(club_id, before=None, session=None):
+    # A club's messages newest first, older than the message with id `before`, as rows shaped
+    # like message_data. The seek is on (created_at, id) so it is a range scan of
+    # ix_messages_club_id_created_at_id_sender_id
+    session = db.session if session is None else session
+    query = session.query(
+        Message.id,
+        User.username.label('sender'),
+        Message.message,
+        Message.created_at,
+    ).outerjoin(User, User.id == Message.sender_id).filter(Message.club_id == club_id)
+
+    if before is not None:
+        anchor = session.query(Message.created_at).filter(Message.id == before).scalar_subquery()
+        query = query.filter(tuple_(Message.created_at, Message.id) < tuple_(anchor, before))
+
+    return query.order_by(Message.created_at.desc(), Message.id.desc())
+
+def message_window(club_id, before=None, limit=PAGE_SIZE_DEFAULT, session=None, before_at=None):
+    # Newest-first page of a club's messages as message_data dicts, see club_messages_query.
+    # `before_at` is the created_at of message `before`, needed once that message is archived.
+    # Archived messages are all older than the hot ones, so the archive is only read when the
+    # page runs past the oldest message still in the messages table. Raises ValueError for an
+    # id-only cursor whose message is gone, see archive_anchor
+    messages = [row._asdict() for row in club_messages_query(club_id, before, session).limit(limit + 1)]
+
+    if len(messages) <= limit:
+        anchor = archive_anchor(before, before_at, session)
+        messages += archived_messages(club_id, anchor, limit + 1 - len(messages), session)
+
+    next_cursor = message_cursor_for(messages[limit - 1]) if len(messages) > limit else None
+
+    return messages[:limit], next_cursor
+
+def wants_stream():
+    return request.args.get('stream') in ('1', 'true')
+
+def stream_items(query, dump_row, tail=()):
+    # Sends every row of `query` as {"items": [...], "next": null} without holding the result in
+    # memory: rows come from a server-side cursor STREAM_BATCH_SIZE at a time, and each batch is
+    # encoded and written out before the next one is fetched. `tail` yields more batches of
+    # already dumped items to send after the rows, e.g. archived messages
+    def generate():
+        result = db.session.execute(query.statement, execution_options={"yield_per": STREAM_BATCH_SIZE})
+        separator = b''
+
+        yield b'{"items":['
+        for rows in result.partitions():
+            yield separator + b','.join(dumps(dump_row(row)) for row in rows)
+            separator = b','
+        for items in tail:
+            if items:
+                yield separator + b','.join(dumps(item) for item in items)
+                separator = b','
+        yield b'],"next":null}\n'
+
+    response = Response(stream_with_context(generate()), content_type="application/json")
+    response.headers["X-Accel-Buffering"] = "no"
+
+    return response
+
+SSE_PREAMBLE = "retry: 3000\n\n"
+
+def next_chat_position(broker, club_id, after, new_events, missed):
+    # Where a listener waits from after a broker wait. After a reset it starts over at the present
+    if new_events:
+        return new_events[-1][0]
+    return broker.latest(club_id) if missed else after
+
+def chat_events_sse(broker, club_id, after, new_events, missed):
+    # One broker wait as Server-Sent Events text, and the position to wait from next.
+    # Used by ClubStream and the async stream in asgi.py
+    chunks = []
+
+    if missed:
+        # The client fell too far behind, it has to reload through /clubs/<id>/messages
+        chunks.append("event: reset\ndata: {}\n\n")
+
+    if not new_events and not missed:
+        chunks.append(": keepalive\n\n")
+
+    for seq, data in new_events:
+        chunks.append(f"id: {seq}\nevent: message\ndata: {data}\n\n")
+
+    return "".join(chunks), next_chat_position(broker, club_id, after, new_events, missed)
+
+def chat_events_poll(broker, club_id, after, new_events, missed):
+    # One broker wait as the body of a long poll, see ClubPoll
+    return {
+        "messages": [json.loads(data) for seq, data in new_events],
+        "reset": missed,
+        "next": next_chat_position(broker, club_id, after, new_events, missed),
+    }
+
+def message_data(message):
+    return {
+        "id": message.id,
+        "sender": message.sender.username if message.sender else None,
+        "message": message.message,
+        "created_at": message.created_at
+    }
+
+def publish_message(message):
+    # Pushes a freshly committed message to everyone listening on its club
+    try:
+        get_broker().publish(message.club_id, current_app.json.dumps(message_data(message)))
+    except Exception as e:
+        current_app.logger.exception("Could not publish message %s", message.id)
+
+# Rendered bodies of the read endpoints, every write resource invalidates what it changed
+response_cache = ResponseCache(TTLCache(maxsize=2048, ttl=300))
+
+def cached_response(kind, id=None, args=(), etag=None):
+    body = response_cache.get(kind, id, args + (etag,))
+    if body is None:
+        return None
+
+    response = make_response(body, 200)
+    response.headers["Content-Type"] = "application/json"
+    if etag:
+        response.set_etag(etag)
+    return response
+
+def cache_response(response, kind, id=None, args=(), etag=None):
+    if response.status_code == 200:
+        if etag:
+            response.set_etag(etag)
+        response_cache.set(kind, response.get_data(), id, args + (etag,))
+    return response
+
+# Conditional GETs. ETags are built from the version counters on books and bookclubs, which every
+# write that changes what a book or club page shows bumps in its own transaction (see bump_versions)
+
+def not_modified(etag):
+    # A bodiless 304 when the client already holds this version, None otherwise
+    if etag and request.if_none_match.contains(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+    return None
+
+def entity_etag(model, kind, id):
+    version = db.session.query(model.version).filter_by(id=id).scalar()
+    return f"{kind}-{id}-{version}" if version is not None else None
+
+def page_etag(model, kind):
+    # Covers exactly the rows paginate_by_id would return for this request, read from the index only
+    query = db.session.query(model.id, model.version).order_by(model.id)
+
+    after = request.args.get('after')
+    if after:
+        query = query.filter(model.id > cursor_id(after))
+
+    rows = query.limit(page_limit() + 1).all()
+    return f"{kind}-" + hashlib.sha1(repr([tuple(row) for row in rows]).encode()).hexdigest()
+
+def bump_versions(model, ids, session=None):
+    ids = list(ids)
+    if ids:
+        (db.session if session is None else session).query(model).filter(model.id.in_(ids)).update(
+            {model.version: model.version + 1},
+            synchronize_session=False,
+        )
+
+def add_book_rating(book_id, rating):
+    # Folds a new comment's rating into the book's aggregates and bumps its version in one
+    # UPDATE, the SET expressions read the old values so concurrent comments cannot lose counts
+    histogram_column = Book.rating_columns()[rating]
+
+    Book.query.filter_by(id=book_id).update(
+        {
+            Book.rating_sum: Book.rating_sum + rating,
+            Book.rating_count: Book.rating_count + 1,
+            histogram_column: histogram_column + 1,
+            Book.rating_avg: (Book.rating_sum + rating) * 1.0 / (Book.rating_count + 1),
+            Book.version: Book.version + 1,
+        },
+        synchronize_session=False,
+    )
+
+def rebuild_rating_aggregates(batch_size=1000):
+    # Recomputes every book's rating aggregates from book_comments with one grouped scan.
+    # Comments whose book is gone are skipped, the bulk UPDATE by id would fail on them
+    columns = Book.rating_columns()
+    rows = db.session.query(
+        BookComment.book_id,
+        func.sum(BookComment.rating),
+        func.count(BookComment.id),
+        *[func.sum(case((BookComment.rating == rating, 1), else_=0)) for rating in columns],
+    ).join(Book, Book.id == BookComment.book_id).group_by(BookComment.book_id)
+
+    reset = {Book.rating_sum: 0, Book.rating_count: 0, Book.rating_avg: None}
+    reset.update({column: 0 for column in columns.values()})
+    Book.query.update(reset, synchronize_session=False)
+
+    updates = []
+    for book_id, rating_sum, rating_count, *histogram in rows:
+        update = {
+            "id": book_id,
+            "rating_sum": rating_sum,
+            "rating_count": rating_count,
+            "rating_avg": rating_sum / rating_count,
+        }
+        update.update({column.key: count for column, count in zip(columns.values(), histogram)})
+        updates.append(update)
+
+    for start in range(0, len(updates), batch_size):
+        db.session.execute(db.update(Book), updates[start:start + batch_size])
+
+    db.session.commit()
+    return len(updates)
+
+@click.command('repair-ratings')
+@with_appcontext
+def repair_ratings_command():
+    """Rebuild the rating aggregates stored on books from book_comments."""
+    click.echo(f"Rebuilt rating aggregates for {rebuild_rating_aggregates()} books")
+
+def refresh_member_counts(club_ids=None):
+    # Recounts member_count from club_members for `club_ids`, or for every club, and bumps their
+    # versions. One correlated UPDATE, each club's count is read from ix_club_members_club_id_member_id
+    members = db.session.query(func.count()).select_from(ClubMember).filter(
+        ClubMember.club_id == BookClub.id,
+        ClubMember.member_id.isnot(None),
+    ).correlate(BookClub).scalar_subquery()
+
+    query = BookClub.query
+    if club_ids is not None:
+        club_ids = list(club_ids)
+        if not club_ids:
+            return 0
+        query = query.filter(BookClub.id.in_(club_ids))
+
+    return query.update(
+        {BookClub.member_count: members, BookClub.version: BookClub.version + 1},
+        synchronize_session=False,
+    )
+
+@click.command('repair-member-counts')
+@with_appcontext
+def repair_member_counts_command():
+    """Recount the member_count stored on clubs from club_members."""
+    updated = refresh_member_counts()
+    db.session.commit()
+    click.echo(f"Recounted members of {updated} clubs")
+
+def dialect_insert(model):
+    # INSERT that supports ON CONFLICT on both SQLite and Postgres
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+def unread_counts(member_id, club_ids=None):
+    # {club_id: unread messages} for the clubs a member belongs to, or just `club_ids`, in one query.
+    # Each count is a range scan of ix_messages_club_id_created_at_id_sender_id from the member's read
+    # cursor that stops after UNREAD_COUNT_MAX + 1 rows, so a club never read costs no more than one
+    # read up to date. The index covers sender_id: the member's own messages do not count, and
+    # neither do archived ones. See unread_label for what clients are sent
+    memberships = db.session.query(ClubMember.club_id).filter(
+        ClubMember.member_id == member_id,
+        ClubMember.club_id.isnot(None),
+    )
+    if club_ids is not None:
+        memberships = memberships.filter(ClubMember.club_id.in_(list(club_ids)))
+    memberships = memberships.subquery()
+
+    unread_rows = db.session.query(Message.id).filter(
+        Message.club_id == memberships.c.club_id,
+        tuple_(Message.created_at, Message.id) > tuple_(
+            func.coalesce(ClubReadCursor.last_read_at, NEVER_READ),
+            func.coalesce(ClubReadCursor.last_read_id, 0),
+        ),
+        Message.sender_id.is_distinct_from(member_id),
+    ).correlate(memberships, ClubReadCursor).limit(UNREAD_COUNT_MAX + 1).subquery()
+    unread = db.session.query(func.count()).select_from(unread_rows).scalar_subquery()
+
+    return dict(db.session.query(memberships.c.club_id, unread).outerjoin(ClubReadCursor, and_(
+        ClubReadCursor.member_id == member_id,
+        ClubReadCursor.club_id == memberships.c.club_id,
+    )).order_by(memberships.c.club_id))
+
+def unread_label(count):
+    # An unread_counts value as sent to clients, "99+" once it reached the cap
+    return f"{UNREAD_COUNT_MAX}+" if count > UNREAD_COUNT_MAX else count
+
+def unread_total(counts):
+    total = sum(min(count, UNREAD_COUNT_MAX) for count in counts.values())
+    return f"{total}+" if any(count > UNREAD_COUNT_MAX for count in counts.values()) else total
+
+def parse_catalog_line(line):
+    # One NDJSON line of POST /books/bulk, raises ValueError with a reason for bad lines
     try:
-        response = requests.head(url)
-        return response.status_code == 200
+        data = json.loads(line)
+    except Exception as e:
+        raise ValueError("invalid JSON")
+
+    if not isinstance(data, dict) or not isinstance(data.get('title'), str) or not data['title'].strip():
+        raise ValueError("a non-empty title is required")
+
+    for attr in ('author', 'description'):
+        if data.get(attr) is not None and not isinstance(data[attr], str):
+            raise ValueError(f"{attr} must be a string")
+
+    return {
+        "title": data['title'],
+        "author": data.get('author'),
+        "description": data.get('description'),
+    }
+
+def import_book_batch(lines, on_duplicate):
+    # Inserts one batch of (line number, raw line) pairs with multi-row
+    # INSERT ... ON CONFLICT (title) statements in its own transaction, returns one result per line
+    results = {}
+    rows = {}
+
+    for line_no, line in lines:
+        try:
+            row = parse_catalog_line(line)
+        except ValueError as e:
+            results[line_no] = {"line": line_no, "status": "error", "error": str(e)}
+            continue
+
+        if row['title'] in rows:
+            # Within one batch the first occurrence of a title wins
+            results[line_no] = {"line": line_no, "status": "skipped", "error": "duplicate title in this request"}
+            continue
+        rows[row['title']] = (line_no, row)
+
+    if not rows:
+        return [results[line_no] for line_no in sorted(results)]
+
+    try:
+        existing = {}
+        if on_duplicate == 'update':
+            existing = dict(db.session.query(Book.title, Book.id).filter(Book.title.in_(list(rows))))
+
+        stmt = dialect_insert(Book)
+        if on_duplicate == 'update':
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Book.title],
+                set_={
+                    "author": stmt.excluded.author,
+                    "description": stmt.excluded.description,
+                    "version": Book.version + 1,
+                },
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=[Book.title])
+
+        # Executed as executemany, which SQLAlchemy sends as multi-row VALUES statements
+        written = dict(db.session.execute(
+            stmt.returning(Book.title, Book.id),
+            [row for line_no, row in rows.values()],
+        ).all())
+
+        club_ids = club_ids_with_books(existing.values()) if existing else set()
+        bump_versions(BookClub, club_ids)
+
+        db.session.commit()
     except Exception as e:
-        return False
+        db.session.rollback()
+        current_app.logger.exception("Bulk book import batch failed")
+
+        for line_no, row in rows.values():
+            results[line_no] = {"line": line_no, "status": "error", "error": "batch could not be written"}
+        return [results[line_no] for line_no in sorted(results)]
+
+    response_cache.invalidate('books')
+    invalidate_clubs(club_ids)
+
+    for title, (line_no, row) in rows.items():
+        if title in existing:
+            results[line_no] = {"line": line_no, "status": "updated", "id": existing[title]}
+        elif title in written:
+            results[line_no] = {"line": line_no, "status": "created", "id": written[title]}
+        else:
+            results[line_no] = {"line": line_no, "status": "skipped", "error": "title already exists"}
+
+    return [results[line_no] for line_no in sorted(results)]
+
+def club_ids_with_books(book_ids, current=True):
+    # Club pages embed their previous books with comments and their current book
+    book_ids = list(book_ids)
+    club_ids = {
+        club_id for (club_id,) in
+        db.session.query(PrevioislyReadBook.club_id).filter(PrevioislyReadBook.book_id.in_(book_ids))
+    }
+    if current:
+        club_ids.update(
+            club_id for (club_id,) in
+            db.session.query(CurrentBook.club_id).filter(CurrentBook.book_id.in_(book_ids))
+        )
+    return club_ids
+
+def club_ids_with_book(book_id, current=True):
+    return club_ids_with_books([book_id], current)
+
+def update_profile(app, username, user_id, changes, session=None):
+    # Applies a PATCH /profile/<username> body to the user and returns the response as (body, status).
+    # Shared by Profile.patch and asgi.py, which runs it on its async session through run_sync
+    session = db.session if session is None else session
+    user = session.get(User, user_id)
+
+    if not user:
+        return {"message": "User not found"}, 404
+
+    verify_profile_pic = None
+
+    if 'profile_pic' in changes:
+        profile_pic_url = changes['profile_pic']
+        verdict = url_verifier.cached(profile_pic_url)
+
+        if verdict is False:
+            return {"errors": ["Invalid profile picture URL"]}, 400
+
+        if verdict:
+            user.profile_pic = profile_pic_url
+            user.pending_profile_pic = None
+            user.profile_pic_status = "valid"
+        else:
+            if url_verifier.saturated():
+                return {"errors": ["Too many pending profile picture checks, try again later"]}, 503
+
+            # Keep the current picture until the new URL has been checked
+            user.pending_profile_pic = profile_pic_url
+            user.profile_pic_status = "pending"
+            verify_profile_pic = profile_pic_url
+
+    for attr in changes:
+        if attr in ('profile_pic', 'pending_profile_pic', 'profile_pic_status'):
+            continue
+        setattr(user, attr, changes[attr])
+
+    touched = touch_user_content(user.id, session)
+
+    session.add(user)
+    session.commit()
+
+    current_user_cache.delete(username)
+    current_user_cache.delete(user.username)
+
+    # Usernames and profile pictures are embedded in club and book pages
+    invalidate_user_content(touched)
+
+    if verify_profile_pic:
+        url_verifier.submit(
+            verify_profile_pic,
+            lambda url, valid: apply_profile_pic_verdict(app, user_id, url, valid),
+        )
+
+        return {
+            "message": "Profile updated successfully, the profile picture is being verified",
+            "profile_pic_status": "pending",
+        }, 202
+
+    return {"message": "Profile updated successfully"}, 200
+
+def touch_user_content(user_id, session=None):
+    # Bumps every book and club page that shows this user's name or profile picture.
+    # Returns their (club ids, book ids) for invalidate_user_content
+    session = db.session if session is None else session
+    book_ids = session.query(BookComment.book_id).filter_by(user_id=user_id)
+    club_ids = (
+        session.query(BookClub.id).filter_by(creator_id=user_id)
+        .union(
+            session.query(ClubMember.club_id).filter_by(member_id=user_id),
+            session.query(Message.club_id).filter_by(sender_id=user_id),
+            session.query(PrevioislyReadBook.club_id).filter(PrevioislyReadBook.book_id.in_(book_ids.statement)),
+        )
+    )
+
+    club_ids = [club_id for (club_id,) in club_ids]
+    book_ids = [book_id for (book_id,) in book_ids.distinct()]
+
+    bump_versions(BookClub, club_ids, session)
+    bump_versions(Book, book_ids, session)
+
+    return club_ids, book_ids
+
+def invalidate_clubs(club_ids):
+    for club_id in club_ids:
+        response_cache.invalidate('club', club_id)
+
+def invalidate_user_content(touched):
+    # Drops the cached pages touch_user_content bumped, after the commit
+    club_ids, book_ids = touched
+
+    invalidate_clubs(club_ids)
+    for book_id in book_ids:
+        response_cache.invalidate('book', book_id)
+
+def load_club_detail(id):
+    # Everything the club page renders apart from its messages (creator, members, books and
+    # comments with their authors) selected as plain columns, in a fixed number of statements
+    # no matter how many members or books the club has. Messages are read through message_window
+    club = db.session.query(
+        BookClub.id,
+        BookClub.name,
+        BookClub.location,
+        BookClub.description,
+        BookClub.member_count,
+        User.id.label('creator_id'),
+        User.username,
+        User.first_name,
+        User.last_name,
+    ).outerjoin(User, User.id == BookClub.creator_id).filter(BookClub.id == id).first()
+
+    if club is None:
+        return None
+
+    summary = (Book.id, Book.title, Book.author, Book.description)
+
+    members = db.session.query(User.id, User.username).join(
+        ClubMember, ClubMember.member_id == User.id
+    ).filter(ClubMember.club_id == id).order_by(ClubMember.id).all()
+
+    current_book = db.session.query(*summary).join(
+        CurrentBook, CurrentBook.book_id == Book.id
+    ).filter(CurrentBook.club_id == id).order_by(CurrentBook.id).first()
+
+    previous_books = db.session.query(*summary).select_from(PrevioislyReadBook).outerjoin(
+        Book, Book.id == PrevioislyReadBook.book_id
+    ).filter(PrevioislyReadBook.club_id == id).order_by(PrevioislyReadBook.id).all()
+
+    comments = {}
+    book_ids = {book.id for book in previous_books if book.id is not None}
+    if book_ids:
+        rows = db.session.query(
+            BookComment.book_id,
+            BookComment.id,
+            BookComment.comment,
+            BookComment.rating,
+            User.username,
+        ).outerjoin(User, User.id == BookComment.user_id).filter(
+            BookComment.book_id.in_(book_ids)
+        ).order_by(BookComment.id)
+
+        for book_id, comment_id, comment, rating, username in rows:
+            comments.setdefault(book_id, []).append({
+                "id": comment_id,
+                "comment": comment,
+                "rating": rating,
+                "username": username
+            })
+
+    def book_data(book):
+        # A previously read book whose row is gone is rendered as None
+        if book is None or book.id is None:
+            return None
+        return {"id": book.id, "title": book.title, "author": book.author, "description": book.description}
+
+    return {
+        "id": club.id,
+        "name": club.name,
+        "location": club.location,
+        "description": club.description,
+        "member_count": club.member_count,
+        "creator": {
+            "id": club.creator_id,
+            "username": club.username,
+            "first_name": club.first_name,
+            "last_name": club.last_name
+        },
+        "members": [{"id": member.id, "username": member.username} for member in members],
+        "current_book": book_data(current_book),
+        "previous_books": [
+            {"book": book_data(book), "comments": comments.get(book.id, [])}
+            for book in previous_books
+        ],
+    }
 
 class BookSchema(ma.SQLAlchemyAutoSchema):
 
@@ -53,6 +831,10 @@ class BookClubSchema(ma.SQLAlchemyAutoSchema):
 bookClub_schema = BookClubSchema()
 bookClubs_schema = BookClubSchema(many=True)
 
+# List endpoints select these columns and dump the rows in the schemas' format without loading models
+book_columns = ColumnSerializer(book_schema, Book)
+bookclub_columns = ColumnSerializer(bookClub_schema, BookClub)
+
 class Index(Resource):
     def get(self):
 
@@ -78,7 +860,7 @@ class Register(Resource):
                 last_name=request.json['last_name'],
                 profile_pic=request.json['profile_pic']
             )
-            new_user.set_password(request.json['password'])  
+            new_user.password = password_executor.hash(request.json['password'])
 
             db.session.add(new_user)
             db.session.commit()
@@ -90,7 +872,12 @@ class Register(Resource):
             response.headers["Content-Type"] = "application/json"
 
             return response
-        
+
+        except ExecutorSaturated as e:
+            db.session.rollback()
+
+            return saturated_response()
+
         except IntegrityError as e:
             db.session.rollback()
 
@@ -118,7 +905,16 @@ class LogIn(Resource):
         try:
             user = User.query.filter_by(username=request.json['username']).first()
 
-            if user and user.check_password(request.json['password']):
+            if user and password_executor.verify(user.password, request.json['password']):
+                if password_executor.needs_rehash(user.password):
+                    # The hash parameters changed since this password was stored, upgrade it
+                    # while the plain password is at hand. A busy pool only postpones this
+                    try:
+                        user.password = password_executor.hash(request.json['password'])
+                        db.session.commit()
+                    except ExecutorSaturated as e:
+                        db.session.rollback()
+
                 # Generating a token for the user
                 access_token = create_access_token(identity=request.json['username'], expires_delta=timedelta(days=30))
 
@@ -140,7 +936,10 @@ class LogIn(Resource):
             response.headers["Content-Type"] = "application/json"
 
             return response
-    
+
+        except ExecutorSaturated as e:
+            return saturated_response()
+
         except Exception as e:
             response = make_response(
                 jsonify({"errors": ["An error occurred"]}),
@@ -160,7 +959,7 @@ class Profile(Resource):
             response.headers["Content-Type"] = "application/json"
             return response
 
-        user = User.query.filter_by(username=username).first()
+        user = get_current_user()
 
         if user:
             response_data = {
@@ -168,7 +967,8 @@ class Profile(Resource):
                 "email": user.email,
                 "first_name": user.first_name,
                 "last_name": user.last_name,
-                "profile_pic": user.profile_pic
+                "profile_pic": user.profile_pic,
+                "profile_pic_status": user.profile_pic_status
             }
 
             response = make_response(
@@ -192,33 +992,11 @@ class Profile(Resource):
             response.headers["Content-Type"] = "application/json"
             return response
 
-        user = User.query.filter_by(username=username).first()
-
-        if not user:
-            response = make_response(jsonify({"message": "User not found"}), 404)
-            response.headers["Content-Type"] = "application/json"
-            return response
-
-        if 'profile_pic' in request.json:
-            profile_pic_url = request.json['profile_pic']
-            if not is_valid_url(profile_pic_url):
-                response = make_response(
-                    jsonify({"errors": ["Invalid profile picture URL"]}),
-                    400
-                )
-                response.headers["Content-Type"] = "application/json"
-                return response
-
-        for attr in request.json:
-            setattr(user, attr, request.json[attr])
-
-        db.session.add(user)
-        db.session.commit()
-
-        response = make_response(
-            jsonify({"message": "Profile updated successfully"}),
-            200,
+        body, status = update_profile(
+            current_app._get_current_object(), username, get_current_user().id, request.json,
         )
+
+        response = make_response(jsonify(body), status)
         response.headers["Content-Type"] = "application/json"
 
         return response
@@ -232,16 +1010,26 @@ class Profile(Resource):
             response.headers["Content-Type"] = "application/json"
             return response
 
-        user = User.query.filter_by(username=username).first()
+        user = db.session.get(User, get_current_user().id)
 
         if not user:
             response = make_response(jsonify({"message": "User not found"}), 404)
             response.headers["Content-Type"] = "application/json"
             return response
 
+        touched = touch_user_content(user.id)
+        club_ids = [club_id for (club_id,) in db.session.query(ClubMember.club_id).filter_by(member_id=user.id)]
+        ClubReadCursor.query.filter_by(member_id=user.id).delete(synchronize_session=False)
+
+        # Deleting the user clears member_id on their memberships, which no longer count
         db.session.delete(user)
+        db.session.flush()
+        refresh_member_counts(club_ids)
         db.session.commit()
 
+        current_user_cache.delete(username)
+        invalidate_user_content(touched)
+
         response = make_response(
             jsonify({"message": "Profile deleted successfully"}),
             200,
@@ -264,6 +1052,8 @@ class BookClubRes(Resource):
             db.session.add(new_club)
             db.session.commit()
 
+            response_cache.invalidate('clubs')
+
             response = make_response(
                 jsonify({ "message": "Book Club created successfully"}),
                 201,
@@ -296,15 +1086,27 @@ class BookClubRes(Resource):
 
     def get(self):
         try:
-            bookclubs = BookClub.query.all()
+            if wants_stream():
+                return stream_items(rows_after_cursor(BookClub, bookclub_columns.columns), bookclub_columns.dump)
+
+            args = (request.args.get('after'), page_limit())
+            etag = page_etag(BookClub, 'clubs')
+            response = not_modified(etag) or cached_response('clubs', args=args, etag=etag)
+            if response:
+                return response
+
+            bookclubs, next_cursor = paginate_by_id(BookClub, bookclub_columns.columns)
 
-            if bookclubs:
+            if bookclubs or request.args.get('after'):
                 response = make_response(
-                    bookClubs_schema.dump(bookclubs),
+                    jsonify({
+                        "items": bookclub_columns.dump_many(bookclubs),
+                        "next": next_cursor,
+                    }),
                     200,
                 )
                 response.headers["Content-Type"] = "application/json"
-                return response
+                return cache_response(response, 'clubs', args=args, etag=etag)
             else:
                 response = make_response(
                     jsonify({"error": "Book Clubs are not currently in database"}),
@@ -312,6 +1114,13 @@ class BookClubRes(Resource):
                 )
                 response.headers["Content-Type"] = "application/json"
                 return response
+        except ValueError as e:
+            response = make_response(
+                jsonify({"errors": ["Invalid cursor"]}),
+                400
+            )
+            response.headers["Content-Type"] = "application/json"
+            return response
         except Exception as e:
             # Handle unexpected server errors
             response = make_response(
@@ -324,85 +1133,23 @@ class BookClubRes(Resource):
 class BookClubByID(Resource):
 
     def get(self, id):
-        bookclub = BookClub.query.filter_by(id=id).first()
-
-        if bookclub:
-
-            # Get creator
-            creator = User.query.filter_by(id=bookclub.creator_id).first()
-
-            creator_data = {
-                "id": creator.id if creator else None,
-                "username": creator.username if creator else None,
-                "first_name": creator.first_name if creator else None,
-                "last_name": creator.last_name if creator else None
-            }
-
-
-            # Get club members
-            members = [member.member for member in bookclub.club_members]
-
-            # Get current book
-            current_book = CurrentBook.query.filter_by(club_id=id).first()
-
-            # Get previous books and their comments
-            previous_books = PrevioislyReadBook.query.filter_by(club_id=id).all()
+        etag = entity_etag(BookClub, 'club', id)
+        response = not_modified(etag) or cached_response('club', id, etag=etag)
+        if response:
+            return response
 
-        previous_books_data = []
+        club_data = load_club_detail(id)
 
-        for prev_book in previous_books:
-            book_comments = BookComment.query.filter_by(book_id=prev_book.book_id).all()
-            comment_data = []
+        if club_data:
 
-            for comment in book_comments:
-                comment_data.append({
-                    "id": comment.id,
-                    "comment": comment.comment,
-                    "rating": comment.rating,
-                    "username": comment.user.username
-                })
-
-            previous_books_data.append({
-                "book": {
-                    "id": prev_book.book.id,
-                    "title": prev_book.book.title,
-                    "author": prev_book.book.author,
-                    "description": prev_book.book.description
-            } if prev_book.book else None,  # Check if prev_book has an associated book
-            "comments": comment_data
-             })
-
-            # Get messages
-            messages = Message.query.filter_by(club_id=id).all()
-
-            message_data = []
-            for message in messages:
-                message_data.append({
-                    "id": message.id,
-                    "sender": message.sender.username,
-                    "message": message.message,
-                    "created_at": message.created_at
-                })
+            # Get the most recent messages, oldest first
+            messages, messages_next = message_window(id, limit=CLUB_MESSAGE_WINDOW)
 
-            response_data = {
-                "id": bookclub.id,
-                "name": bookclub.name,
-                "location": bookclub.location,
-                "description": bookclub.description,
-                "creator": creator_data,
-                "members": [{
-                    "id": member.id,
-                    "username": member.username
-                } for member in members],
-                "current_book": {
-                    "id": current_book.book.id,
-                    "title": current_book.book.title,
-                    "author": current_book.book.author,
-                    "description": current_book.book.description
-                } if current_book else None,
-                "previous_books": previous_books_data,
-                "messages": message_data
-            }
+            response_data = dict(
+                club_data,
+                messages=list(reversed(messages)),
+                messages_next=messages_next,
+            )
 
             response = make_response(
                 jsonify(response_data),
@@ -410,7 +1157,7 @@ class BookClubByID(Resource):
             )
             response.headers["Content-Type"] = "application/json"
 
-            return response
+            return cache_response(response, 'club', id, etag=etag)
 
         else:
             response = make_response(
@@ -428,12 +1175,16 @@ class BookClubByID(Resource):
         if bookclub :
             for attr in request.json:
                 setattr(bookclub, attr, request.json[attr])
+            bookclub.version = BookClub.version + 1
 
             db.session.add(bookclub)
             db.session.commit()
 
+            response_cache.invalidate('club', id)
+            response_cache.invalidate('clubs')
+
             response = make_response(
-                jsonify({{"message": "Book Club updated successfully"}}),
+                jsonify({"message": "Book Club updated successfully"}),
                 200
             )
             response.headers["Content-Type"] = "application/json"
@@ -452,19 +1203,22 @@ class BookClubByID(Resource):
         
     @jwt_required()
     def delete(self, id):
-        current_user_username = get_jwt_identity()  # Retrieve the current user's username from the token
-
-        # Query the User table to get the user object based on the username
-        current_user = User.query.filter_by(username=current_user_username).first()
+        current_user = get_current_user()  # Resolved from the token by load_current_user
 
         if current_user:
             # Check if the book club exists and if the current user is its creator
             bookclub = BookClub.query.filter_by(id=id, creator_id=current_user.id).first()
 
             if bookclub:
+                # Archived messages have nothing else pointing at them
+                MessageArchive.query.filter_by(club_id=id).delete(synchronize_session=False)
+                ClubReadCursor.query.filter_by(club_id=id).delete(synchronize_session=False)
                 db.session.delete(bookclub)
                 db.session.commit()
 
+                response_cache.invalidate('club', id)
+                response_cache.invalidate('clubs')
+
                 response = make_response(
                     jsonify({"message": "Book Club successfully deleted"}),
                     200
@@ -483,20 +1237,504 @@ class BookClubByID(Resource):
         response.headers["Content-Type"] = "application/json"
         return response
 
+class PopularClubs(Resource):
+
+    def get(self):
+        # Clubs with the most members first. Keyset paged on (member_count, id), so a page is a
+        # backwards range scan of ix_bookclubs_member_count_id that never reads club_members
+        try:
+            query = db.session.query(*bookclub_columns.columns)
+
+            after = request.args.get('after')
+            if after:
+                cursor = decode_cursor(after)
+                if not isinstance(cursor.get('member_count'), int) or not isinstance(cursor.get('id'), int):
+                    raise ValueError("Invalid cursor")
+                query = query.filter(
+                    tuple_(BookClub.member_count, BookClub.id) < tuple_(cursor['member_count'], cursor['id'])
+                )
+
+            limit = page_limit()
+            clubs = query.order_by(BookClub.member_count.desc(), BookClub.id.desc()).limit(limit + 1).all()
+        except ValueError as e:
+            response = make_response(
+                jsonify({"errors": ["Invalid cursor"]}),
+                400
+            )
+            response.headers["Content-Type"] = "application/json"
+            return response
+
+        next_cursor = None
+        if len(clubs) > limit:
+            next_cursor = encode_cursor({"member_count": clubs[limit - 1].member_count, "id": clubs[limit - 1].id})
+
+        response = make_response(
+            jsonify({
+                "items": bookclub_columns.dump_many(clubs[:limit]),
+                "next": next_cursor,
+            }),
+            200,
+        )
+        response.headers["Content-Type"] = "application/json"
+
+        return response
+
+class UserClubs(Resource):
+
+    def get(self, id):
+        # The clubs a user belongs to, in club id order. Their ids are a range scan of
+        # ix_club_members_member_id_club_id, then the clubs are read by primary key
+        try:
+            club_ids = db.session.query(ClubMember.club_id).filter(
+                ClubMember.member_id == id,
+                ClubMember.club_id.isnot(None),
+            )
+
+            after = request.args.get('after')
+            if after:
+                club_ids = club_ids.filter(ClubMember.club_id > cursor_id(after))
+
+            limit = page_limit()
+            club_ids = [club_id for (club_id,) in club_ids.order_by(ClubMember.club_id).limit(limit + 1)]
+        except ValueError as e:
+            response = make_response(
+                jsonify({"errors": ["Invalid cursor"]}),
+                400
+            )
+            response.headers["Content-Type"] = "application/json"
+            return response
+
+        next_cursor = encode_cursor({"id": club_ids[limit - 1]}) if len(club_ids) > limit else None
+        club_ids = club_ids[:limit]
+
+        if not club_ids and not after and db.session.query(User.id).filter_by(id=id).first() is None:
+            response = make_response(jsonify({"message": "User not found"}), 404)
+            response.headers["Content-Type"] = "application/json"
+            return response
+
+        clubs = []
+        if club_ids:
+            clubs = db.session.query(*bookclub_columns.columns).filter(BookClub.id.in_(club_ids)).order_by(BookClub.id).all()
+
+        response = make_response(
+            jsonify({
+                "items": bookclub_columns.dump_many(clubs),
+                "next": next_cursor,
+            }),
+            200,
+        )
+        response.headers["Content-Type"] = "application/json"
+
+        return response
+
+class ClubMessages(Resource):
+
+    def get(self, id):
+        try:
+            before = request.args.get('before')
+            before, before_at = message_cursor(before) if before else (None, None)
+
+            if wants_stream():
+                return stream_items(
+                    club_messages_query(id, before=before),
+                    lambda row: row._asdict(),
+                    tail=archived_batches(id, archive_anchor(before, before_at)),
+                )
+
+            messages, next_cursor = message_window(
+                id,
+                before=before,
+                limit=page_limit(),
+                before_at=before_at,
+            )
+        except ValueError as e:
+            response = make_response(
+                jsonify({"errors": ["Invalid cursor"]}),
+                400
+            )
+            response.headers["Content-Type"] = "application/json"
+
+            return response
+
+        response = make_response(
+            jsonify({
+                "items": messages,
+                "next": next_cursor,
+            }),
+            200,
+        )
+        response.headers["Content-Type"] = "application/json"
+
+        return response
+
+class ClubRead(Resource):
+    @jwt_required()
+    def post(self, id):
+        # Moves the current user's read cursor in the club up to message_id, or to the newest
+        # message. Cursors never move back, so a late request from another device is harmless
+        current_user = get_current_user()
+
+        if db.session.query(ClubMember.id).filter_by(club_id=id, member_id=current_user.id).first() is None:
+            response = make_response(
+                jsonify({"errors": ["Not a member of this club"]}),
+                403
+            )
+            response.headers["Content-Type"] = "application/json"
+            return response
+
+        message_id = (request.get_json(silent=True) or {}).get('message_id')
+        if message_id is not None and (not isinstance(message_id, int) or isinstance(message_id, bool)):
+            response = make_response(
+                jsonify({"errors": ["validation errors"]}),
+                400
+            )
+            response.headers["Content-Type"] = "application/json"
+            return response
+
+        message = db.session.query(Message.id, Message.created_at).filter(Message.club_id == id)
+        if message_id is None:
+            message = message.order_by(Message.created_at.desc(), Message.id.desc()).first()
+        else:
+            message = message.filter(Message.id == message_id).first()
+            if message is None:
+                response = make_response(
+                    jsonify({"errors": ["Message not found"]}),
+                    404
+                )
+                response.headers["Content-Type"] = "application/json"
+                return response
+
+        if message is not None and message.created_at is not None:
+            # created_at is copied over by the database so it compares exactly with the messages'
+            stmt = dialect_insert(ClubReadCursor).from_select(
+                ['member_id', 'club_id', 'last_read_id', 'last_read_at'],
+                db.session.query(
+                    literal(current_user.id), literal(id), Message.id, Message.created_at,
+                ).filter(Message.id == message.id).statement,
+            )
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=[ClubReadCursor.member_id, ClubReadCursor.club_id],
+                set_={
+                    "last_read_id": stmt.excluded.last_read_id,
+                    "last_read_at": stmt.excluded.last_read_at,
+                    "updated_at": func.now(),
+                },
+                where=tuple_(ClubReadCursor.last_read_at, ClubReadCursor.last_read_id)
+                < tuple_(stmt.excluded.last_read_at, stmt.excluded.last_read_id),
+            ))
+            db.session.commit()
+
+        last_read_id = db.session.query(ClubReadCursor.last_read_id).filter_by(
+            member_id=current_user.id, club_id=id
+        ).scalar()
+
+        response = make_response(
+            jsonify({
+                "club_id": id,
+                "last_read_id": last_read_id,
+                "unread": unread_label(unread_counts(current_user.id, [id]).get(id, 0)),
+            }),
+            200,
+        )
+        response.headers["Content-Type"] = "application/json"
+
+        return response
+
+class UserUnread(Resource):
+    @jwt_required()
+    def get(self, id):
+        # Unread message counts for every club the user belongs to, only for the user themselves
+        current_user = get_current_user()
+
+        if current_user.id != id:
+            response = make_response(jsonify({"message": "Unauthorized"}), 401)
+            response.headers["Content-Type"] = "application/json"
+            return response
+
+        counts = unread_counts(id)
+
+        response = make_response(
+            jsonify({
+                "items": [{"club_id": club_id, "unread": unread_label(unread)} for club_id, unread in counts.items()],
+                "total": unread_total(counts),
+            }),
+            200,
+        )
+        response.headers["Content-Type"] = "application/json"
+
+        return response
+
+class ClubStream(Resource):
+
+    def get(self, id):
+        # Server-Sent Events feed of new messages. Browsers resend the last id they saw in
+        # Last-Event-ID when they reconnect, so nothing published in between is lost
+        broker = get_broker()
+        last_event_id = request.headers.get('Last-Event-ID', type=int)
+        after = last_event_id if last_event_id is not None else broker.latest(id)
+
+        def events(after):
+            yield SSE_PREAMBLE
+
+            while True:
+                new_events, missed = broker.wait(id, after, SSE_KEEPALIVE_SECONDS)
+                text, after = chat_events_sse(broker, id, after, new_events, missed)
+                yield text
+
+        response = Response(events(after), mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"
+
+        return response
+
+class ClubPoll(Resource):
+
+    def get(self, id):
+        # Long-poll fallback for clients that cannot use /clubs/<id>/stream. Without ?after
+        # it answers immediately with the current position to poll from
+        broker = get_broker()
+        after = request.args.get('after', type=int)
+
+        if after is None:
+            new_events, missed = [], False
+            after = broker.latest(id)
+        else:
+            timeout = request.args.get('timeout', LONG_POLL_MAX_SECONDS, type=int)
+            new_events, missed = broker.wait(id, after, max(0, min(timeout, LONG_POLL_MAX_SECONDS)))
+
+        response = make_response(
+            jsonify(chat_events_poll(broker, id, after, new_events, missed)),
+            200,
+        )
+        response.headers["Content-Type"] = "application/json"
+
+        return response
+
+class Search(Resource):
+
+    def get(self):
+        terms = request.args.get('q', '').strip()
+        kind = request.args.get('type')
+        limit = page_limit()
+        page = max(1, request.args.get('page', 1, type=int))
+        offset = (page - 1) * limit
+
+        if not terms or kind not in (None, 'books', 'clubs') or offset > SEARCH_MAX_OFFSET:
+            response = make_response(
+                jsonify({"errors": ["A search needs ?q=, an optional type of books or clubs and a page within range"]}),
+                400
+            )
+            response.headers["Content-Type"] = "application/json"
+
+            return response
+
+        response_data = {}
+        has_more = False
+
+        for section in (kind,) if kind else ('books', 'clubs'):
+            # One extra row tells whether there is a next page
+            results = search(db.session, section, terms, limit + 1, offset)
+            has_more = has_more or len(results) > limit
+            response_data[section] = results[:limit]
+
+        response_data["next_page"] = page + 1 if has_more and offset + limit <= SEARCH_MAX_OFFSET else None
+
+        response = make_response(
+            jsonify(response_data),
+            200,
+        )
+        response.headers["Content-Type"] = "application/json"
+
+        return response
+
+def collect_component_metrics():
+    # Gauges and counters of the pools and caches the handlers rely on, for /metrics
+    pools = []
+    for bind, engine in db.engines.items():
+        pool = engine.pool
+        if hasattr(pool, 'checkedout'):
+            labels = {"bind": bind or "default"}
+            pools.append((dict(labels, state="checked_out"), pool.checkedout()))
+            pools.append((dict(labels, state="checked_in"), pool.checkedin()))
+            pools.append((dict(labels, state="overflow"), max(0, pool.overflow())))
+            pools.append((dict(labels, state="size"), pool.size()))
+
+    cache = response_cache.stats()
+    passwords = password_executor.stats()
+    broker = get_broker().stats() if hasattr(get_broker(), 'stats') else {}
+
+    return [
+        ("db_pool_connections", "gauge", "Connection pool state per database bind.", pools),
+        ("response_cache_lookups_total", "counter", "Response cache lookups by result.", [
+            ({"result": "hit"}, cache["hits"]),
+            ({"result": "miss"}, cache["misses"]),
+        ]),
+        ("response_cache_entries", "gauge", "Entries held by the response cache.", [({}, cache["entries"] or 0)]),
+        ("current_user_cache_entries", "gauge", "JWT callers held by the user lookup cache.", [({}, len(current_user_cache))]),
+        ("password_executor_tasks", "gauge", "Password hashing tasks running or waiting.", [
+            ({"state": "active"}, passwords["active"]),
+            ({"state": "queued"}, passwords["queued"]),
+        ]),
+        ("password_executor_tasks_total", "counter", "Password hashing tasks finished or turned away.", [
+            ({"result": "completed"}, passwords["completed"]),
+            ({"result": "rejected"}, passwords["rejected"]),
+        ]),
+        ("url_verifier_pending", "gauge", "Profile picture URLs waiting to be checked.", [({}, url_verifier.pending())]),
+        ("replica_routed_requests_total", "counter", "Requests by the database their reads went to.", [
+            ({"target": target}, count) for target, count in replica_router.routed.items()
+        ]),
+        ("broker_listeners", "gauge", "Stream and poll listeners waiting for club messages.", [({}, broker.get("waiting", 0))]),
+        ("broker_published_total", "counter", "Club messages published to listeners.", [({}, broker.get("published", 0))]),
+    ]
+
+request_metrics.add_collector(collect_component_metrics)
+
+class Metrics(Resource):
+
+    def get(self):
+        return Response(request_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class PasswordStats(Resource):
+
+    def get(self):
+        response = make_response(
+            jsonify(password_executor.stats()),
+            200,
+        )
+        response.headers["Content-Type"] = "application/json"
+
+        return response
+
+class CacheStats(Resource):
+
+    def get(self):
+        response = make_response(
+            jsonify(response_cache.stats()),
+            200,
+        )
+        response.headers["Content-Type"] = "application/json"
+
+        return response
+
+def batch_item_error(message, status=400):
+    return {"status": status, "headers": {}, "body": {"errors": [message]}}
+
+def run_batch_item(item, headers):
+    # Dispatches one sub-request of POST /batch through the app's full request handling (hooks,
+    # JWT checks, error handlers). Its request context reuses the batch's app context, so every
+    # sub-request works in the same DB session
+    if not isinstance(item, dict) or not isinstance(item.get('path'), str) or not item['path'].startswith('/'):
+        return batch_item_error("Each request needs a path starting with /")
+
+    method = str(item.get('method', 'GET')).upper()
+    if method not in BATCH_METHODS:
+        return batch_item_error(f"{method} requests cannot be batched")
+
+    if not isinstance(item.get('headers', {}), dict):
+        return batch_item_error("Request headers must be an object")
+
+    app = current_app._get_current_object()
+    builder = EnvironBuilder(
+        path=item['path'],
+        method=method,
+        headers=dict(headers, **item.get('headers', {})),
+        json=item.get('body'),
+        environ_base={"REMOTE_ADDR": request.remote_addr},
+    )
+
+    with app.request_context(builder.get_environ()):
+        if request.endpoint in BATCH_EXCLUDED_ENDPOINTS or wants_stream():
+            return batch_item_error(f"{item['path']} cannot be batched")
+
+        try:
+            response = app.full_dispatch_request()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.exception("Batched request %s %s failed", method, item['path'])
+            return batch_item_error("Internal server error", 500)
+
+        body = response.get_json(silent=True)
+        if body is None and response.get_data():
+            body = response.get_data(as_text=True)
+
+        return {
+            "status": response.status_code,
+            "headers": {name: response.headers[name] for name in BATCH_RESPONSE_HEADERS if name in response.headers},
+            "body": body,
+        }
+
+class Batch(Resource):
+
+    def post(self):
+        # Runs {"requests": [{"method", "path", "headers", "body"}, ...]} in order and answers with
+        # {"responses": [{"status", "headers", "body"}, ...]}. Sub-requests are sent with the batch's
+        # own Authorization header unless they set one
+        items = request.json.get('requests') if isinstance(request.json, dict) else None
+
+        if not isinstance(items, list):
+            response = make_response(
+                jsonify({"errors": ["Expected a list of requests"]}),
+                400
+            )
+            response.headers["Content-Type"] = "application/json"
+            return response
+
+        if len(items) > BATCH_MAX_REQUESTS:
+            response = make_response(
+                jsonify({"errors": [f"A batch holds at most {BATCH_MAX_REQUESTS} requests"]}),
+                413
+            )
+            response.headers["Content-Type"] = "application/json"
+            return response
+
+        headers = {}
+        if 'Authorization' in request.headers:
+            headers['Authorization'] = request.headers['Authorization']
+
+        responses = [run_batch_item(item, headers) for item in items]
+
+        response = make_response(
+            jsonify({"responses": responses}),
+            200,
+        )
+        response.headers["Content-Type"] = "application/json"
+
+        return response
+
 class JoinClub(Resource):
     @jwt_required()
     def post(self):
         try: 
-            current_user = get_jwt_identity()
+            club_id = request.json['club_id']
 
-            new_member = ClubMember(
-                club_id = request.json['club_id'],
-                member_id = request.json['user_id'],
-            )
+            # Joining twice (double taps, retried requests) leaves the existing membership alone
+            joined = db.session.execute(
+                dialect_insert(ClubMember).values(
+                    club_id = club_id,
+                    member_id = request.json['user_id'],
+                ).on_conflict_do_nothing(index_elements=[ClubMember.club_id, ClubMember.member_id])
+            ).rowcount
+
+            if not joined:
+                db.session.rollback()
+
+                response = make_response(
+                    jsonify({ "message": "Already a member"}),
+                    200,
+                )
+                response.headers["Content-Type"] = "application/json"
+
+                return response
 
-            db.session.add(new_member)
+            # Counted in the same transaction, the SET expression reads the current value so concurrent joins add up
+            BookClub.query.filter_by(id=club_id).update(
+                {BookClub.member_count: BookClub.member_count + 1, BookClub.version: BookClub.version + 1},
+                synchronize_session=False,
+            )
             db.session.commit()
 
+            response_cache.invalidate('club', club_id)
+
             response = make_response(
                 jsonify({ "message": "Member joined successfully"}),
                 201,
@@ -527,19 +1765,150 @@ class JoinClub(Resource):
 
             return response
 
+class ClubMembers(Resource):
+    # Bulk membership changes for club imports and moderation, only for the club's creator.
+    # Each request is one INSERT or DELETE statement plus one member_count update
+
+    def bulk_request(self, id):
+        # (member ids, None) or (None, error response)
+        bookclub = db.session.query(BookClub.id).filter_by(id=id, creator_id=get_current_user().id).first()
+
+        if not bookclub:
+            response = make_response(
+                jsonify({"error": "Book Club not found or you are not the creator"}),
+                404
+            )
+            response.headers["Content-Type"] = "application/json"
+            return None, response
+
+        member_ids = request.json.get('member_ids') if isinstance(request.json, dict) else None
+
+        if not isinstance(member_ids, list) or not all(
+            isinstance(member_id, int) and not isinstance(member_id, bool) for member_id in member_ids
+        ):
+            response = make_response(
+                jsonify({"errors": ["Expected a list of member ids"]}),
+                400
+            )
+            response.headers["Content-Type"] = "application/json"
+            return None, response
+
+        member_ids = list(dict.fromkeys(member_ids))
+        if len(member_ids) > MEMBERS_BULK_MAX:
+            response = make_response(
+                jsonify({"errors": [f"At most {MEMBERS_BULK_MAX} members can be changed at once"]}),
+                413
+            )
+            response.headers["Content-Type"] = "application/json"
+            return None, response
+
+        return member_ids, None
+
+    def update_member_count(self, id, change):
+        BookClub.query.filter_by(id=id).update(
+            {BookClub.member_count: BookClub.member_count + change, BookClub.version: BookClub.version + 1},
+            synchronize_session=False,
+        )
+
+    @jwt_required()
+    def post(self, id):
+        # Adds {"member_ids": [...]}. Unknown users and existing members are skipped
+        member_ids, error = self.bulk_request(id)
+        if error:
+            return error
+
+        added = 0
+        if member_ids:
+            added = db.session.execute(
+                dialect_insert(ClubMember).from_select(
+                    ['club_id', 'member_id'],
+                    db.session.query(literal(id), User.id).filter(User.id.in_(member_ids)).statement,
+                ).on_conflict_do_nothing(index_elements=[ClubMember.club_id, ClubMember.member_id])
+            ).rowcount
+
+        if added:
+            self.update_member_count(id, added)
+        db.session.commit()
+
+        if added:
+            response_cache.invalidate('club', id)
+
+        response = make_response(
+            jsonify({"added": added, "skipped": len(member_ids) - added}),
+            200,
+        )
+        response.headers["Content-Type"] = "application/json"
+
+        return response
+
+    @jwt_required()
+    def delete(self, id):
+        # Removes {"member_ids": [...]}, ids that are not members are skipped
+        member_ids, error = self.bulk_request(id)
+        if error:
+            return error
+
+        removed = 0
+        if member_ids:
+            removed = ClubMember.query.filter(
+                ClubMember.club_id == id,
+                ClubMember.member_id.in_(member_ids),
+            ).delete(synchronize_session=False)
+
+            ClubReadCursor.query.filter(
+                ClubReadCursor.club_id == id,
+                ClubReadCursor.member_id.in_(member_ids),
+            ).delete(synchronize_session=False)
+
+        if removed:
+            self.update_member_count(id, -removed)
+        db.session.commit()
+
+        if removed:
+            response_cache.invalidate('club', id)
+
+        response = make_response(
+            jsonify({"removed": removed, "skipped": len(member_ids) - removed}),
+            200,
+        )
+        response.headers["Content-Type"] = "application/json"
+
+        return response
+
 class Books(Resource):
 
     def get(self):
-        books = Book.query.all()
+        try:
+            if wants_stream():
+                return stream_items(rows_after_cursor(Book, book_columns.columns), book_columns.dump)
+
+            args = (request.args.get('after'), page_limit())
+            etag = page_etag(Book, 'books')
+            response = not_modified(etag) or cached_response('books', args=args, etag=etag)
+            if response:
+                return response
 
-        if books :
+            books, next_cursor = paginate_by_id(Book, book_columns.columns)
+        except ValueError as e:
             response = make_response(
-                books_schema.dump(books),
-                200,
+                jsonify({"errors": ["Invalid cursor"]}),
+                400
             )
             response.headers["Content-Type"] = "application/json"
 
             return response
+
+        if books or request.args.get('after'):
+            response = make_response(
+                jsonify({
+                    "items": book_columns.dump_many(books),
+                    "next": next_cursor,
+                }),
+                200,
+            )
+            response.headers["Content-Type"] = "application/json"
+
+            return cache_response(response, 'books', args=args, etag=etag)
         
         else :
             response = make_response(
@@ -562,6 +1931,8 @@ class Books(Resource):
             db.session.add(new_book)
             db.session.commit()
 
+            response_cache.invalidate('books')
+
             response = make_response(
                 book_schema.dump(new_book),
                 201,
@@ -592,13 +1963,103 @@ class Books(Resource):
 
             return response
 
+class TopBooks(Resource):
+
+    def get(self):
+        # Walks ix_books_rating_avg_rating_count backwards and stops after `limit` rows
+        min_reviews = max(1, request.args.get('min_reviews', 1, type=int))
+
+        books = db.session.query(*book_columns.columns).filter(
+            Book.rating_avg.isnot(None),
+            Book.rating_count >= min_reviews,
+        ).order_by(
+            Book.rating_avg.desc(),
+            Book.rating_count.desc(),
+            Book.id.desc(),
+        ).limit(page_limit()).all()
+
+        response = make_response(
+            jsonify({"items": book_columns.dump_many(books)}),
+            200,
+        )
+        response.headers["Content-Type"] = "application/json"
+
+        return response
+
+class BooksBulk(Resource):
+    @jwt_required()
+    def post(self):
+        # Streams an NDJSON catalog ({"title", "author", "description"} per line) and answers
+        # with one NDJSON result per line as each batch is committed, then a summary line.
+        # ?on_duplicate=skip (default) leaves existing titles alone, update overwrites them
+        on_duplicate = request.args.get('on_duplicate', 'skip')
+
+        if on_duplicate not in ('skip', 'update'):
+            response = make_response(
+                jsonify({"errors": ["on_duplicate must be skip or update"]}),
+                400
+            )
+            response.headers["Content-Type"] = "application/json"
+
+            return response
+
+        # request.stream hands out lines a byte at a time, buffer it
+        stream = io.BufferedReader(request.stream, 64 * 1024)
+
+        def results():
+            summary = {"created": 0, "updated": 0, "skipped": 0, "error": 0}
+            batch = []
+
+            for line_no, line in enumerate(stream, 1):
+                if not line.strip():
+                    continue
+
+                batch.append((line_no, line))
+                if len(batch) < BULK_BATCH_SIZE:
+                    continue
+
+                for result in import_book_batch(batch, on_duplicate):
+                    summary[result["status"]] += 1
+                    yield json.dumps(result) + "\n"
+                batch = []
+
+            if batch:
+                for result in import_book_batch(batch, on_duplicate):
+                    summary[result["status"]] += 1
+                    yield json.dumps(result) + "\n"
+
+            yield json.dumps({"summary": summary}) + "\n"
+
+        return Response(stream_with_context(results()), mimetype="application/x-ndjson")
+
 class BooksByID(Resource):
 
     def get(self, id):
-        book = Book.query.filter_by(id=id).first()
+        etag = entity_etag(Book, 'book', id)
+        response = not_modified(etag) or cached_response('book', id, etag=etag)
+        if response:
+            return response
+
+        histogram = Book.rating_columns()
+        book = db.session.query(
+            Book.id,
+            Book.title,
+            Book.author,
+            Book.description,
+            Book.rating_avg,
+            Book.rating_count,
+            *histogram.values(),
+        ).filter(Book.id == id).first()
 
         if book :
-            book_comments = BookComment.query.filter_by(book_id=id).all()
+            # Comments with their authors in one statement
+            book_comments = db.session.query(
+                BookComment.id,
+                BookComment.comment,
+                BookComment.rating,
+                User.username,
+                User.profile_pic,
+            ).outerjoin(User, User.id == BookComment.user_id).filter(BookComment.book_id == id).order_by(BookComment.id)
             comment_data = []
 
             for comment in book_comments:
@@ -606,8 +2067,8 @@ class BooksByID(Resource):
                         "id": comment.id,
                         "comment": comment.comment,
                         "rating": comment.rating,
-                        "username":comment.user.username,
-                        "user_profile_pic":comment.user.profile_pic,
+                        "username":comment.username,
+                        "user_profile_pic":comment.profile_pic,
                     })
 
             response_data = {
@@ -615,6 +2076,11 @@ class BooksByID(Resource):
                 "title": book.title,
                 "author": book.author,
                 "description": book.description,
+                "rating": {
+                    "average": book.rating_avg,
+                    "count": book.rating_count,
+                    "histogram": {str(rating): getattr(book, column.key) for rating, column in histogram.items()},
+                },
                 "comments": comment_data,
             }
 
@@ -624,7 +2090,7 @@ class BooksByID(Resource):
             )
             response.headers["Content-Type"] = "application/json"
 
-            return response
+            return cache_response(response, 'book', id, etag=etag)
         
         else :
             response = make_response(
@@ -642,10 +2108,18 @@ class BooksByID(Resource):
         if book :
             for attr in request.json:
                 setattr(book, attr, request.json[attr])
+            book.version = Book.version + 1
+
+            club_ids = club_ids_with_book(id)
+            bump_versions(BookClub, club_ids)
 
             db.session.add(book)
             db.session.commit()
 
+            response_cache.invalidate('book', id)
+            response_cache.invalidate('books')
+            invalidate_clubs(club_ids)
+
             response = make_response(
                 book_schema.dump(book),
                 200
@@ -669,9 +2143,17 @@ class BooksByID(Resource):
         book = Book.query.filter_by(id=id).first()
 
         if book :
+            club_ids = club_ids_with_book(id)
+            bump_versions(BookClub, club_ids)
+
             db.session.delete(book)
             db.session.commit()
 
+            invalidate_clubs(club_ids)
+
+            response_cache.invalidate('book', id)
+            response_cache.invalidate('books')
+
             response = make_response(
                 jsonify({"message": "Book successfully deleted"}),
                 200
@@ -698,8 +2180,11 @@ class AddCurrentBook(Resource):
             )
 
             db.session.add(new_current_book)
+            bump_versions(BookClub, [new_current_book.club_id])
             db.session.commit()
 
+            response_cache.invalidate('club', new_current_book.club_id)
+
             response = make_response(
                 jsonify({ "message": "Current created successfully"}),
                 201,
@@ -726,8 +2211,11 @@ class DelCurrentBook(Resource):
 
         if currentBook :
             db.session.delete(currentBook)        
+            bump_versions(BookClub, [id])
             db.session.commit()
 
+            response_cache.invalidate('club', id)
+
             response = make_response(
                 jsonify({"message": "Current Book successfully deleted"}),
                 200
@@ -754,8 +2242,11 @@ class AddPreviousBook(Resource):
             )
 
             db.session.add(new_previous_book)
+            bump_versions(BookClub, [new_previous_book.club_id])
             db.session.commit()
 
+            response_cache.invalidate('club', new_previous_book.club_id)
+
             response = make_response(
                 jsonify({ "message": "Previously  Read Book created successfully"}),
                 201,
@@ -782,8 +2273,11 @@ class DelPreviousBook(Resource):
 
         if previousBook :
             db.session.delete(previousBook)        
+            bump_versions(BookClub, [id])
             db.session.commit()
 
+            response_cache.invalidate('club', id)
+
             response = make_response(
                 jsonify({"message": "Previous Book successfully deleted"}),
                 200
@@ -812,9 +2306,16 @@ class AddBookComment(Resource):
                 rating=request.json['rating'],
             )
 
+            club_ids = club_ids_with_book(new_comment.book_id, current=False)
+
             db.session.add(new_comment)
+            add_book_rating(new_comment.book_id, new_comment.rating)
+            bump_versions(BookClub, club_ids)
             db.session.commit()
 
+            response_cache.invalidate('book', new_comment.book_id)
+            invalidate_clubs(club_ids)
+
             response = make_response(
                 jsonify({"message": "Comment created successfully"}),
                 201,
@@ -846,8 +2347,13 @@ class AddMessage(Resource):
             )
 
             db.session.add(new_message)
+            bump_versions(BookClub, [new_message.club_id])
             db.session.commit()
 
+            response_cache.invalidate('club', new_message.club_id)
+
+            publish_message(new_message)
+
             response = make_response(
                 jsonify({"message": "Message created successfully"}),
                 201,
@@ -872,17 +2378,37 @@ api.add_resource(Index, '/')
 api.add_resource(Register, '/register')
 api.add_resource(LogIn, '/login')
 api.add_resource(Profile, '/profile/<string:username>')
+api.add_resource(UserClubs, '/users/<int:id>/clubs')
+api.add_resource(UserUnread, '/users/<int:id>/unread')
 api.add_resource(BookClubRes, '/clubs')
 api.add_resource(BookClubByID, '/clubs/<int:id>')
+api.add_resource(PopularClubs, '/clubs/popular')
+api.add_resource(ClubMessages, '/clubs/<int:id>/messages')
+api.add_resource(ClubRead, '/clubs/<int:id>/read')
+api.add_resource(ClubStream, '/clubs/<int:id>/stream')
+api.add_resource(ClubPoll, '/clubs/<int:id>/poll')
 api.add_resource(JoinClub, '/joinclub')
+api.add_resource(ClubMembers, '/clubs/<int:id>/members')
 api.add_resource(Books, '/books')
 api.add_resource(BooksByID, '/books/<int:id>')
+api.add_resource(TopBooks, '/books/top')
+api.add_resource(BooksBulk, '/books/bulk')
 api.add_resource(AddCurrentBook, '/currentbook')
 api.add_resource(DelCurrentBook, '/currentbook/<int:id>')  # The id is the club ID
 api.add_resource(AddPreviousBook, '/previousbooks')
 api.add_resource(DelPreviousBook, '/previousbooks/<int:id>')  # The id is the club ID
 api.add_resource(AddBookComment, '/bookcomments')
 api.add_resource(AddMessage, '/messages')
+api.add_resource(Search, '/search')
+api.add_resource(CacheStats, '/cache/stats')
+api.add_resource(PasswordStats, '/passwords/stats')
+api.add_resource(Metrics, '/metrics')
+api.add_resource(Batch, '/batch')
+
+app.cli.add_command(repair_ratings_command)
+app.cli.add_command(repair_member_counts_command)
+app.cli.add_command(index_audit_command)
+app.cli.add_command(archive_messages_command)
 
 
 
@@ -904,28 +2430,54 @@ def create_app():
     app = Flask(__name__)
 
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URI')
+    app.config['SQLALCHEMY_BINDS'] = replica_binds(os.environ.get('DATABASE_REPLICA_URIS'))
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['PROPAGATE_EXCEPTIONS'] = True
+    app.json = FastJSONProvider(app)
     app.config['JWT_SECRET_KEY'] = '$2a$10$Xs1h0711a6I8n4c9179t0u.h773sj7/Xc2.0737j5r6v996349/Hm0j6z3yM'
     CORS(app)
     CORS(app, resources={r"/*": {"origins": "https://magical-dolphin-be64a8.netlify.app/"}})
     api = Api(app)
     db.init_app(app)
+    jwt.init_app(app)
+    request_metrics.init_app(app)
+    replica_router.init_app(app)
         
     api.add_resource(Index, '/')
     api.add_resource(Register, '/register')
     api.add_resource(LogIn, '/login')
     api.add_resource(Profile, '/profile/<string:username>')
+    api.add_resource(UserClubs, '/users/<int:id>/clubs')
+    api.add_resource(UserUnread, '/users/<int:id>/unread')
     api.add_resource(BookClubRes, '/clubs')
     api.add_resource(BookClubByID, '/clubs/<int:id>')
+    api.add_resource(PopularClubs, '/clubs/popular')
+    api.add_resource(ClubMessages, '/clubs/<int:id>/messages')
+    api.add_resource(ClubRead, '/clubs/<int:id>/read')
+    api.add_resource(ClubStream, '/clubs/<int:id>/stream')
+    api.add_resource(ClubPoll, '/clubs/<int:id>/poll')
     api.add_resource(JoinClub, '/joinclub')
+    api.add_resource(ClubMembers, '/clubs/<int:id>/members')
     api.add_resource(Books, '/books')
     api.add_resource(BooksByID, '/books/<int:id>')
+    api.add_resource(TopBooks, '/books/top')
+    api.add_resource(BooksBulk, '/books/bulk')
     api.add_resource(AddCurrentBook, '/currentbook')
     api.add_resource(DelCurrentBook, '/currentbook/<int:id>')
     api.add_resource(AddPreviousBook, '/previousbooks')
     api.add_resource(DelPreviousBook, '/previousbooks/<int:id>')
     api.add_resource(AddBookComment, '/bookcomments')
     api.add_resource(AddMessage, '/messages')
+    api.add_resource(Search, '/search')
+    api.add_resource(CacheStats, '/cache/stats')
+    api.add_resource(PasswordStats, '/passwords/stats')
+    api.add_resource(Metrics, '/metrics')
+    api.add_resource(Batch, '/batch')
+
+    app.cli.add_command(repair_ratings_command)
+    app.cli.add_command(repair_member_counts_command)
+    app.cli.add_command(index_audit_command)
+    app.cli.add_command(archive_messages_command)
 
 
     @app.errorhandler(NotFound)
@@ -0,0 +1,210 @@
+import json
+import os
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import tuple_
+
+from models import db, BookClub, Message, MessageArchive, User
+from serialization import dumps, orjson
+
+# Cold storage for chat history.
+#
+# `flask archive-messages` moves messages older than the retention horizon out of the
+# messages table into messages_archive, a club's oldest messages first, in chunks of at
+# most ARCHIVE_CHUNK_SIZE rows stored as zlib-compressed JSON. Every chunk is its own short
+# transaction (insert the chunk, delete its rows), so chat inserts are never blocked for
+# long. Because each club is archived oldest first, all of a club's archived messages are
+# older than all of its hot ones: reads only fall back to the archive once a page runs
+# past the end of the messages table, see message_window.
+
+ARCHIVE_CHUNK_SIZE = 500
+
+# Compressed chunks are a few KiB each. Decompressing costs far less than the buffer cache
+# the same rows take up in the messages table and its indexes
+COMPRESSION_LEVEL = 6
+
+
+def pack_messages(rows):
+    # (id, sender_id, message, created_at, updated_at) rows, oldest first, as a compressed chunk
+    return zlib.compress(dumps([
+        [
+            row.id,
+            row.sender_id,
+            row.message,
+            row.created_at.isoformat(),
+            row.updated_at.isoformat() if row.updated_at else None,
+        ]
+        for row in rows
+    ]), COMPRESSION_LEVEL)
+
+
+def unpack_messages(data):
+    data = zlib.decompress(data)
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def archive_club_batch(club_id, cutoff, batch_size=ARCHIVE_CHUNK_SIZE):
+    # Moves up to batch_size of the club's oldest messages sent before `cutoff` into one chunk and
+    # commits. The rows are a range scan of ix_messages_club_id_created_at_id_sender_id. Returns
+    # how many moved
+    rows = db.session.query(
+        Message.id,
+        Message.sender_id,
+        Message.message,
+        Message.created_at,
+        Message.updated_at,
+    ).filter(
+        Message.club_id == club_id,
+        Message.created_at < cutoff,
+    ).order_by(Message.created_at, Message.id).limit(batch_size).all()
+
+    if not rows:
+        db.session.rollback()
+        return 0
+
+    db.session.add(MessageArchive(
+        club_id=club_id,
+        first_id=rows[0].id,
+        first_created_at=rows[0].created_at,
+        last_id=rows[-1].id,
+        last_created_at=rows[-1].created_at,
+        message_count=len(rows),
+        data=pack_messages(rows),
+    ))
+    Message.query.filter(Message.id.in_([row.id for row in rows])).delete(synchronize_session=False)
+    db.session.commit()
+
+    return len(rows)
+
+
+def archive_messages(cutoff, batch_size=ARCHIVE_CHUNK_SIZE, pause=0.0, max_batches=None):
+    # Archives every club's messages sent before `cutoff`, club by club. Returns (messages, chunks)
+    moved = chunks = 0
+    last_club_id = 0
+
+    while True:
+        club_ids = [club_id for (club_id,) in db.session.query(BookClub.id).filter(
+            BookClub.id > last_club_id
+        ).order_by(BookClub.id).limit(100)]
+        db.session.rollback()  # Do not hold a read transaction open between batches
+
+        if not club_ids:
+            return moved, chunks
+
+        for club_id in club_ids:
+            while True:
+                count = archive_club_batch(club_id, cutoff, batch_size)
+                if not count:
+                    break
+
+                moved += count
+                chunks += 1
+                if max_batches and chunks >= max_batches:
+                    return moved, chunks
+                if pause:
+                    time.sleep(pause)
+
+            last_club_id = club_id
+
+
+def archive_anchor(before, before_at=None, session=None):
+    # Where a newest-first read of the archive starts for a page older than message `before`,
+    # None (the newest archived message) for a first page. Cursors carry the created_at of their
+    # message, older ones only have its id. Raises ValueError when that id is no longer in the
+    # messages table: the message has been archived or deleted and its page cannot be placed
+    if before is None:
+        return None
+
+    if before_at is None:
+        before_at = (db.session if session is None else session).query(Message.created_at).filter(
+            Message.id == before
+        ).scalar()
+
+        if before_at is None:
+            raise ValueError("Invalid cursor")
+
+    return (before_at, before)
+
+
+def archive_chunk_ids(club_id, anchor=None, limit=None, session=None):
+    # Ids of the club's chunks that hold messages older than `anchor`, newest first. Chunks of one
+    # club never overlap, so only the chunk the anchor falls in can hold newer messages too
+    query = (db.session if session is None else session).query(MessageArchive.id).filter(
+        MessageArchive.club_id == club_id
+    )
+
+    if anchor is not None:
+        query = query.filter(tuple_(MessageArchive.first_created_at, MessageArchive.first_id) < tuple_(*anchor))
+
+    query = query.order_by(MessageArchive.last_created_at.desc(), MessageArchive.last_id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+
+    return [chunk_id for (chunk_id,) in query]
+
+
+def load_archive_chunk(chunk_id, anchor=None, session=None):
+    # A chunk's messages older than `anchor`, newest first, shaped like message_data
+    session = db.session if session is None else session
+    rows = unpack_messages(session.query(MessageArchive.data).filter(MessageArchive.id == chunk_id).scalar())
+
+    sender_ids = {row[1] for row in rows if row[1] is not None}
+    senders = dict(session.query(User.id, User.username).filter(User.id.in_(sender_ids))) if sender_ids else {}
+
+    messages = []
+    for id, sender_id, message, created_at, updated_at in reversed(rows):
+        created_at = datetime.fromisoformat(created_at)
+        if anchor is not None and (created_at, id) >= anchor:
+            continue
+
+        messages.append({
+            "id": id,
+            "sender": senders.get(sender_id),
+            "message": message,
+            "created_at": created_at,
+        })
+
+    return messages
+
+
+def archived_messages(club_id, anchor=None, limit=20, session=None):
+    # Up to `limit` archived messages older than `anchor`, newest first. Every chunk holds at least
+    # one message, so limit + 1 chunks (the first may be partly newer than the anchor) are enough
+    messages = []
+
+    for chunk_id in archive_chunk_ids(club_id, anchor, limit + 1, session):
+        messages += load_archive_chunk(chunk_id, anchor, session)
+        if len(messages) >= limit:
+            break
+
+    return messages[:limit]
+
+
+def archived_batches(club_id, anchor=None, session=None):
+    # Every archived message older than `anchor`, one chunk at a time, for streamed responses
+    for chunk_id in archive_chunk_ids(club_id, anchor, session=session):
+        yield load_archive_chunk(chunk_id, anchor, session)
+
+
+@click.command('archive-messages')
+@click.option('--older-than-days', type=float, default=lambda: float(os.environ.get('MESSAGE_RETENTION_DAYS', 365)),
+              help='Retention horizon, MESSAGE_RETENTION_DAYS or 365 by default.')
+@click.option('--batch-size', type=int, default=ARCHIVE_CHUNK_SIZE, show_default=True,
+              help='Messages moved per chunk and transaction.')
+@click.option('--pause', type=float, default=0.0, show_default=True, help='Seconds to wait between batches.')
+@click.option('--max-batches', type=int, default=None, help='Stop after this many chunks.')
+@with_appcontext
+def archive_messages_command(older_than_days, batch_size, pause, max_batches):
+    """Move messages older than the retention horizon into messages_archive."""
+    # created_at defaults to the database's CURRENT_TIMESTAMP, which is UTC
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=older_than_days)
+    started = time.perf_counter()
+
+    moved, chunks = archive_messages(cutoff, batch_size=batch_size, pause=pause, max_batches=max_batches)
+
+    click.echo(f"Archived {moved} messages sent before {cutoff:%Y-%m-%d %H:%M} in {chunks} chunks "
+               f"({time.perf_counter() - started:.1f}s)")
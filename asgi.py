@@ -0,0 +1,322 @@
+"""Async serving mode.
+
+The chat endpoints and profile edits run as Starlette handlers on an event loop.
+The live feeds (/clubs/<id>/stream and /clubs/<id>/poll) wait on the broker with
+wait_async, so an open stream holds neither a thread nor a database connection and
+a worker keeps thousands of them open. Database work goes through an async driver
+(aiosqlite or asyncpg) with its own connection pool. Every other route is the
+regular Flask app from create_app(), mounted underneath through a2wsgi, whose
+ASGI_WSGI_THREADS threads then only ever serve short requests.
+
+    DATABASE_URI=postgresql://... uvicorn asgi:app --workers 4
+
+The handlers share their logic with the Flask resources. Tokens are checked by
+flask_jwt_extended in a request context of the Flask app, so its errors and the
+user lookup are the same. The ORM helpers from app.py (update_profile,
+message_window, ...) run on the async connection through AsyncSession.run_sync.
+Reads are not sent to the replicas in DATABASE_REPLICA_URIS, only the Flask routes
+do that, but writes here make their caller sticky to the primary there as well.
+Every handler apart from the endless /stream is recorded in /metrics under the
+route of its Flask resource. For ?stream=1 message lists that covers the time to
+the first byte and not the statements run while the body is sent.
+"""
+import functools
+import logging
+import os
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from flask_jwt_extended import get_current_user, get_jwt_identity, verify_jwt_in_request
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+from app import (
+    LONG_POLL_MAX_SECONDS, PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX, SSE_KEEPALIVE_SECONDS, SSE_PREAMBLE, STREAM_BATCH_SIZE,
+    bump_versions, chat_events_poll, chat_events_sse, club_messages_query, create_app, message_cursor, message_data,
+    message_window, replica_router, request_metrics, response_cache, update_profile,
+)
+from archive import archive_anchor, archive_chunk_ids, load_archive_chunk
+from broker import get_broker
+from models import db, BookClub, Message
+from serialization import dumps
+
+logger = logging.getLogger("story_circle.asgi")
+
+# Async dialects for the databases the app runs on
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+flask_app = create_app()
+
+
+def async_database_url():
+    # DATABASE_URI as Flask-SQLAlchemy resolved it (relative SQLite paths point into instance/), with an async driver
+    with flask_app.app_context():
+        url = db.engine.url
+
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise RuntimeError(f"No async driver configured for {url.get_backend_name()} databases")
+
+    return url.set(drivername=driver)
+
+
+# aiosqlite would get a NullPool, a connection (and thread) per session
+engine = create_async_engine(
+    async_database_url(),
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=int(os.environ.get('ASYNC_POOL_SIZE', 20)),
+    max_overflow=int(os.environ.get('ASYNC_POOL_OVERFLOW', 10)),
+    pool_pre_ping=True,
+)
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+with flask_app.app_context():
+    read_replicas = replica_router.replicas()
+
+
+def json_response(body, status_code=200):
+    # The same compact JSON body jsonify() writes
+    return Response(dumps(body) + b"\n", status_code=status_code, media_type="application/json")
+
+
+def measured(route):
+    # Records the handler in /metrics as a request to the Flask `route` it stands in for
+    def decorate(handler):
+        @functools.wraps(handler)
+        async def measured_handler(request):
+            with request_metrics.measure(request.method, route) as state:
+                response = await handler(request)
+                state["status"] = response.status_code
+            return response
+        return measured_handler
+    return decorate
+
+
+def remember_write(identity):
+    # Read-your-writes for the Flask routes, see ReplicaRouter
+    if read_replicas:
+        replica_router.stick(identity)
+
+
+def query_int(value):
+    # request.args.get(..., type=int): None when missing or not a number
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def page_limit(request):
+    limit = query_int(request.query_params.get('limit'))
+    return max(1, min(PAGE_SIZE_DEFAULT if limit is None else limit, PAGE_SIZE_MAX))
+
+
+def verify_token(authorization):
+    # jwt_required() for the async handlers, on a worker thread since loading the user can hit the
+    # database. Returns (identity, user, None) or (None, None, the Flask error response)
+    with flask_app.test_request_context(headers=[("Authorization", value) for value in authorization]):
+        try:
+            verify_jwt_in_request()
+            return get_jwt_identity(), get_current_user(), None
+        except Exception as e:
+            return None, None, flask_app.make_response(flask_app.handle_user_exception(e))
+
+
+async def authenticate(request):
+    identity, user, error = await run_in_threadpool(verify_token, request.headers.getlist("authorization"))
+
+    if error is not None:
+        headers = {key: value for key, value in error.headers.items() if key.lower() != "content-length"}
+        return None, None, Response(error.get_data(), status_code=error.status_code, headers=headers)
+
+    return identity, user, None
+
+
+def insert_message(session, sender_id, club_id, text):
+    # AddMessage's transaction, run through run_sync. Returns the message as message_data
+    new_message = Message(sender_id=sender_id, club_id=club_id, message=text)
+
+    session.add(new_message)
+    bump_versions(BookClub, [new_message.club_id], session)
+    session.commit()
+
+    return new_message.club_id, message_data(new_message)
+
+
+@measured('/messages')
+async def add_message(request):
+    # POST /messages, see AddMessage
+    identity, current_user, error = await authenticate(request)
+    if error:
+        return error
+
+    async with Session() as session:
+        try:
+            body = await request.json()
+            club_id, data = await session.run_sync(insert_message, body['sender_id'], body['club_id'], body['message'])
+        except Exception as e:
+            await session.rollback()
+            return json_response({"errors": ["validation errors"]}, 400)
+
+    remember_write(identity)
+    response_cache.invalidate('club', club_id)
+
+    try:
+        get_broker().publish(club_id, dumps(data).decode())
+    except Exception as e:
+        logger.exception("Could not publish a message to club %s", club_id)
+
+    return json_response({"message": "Message created successfully"}, 201)
+
+
+@measured('/clubs/<int:id>/messages')
+async def club_messages(request):
+    # GET /clubs/<id>/messages, see ClubMessages
+    club_id = request.path_params['id']
+
+    try:
+        before = request.query_params.get('before')
+        before, before_at = message_cursor(before) if before else (None, None)
+    except ValueError as e:
+        return json_response({"errors": ["Invalid cursor"]}, 400)
+
+    if request.query_params.get('stream') in ('1', 'true'):
+        # Placed before the response starts, so a cursor that cannot be is still answered with a 400
+        async with Session() as session:
+            try:
+                anchor = await session.run_sync(lambda sync_session: archive_anchor(before, before_at, sync_session))
+            except ValueError as e:
+                return json_response({"errors": ["Invalid cursor"]}, 400)
+
+        async def generate():
+            # Same framing as stream_items, STREAM_BATCH_SIZE rows per fetch
+            async with Session() as session:
+                statement = club_messages_query(club_id, before, session.sync_session).statement
+                result = await session.stream(statement, execution_options={"yield_per": STREAM_BATCH_SIZE})
+                separator = b''
+
+                yield b'{"items":['
+                async for rows in result.partitions():
+                    yield separator + b','.join(dumps(row._asdict()) for row in rows)
+                    separator = b','
+
+                # Then the archived messages, a chunk at a time
+                chunk_ids = await session.run_sync(lambda sync_session: archive_chunk_ids(club_id, anchor, session=sync_session))
+                for chunk_id in chunk_ids:
+                    items = await session.run_sync(lambda sync_session: load_archive_chunk(chunk_id, anchor, sync_session))
+                    if items:
+                        yield separator + b','.join(dumps(item) for item in items)
+                        separator = b','
+                yield b'],"next":null}\n'
+
+        return StreamingResponse(generate(), media_type="application/json", headers={"X-Accel-Buffering": "no"})
+
+    limit = page_limit(request)
+    async with Session() as session:
+        try:
+            messages, next_cursor = await session.run_sync(
+                lambda sync_session: message_window(club_id, before, limit, session=sync_session, before_at=before_at)
+            )
+        except ValueError as e:
+            return json_response({"errors": ["Invalid cursor"]}, 400)
+
+    return json_response({"items": messages, "next": next_cursor})
+
+
+async def club_stream(request):
+    # GET /clubs/<id>/stream, see ClubStream
+    club_id = request.path_params['id']
+    broker = get_broker()
+    last_event_id = query_int(request.headers.get('Last-Event-ID'))
+    after = last_event_id if last_event_id is not None else broker.latest(club_id)
+
+    async def events(after):
+        yield SSE_PREAMBLE
+
+        while True:
+            new_events, missed = await broker.wait_async(club_id, after, SSE_KEEPALIVE_SECONDS)
+            text, after = chat_events_sse(broker, club_id, after, new_events, missed)
+            yield text
+
+    return StreamingResponse(
+        events(after),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@measured('/clubs/<int:id>/poll')
+async def club_poll(request):
+    # GET /clubs/<id>/poll, see ClubPoll
+    club_id = request.path_params['id']
+    broker = get_broker()
+    after = query_int(request.query_params.get('after'))
+
+    if after is None:
+        new_events, missed = [], False
+        after = broker.latest(club_id)
+    else:
+        timeout = query_int(request.query_params.get('timeout'))
+        timeout = LONG_POLL_MAX_SECONDS if timeout is None else timeout
+        new_events, missed = await broker.wait_async(club_id, after, max(0, min(timeout, LONG_POLL_MAX_SECONDS)))
+
+    return json_response(chat_events_poll(broker, club_id, after, new_events, missed))
+
+
+@measured('/profile/<string:username>')
+async def patch_profile(request):
+    # PATCH /profile/<username>, see Profile.patch
+    username = request.path_params['username']
+
+    identity, current_user, error = await authenticate(request)
+    if error:
+        return error
+
+    if identity != username:
+        return json_response({"message": "Unauthorized"}, 401)
+
+    try:
+        changes = await request.json()
+    except ValueError as e:
+        return json_response({"message": "The browser (or proxy) sent a request that this server could not understand."}, 400)
+
+    async with Session() as session:
+        body, status = await session.run_sync(
+            lambda sync_session: update_profile(flask_app, username, current_user.id, changes, sync_session)
+        )
+
+    if status < 400:
+        remember_write(identity)
+
+    return json_response(body, status)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await engine.dispose()
+
+
+# The Flask app allows every origin too, preflight requests are answered by it
+cors = [Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])]
+
+app = Starlette(
+    routes=[
+        Route('/messages', add_message, methods=["POST"], middleware=cors),
+        Route('/clubs/{id:int}/messages', club_messages, methods=["GET"], middleware=cors),
+        Route('/clubs/{id:int}/stream', club_stream, methods=["GET"], middleware=cors),
+        Route('/clubs/{id:int}/poll', club_poll, methods=["GET"], middleware=cors),
+        Route('/profile/{username:str}', patch_profile, methods=["PATCH"], middleware=cors),
+        Mount('/', app=WSGIMiddleware(flask_app, workers=int(os.environ.get('ASGI_WSGI_THREADS', 10)))),
+    ],
+    lifespan=lifespan,
+)
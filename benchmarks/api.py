@@ -0,0 +1,579 @@
+"""Per-endpoint API latency benchmark.
+
+Loads a scaled synthetic dataset into a scratch database, migrated to head, then drives
+every route of create_app() with weighted request mixes and reports p50/p95/p99 latency
+and throughput per endpoint. Results are written as JSON, keyed by commit, so two runs
+can be compared.
+
+    python -m benchmarks.api                                  # temporary SQLite file, in-process client
+    DATABASE_URI=postgresql://... python -m benchmarks.api --scale 10
+    python -m benchmarks.api --compare benchmarks/results/api-<commit>-sqlite.json
+
+With --base-url the requests go over HTTP to a running server instead (gunicorn "run:app"),
+which must use the same DATABASE_URI. Point DATABASE_URI at a throwaway database, the
+tables are filled with fake rows.
+"""
+import argparse
+import datetime
+import itertools
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+
+from flask_migrate import Migrate, upgrade
+from sqlalchemy import func, insert
+
+# Routes left out of every mix
+NOT_BENCHMARKED = {
+    "GET /clubs/<int:id>/stream": "an open-ended event stream, it has no response time",
+}
+
+PASSWORD = "benchmark-password"
+
+# Rows per scale unit
+SIZES = {
+    "users": 10_000,
+    "clubs": 1_000,
+    "books": 20_000,
+    "members": 40_000,
+    "messages": 200_000,
+    "comments": 50_000,
+}
+
+
+def skewed(count, rng, exponent=1.0):
+    # Picks ids 1..count with a Zipf-like skew, a few clubs and books get most of the traffic
+    ids = list(range(1, count + 1))
+    cum_weights = list(itertools.accumulate(1 / rank ** exponent for rank in ids))
+    return lambda k=1: rng.choices(ids, cum_weights=cum_weights, k=k)
+
+
+def load_dataset(db, models, sizes, rng, password_hash, batch_size=10_000):
+    User, BookClub, ClubMember, Book, CurrentBook, PrevioislyReadBook, BookComment, Message = models
+    started = datetime.datetime(2024, 1, 1)
+
+    def load(model, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                db.session.execute(insert(model), batch)
+                batch = []
+        if batch:
+            db.session.execute(insert(model), batch)
+        db.session.commit()
+
+    load(User, (
+        dict(username=f"reader{i}", email=f"reader{i}@example.com", password=password_hash,
+             first_name=f"Reader{i}", last_name="Benchmark", profile_pic=None)
+        for i in range(1, sizes["users"] + 1)
+    ))
+    load(BookClub, (
+        dict(name=f"Club {i}", location=f"City {i % 97}", description=f"Book club number {i}",
+             creator_id=rng.randint(1, sizes["users"]))
+        for i in range(1, sizes["clubs"] + 1)
+    ))
+    load(Book, (
+        dict(title=f"Book {i}", author=f"Author {i % 1500}", description=f"The story of book {i}")
+        for i in range(1, sizes["books"] + 1)
+    ))
+
+    popular_club = skewed(sizes["clubs"], rng)
+    popular_book = skewed(sizes["books"], rng)
+
+    # Memberships are unique, repeated picks are dropped so "members" is an upper bound
+    memberships = dict.fromkeys(
+        (popular_club()[0], rng.randint(1, sizes["users"])) for _ in range(sizes["members"])
+    )
+    load(ClubMember, (dict(club_id=club_id, member_id=member_id) for club_id, member_id in memberships))
+    load(CurrentBook, (dict(club_id=i, book_id=popular_book()[0]) for i in range(1, sizes["clubs"] + 1)))
+    load(PrevioislyReadBook, (
+        dict(club_id=i, book_id=book_id)
+        for i in range(1, sizes["clubs"] + 1)
+        for book_id in set(popular_book(k=3))
+    ))
+    load(BookComment, (
+        dict(book_id=popular_book()[0], user_id=rng.randint(1, sizes["users"]),
+             comment="A benchmark review", rating=rng.randint(1, 5))
+        for _ in range(sizes["comments"])
+    ))
+    load(Message, (
+        dict(club_id=popular_club()[0], sender_id=rng.randint(1, sizes["users"]),
+             message=f"Benchmark message {i}", created_at=started + datetime.timedelta(seconds=i))
+        for i in range(sizes["messages"])
+    ))
+
+
+class InProcessDriver:
+    # Flask test client, one per thread
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def request(self, method, url, headers, **kwargs):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.open(url, method=method, headers=headers, **kwargs)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HTTPDriver:
+    # Keep-alive HTTP session per thread against a running server
+    def __init__(self, base_url):
+        import requests
+
+        self.requests = requests
+        self.base_url = base_url.rstrip("/")
+        self.local = threading.local()
+
+    def request(self, method, url, headers, json=None, data=None, content_type=None):
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = self.requests.Session()
+        if content_type:
+            headers = dict(headers, **{"Content-Type": content_type})
+        response = session.request(method, self.base_url + url, headers=headers, json=json, data=data)
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return response.status_code, body
+
+
+class VirtualUser:
+    """One logged in reader issuing requests from a single thread.
+
+    Operations return (endpoint, method, url, kwargs) for the request being measured.
+    Anything they need to exist first (a book to delete, a user to remove) is set up
+    through `untimed` so it does not count towards that endpoint.
+    """
+
+    def __init__(self, driver, sizes, rng, user_id):
+        self.driver = driver
+        self.sizes = sizes
+        self.rng = rng
+        self.user_id = user_id
+        self.username = f"reader{user_id}"
+        self.headers = {}
+        self.club = skewed(sizes["clubs"], rng)
+        self.book = skewed(sizes["books"], rng)
+        self.serial = itertools.count()
+        self.joined = set()
+        self.own_club = None
+        self.added_members = []
+
+        status, body = self.untimed("POST", "/login", json=dict(username=self.username, password=PASSWORD))
+        if status != 200:
+            raise SystemExit(f"login as {self.username} failed with {status}, was the dataset loaded?")
+        self.headers = {"Authorization": f"Bearer {body['access_token']}"}
+
+    def untimed(self, method, url, **kwargs):
+        return self.driver.request(method, url, self.headers, **kwargs)
+
+    def unique(self, prefix):
+        # A single word, so it can also be found through /search
+        return f"{prefix} bench{self.user_id}x{threading.get_ident()}x{next(self.serial)}x{self.rng.getrandbits(32)}"
+
+    def new_club(self, prefix):
+        # Creates a club this user is the creator of and returns its id
+        name = self.unique(prefix)
+        self.untimed("POST", "/clubs", json=dict(name=name, location="Bench", description="Bench", creator_id=self.user_id))
+        status, body = self.untimed("GET", f"/search?type=clubs&q={name.split()[-1]}")
+        return body['clubs'][0]['id']
+
+    def member_club(self):
+        # A popular club this user has joined
+        club_id = self.club()[0]
+        if club_id not in self.joined:
+            self.untimed("POST", "/joinclub", json=dict(club_id=club_id, user_id=self.user_id))
+            self.joined.add(club_id)
+        return club_id
+
+    # Reads
+
+    def index(self):
+        return "GET /", "GET", "/", {}
+
+    def list_clubs(self):
+        return "GET /clubs", "GET", "/clubs", {}
+
+    def view_club(self):
+        return "GET /clubs/<int:id>", "GET", f"/clubs/{self.club()[0]}", {}
+
+    def popular_clubs(self):
+        return "GET /clubs/popular", "GET", "/clubs/popular", {}
+
+    def my_clubs(self):
+        return "GET /users/<int:id>/clubs", "GET", f"/users/{self.user_id}/clubs", {}
+
+    def club_messages(self):
+        return "GET /clubs/<int:id>/messages", "GET", f"/clubs/{self.club()[0]}/messages", {}
+
+    def poll(self):
+        # Answers immediately with the current position, like a client's first poll
+        return "GET /clubs/<int:id>/poll", "GET", f"/clubs/{self.club()[0]}/poll", {}
+
+    def unread(self):
+        return "GET /users/<int:id>/unread", "GET", f"/users/{self.user_id}/unread", {}
+
+    def list_books(self):
+        return "GET /books", "GET", "/books", {}
+
+    def view_book(self):
+        return "GET /books/<int:id>", "GET", f"/books/{self.book()[0]}", {}
+
+    def top_books(self):
+        return "GET /books/top", "GET", "/books/top", {}
+
+    def search(self):
+        terms = self.rng.choice(["club", "book", f"book {self.book()[0]}", "story", "city"])
+        return "GET /search", "GET", f"/search?q={terms}", {}
+
+    def view_profile(self):
+        return "GET /profile/<string:username>", "GET", f"/profile/{self.username}", {}
+
+    def password_stats(self):
+        return "GET /passwords/stats", "GET", "/passwords/stats", {}
+
+    def cache_stats(self):
+        return "GET /cache/stats", "GET", "/cache/stats", {}
+
+    def metrics(self):
+        return "GET /metrics", "GET", "/metrics", {}
+
+    def batch(self):
+        # A club page in one round trip: the club, its messages, a few of its books and the caller's profile
+        club_id = self.club()[0]
+        return "POST /batch", "POST", "/batch", dict(json=dict(requests=[
+            dict(path=f"/clubs/{club_id}"),
+            dict(path=f"/clubs/{club_id}/messages"),
+            *(dict(path=f"/books/{book_id}") for book_id in self.book(3)),
+            dict(path=f"/profile/{self.username}"),
+        ]))
+
+    # Writes
+
+    def login(self):
+        return "POST /login", "POST", "/login", dict(json=dict(username=self.username, password=PASSWORD))
+
+    def register(self):
+        username = self.unique("bench").replace(" ", "-")
+        return "POST /register", "POST", "/register", dict(json=dict(
+            username=username, email=f"{username}@example.com", first_name="Bench", last_name="Mark",
+            profile_pic=None, password=PASSWORD,
+        ))
+
+    def post_message(self):
+        return "POST /messages", "POST", "/messages", dict(json=dict(
+            sender_id=self.user_id, club_id=self.club()[0], message=self.unique("Benchmark chat"),
+        ))
+
+    def join_club(self):
+        return "POST /joinclub", "POST", "/joinclub", dict(json=dict(club_id=self.club()[0], user_id=self.user_id))
+
+    def mark_read(self):
+        # Reads up to the newest message, as a client does when the chat is opened
+        return "POST /clubs/<int:id>/read", "POST", f"/clubs/{self.member_club()}/read", dict(json={})
+
+    def add_members(self):
+        # An import of 20 random users into a club of this user's own
+        if self.own_club is None:
+            self.own_club = self.new_club("Imported club")
+        member_ids = self.rng.sample(range(1, self.sizes["users"] + 1), 20)
+        self.added_members.extend(member_ids)
+        return "POST /clubs/<int:id>/members", "POST", f"/clubs/{self.own_club}/members", dict(json=dict(member_ids=member_ids))
+
+    def remove_members(self):
+        # Removes up to 20 of the members add_members put in
+        if not self.added_members:
+            endpoint, method, url, kwargs = self.add_members()
+            self.untimed(method, url, **kwargs)
+        member_ids, self.added_members = self.added_members[:20], self.added_members[20:]
+        return "DELETE /clubs/<int:id>/members", "DELETE", f"/clubs/{self.own_club}/members", dict(json=dict(member_ids=member_ids))
+
+    def comment(self):
+        return "POST /bookcomments", "POST", "/bookcomments", dict(json=dict(
+            user_id=self.user_id, book_id=self.book()[0], comment="Benchmark review", rating=self.rng.randint(1, 5),
+        ))
+
+    def add_book(self):
+        return "POST /books", "POST", "/books", dict(json=dict(title=self.unique("Bench book"), author="Bench", description="Bench"))
+
+    def bulk_books(self):
+        lines = "".join(json.dumps({"title": self.unique("Bulk book")}) + "\n" for _ in range(50))
+        return "POST /books/bulk", "POST", "/books/bulk", dict(data=lines, content_type="application/x-ndjson")
+
+    def patch_book(self):
+        return "PATCH /books/<int:id>", "PATCH", f"/books/{self.book()[0]}", dict(json=dict(description=self.unique("Revised")))
+
+    def delete_book(self):
+        status, body = self.untimed("POST", "/books", json=dict(title=self.unique("Doomed book"), author="Bench", description="Bench"))
+        return "DELETE /books/<int:id>", "DELETE", f"/books/{body['id']}", {}
+
+    def create_club(self):
+        return "POST /clubs", "POST", "/clubs", dict(json=dict(
+            name=self.unique("Bench club"), location="Bench", description="Bench", creator_id=self.user_id,
+        ))
+
+    def patch_club(self):
+        return "PATCH /clubs/<int:id>", "PATCH", f"/clubs/{self.club()[0]}", dict(json=dict(description=self.unique("Revised")))
+
+    def delete_club(self):
+        return "DELETE /clubs/<int:id>", "DELETE", f"/clubs/{self.new_club('Doomed club')}", {}
+
+    def add_current_book(self):
+        return "POST /currentbook", "POST", "/currentbook", dict(json=dict(club_id=self.club()[0], book_id=self.book()[0]))
+
+    def delete_current_book(self):
+        club_id = self.club()[0]
+        self.untimed("POST", "/currentbook", json=dict(club_id=club_id, book_id=self.book()[0]))
+        return "DELETE /currentbook/<int:id>", "DELETE", f"/currentbook/{club_id}", {}
+
+    def add_previous_book(self):
+        return "POST /previousbooks", "POST", "/previousbooks", dict(json=dict(club_id=self.club()[0], book_id=self.book()[0]))
+
+    def delete_previous_book(self):
+        club_id = self.club()[0]
+        self.untimed("POST", "/previousbooks", json=dict(club_id=club_id, book_id=self.book()[0]))
+        return "DELETE /previousbooks/<int:id>", "DELETE", f"/previousbooks/{club_id}", {}
+
+    def patch_profile(self):
+        return "PATCH /profile/<string:username>", "PATCH", f"/profile/{self.username}", dict(json=dict(first_name=self.unique("Reader")))
+
+    def delete_profile(self):
+        # Deletes a throwaway account, its token is only used for this request
+        username = self.unique("leaving").replace(" ", "-")
+        self.untimed("POST", "/register", json=dict(
+            username=username, email=f"{username}@example.com", first_name="Bench", last_name="Mark",
+            profile_pic=None, password=PASSWORD,
+        ))
+        status, body = self.untimed("POST", "/login", json=dict(username=username, password=PASSWORD))
+        return "DELETE /profile/<string:username>", "DELETE", f"/profile/{username}", dict(
+            headers={"Authorization": f"Bearer {body['access_token']}"},
+        )
+
+
+# (weight, operation) per mix
+MIXES = {
+    "club-views": [
+        (35, "view_club"), (20, "club_messages"), (10, "list_clubs"), (10, "view_book"), (5, "list_books"),
+        (5, "top_books"), (5, "search"), (5, "view_profile"), (3, "poll"), (1, "index"),
+        (1, "password_stats"), (1, "cache_stats"), (1, "metrics"), (5, "batch"),
+        (5, "popular_clubs"), (5, "my_clubs"),
+    ],
+    "chat": [
+        (55, "post_message"), (20, "club_messages"), (10, "poll"), (5, "view_club"), (5, "mark_read"), (5, "unread"),
+    ],
+    "logins": [(85, "login"), (15, "register")],
+    "catalog": [
+        (25, "add_book"), (20, "comment"), (15, "patch_book"), (10, "view_book"), (10, "delete_book"),
+        (5, "bulk_books"), (15, "top_books"),
+    ],
+    "club-admin": [
+        (20, "join_club"), (10, "create_club"), (10, "patch_club"), (5, "delete_club"),
+        (10, "add_current_book"), (10, "delete_current_book"), (10, "add_previous_book"),
+        (10, "delete_previous_book"), (10, "patch_profile"), (5, "delete_profile"), (5, "add_members"),
+        (5, "remove_members"),
+    ],
+}
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, max(0, math.ceil(len(samples) * fraction) - 1))]
+
+
+def run_mix(driver, sizes, mix, requests, concurrency, warmup, seed):
+    # Returns {endpoint: [(latency_ms, status), ...]} and the wall time of the measured part
+    weights = [weight for weight, _ in MIXES[mix]]
+    operations = [name for _, name in MIXES[mix]]
+    samples = {}
+    lock = threading.Lock()
+    barrier = threading.Barrier(concurrency + 1)
+    per_thread = math.ceil(requests / concurrency)
+
+    def worker(index):
+        rng = random.Random(f"{seed}-{mix}-{index}")
+        user = VirtualUser(driver, sizes, rng, user_id=1 + index * 7919 % sizes["users"])
+        local = {}
+
+        for i in range(warmup + per_thread):
+            if i == warmup:
+                barrier.wait()
+            endpoint, method, url, kwargs = getattr(user, rng.choices(operations, weights)[0])()
+            headers = kwargs.pop("headers", user.headers)
+
+            started = time.perf_counter()
+            status, _ = driver.request(method, url, headers, **kwargs)
+            elapsed = (time.perf_counter() - started) * 1000
+
+            if i >= warmup:
+                local.setdefault(endpoint, []).append((elapsed, status))
+
+        with lock:
+            for endpoint, values in local.items():
+                samples.setdefault(endpoint, []).extend(values)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples, elapsed):
+    endpoints = {}
+    for endpoint, values in sorted(samples.items()):
+        latencies = sorted(latency for latency, _ in values)
+        endpoints[endpoint] = {
+            "count": len(values),
+            "errors": sum(1 for _, status in values if status >= 500),
+            "client_errors": sum(1 for _, status in values if 400 <= status < 500),
+            "mean_ms": round(statistics.fmean(latencies), 3),
+            "p50_ms": round(percentile(latencies, 0.50), 3),
+            "p95_ms": round(percentile(latencies, 0.95), 3),
+            "p99_ms": round(percentile(latencies, 0.99), 3),
+            "throughput_rps": round(len(values) / elapsed, 1),
+        }
+    total = sum(len(values) for values in samples.values())
+    return {"elapsed_s": round(elapsed, 3), "requests": total, "throughput_rps": round(total / elapsed, 1), "endpoints": endpoints}
+
+
+def compare(previous, current, threshold):
+    # Prints p50/p95 changes per endpoint, returns the number of p95 regressions over threshold
+    regressions = 0
+    print(f"\ncompared with {previous.get('commit', '?')} ({previous.get('database')}, {previous.get('driver')})")
+    for setting in ("database", "driver", "scale", "concurrency"):
+        if previous.get(setting) != current[setting]:
+            print(f"  note: {setting} differs, {previous.get(setting)} then and {current[setting]} now")
+    for mix, result in current["mixes"].items():
+        before = previous.get("mixes", {}).get(mix)
+        if not before:
+            continue
+        for endpoint, stats in result["endpoints"].items():
+            old = before["endpoints"].get(endpoint)
+            if not old:
+                continue
+            change = (stats["p95_ms"] - old["p95_ms"]) / old["p95_ms"] if old["p95_ms"] else 0.0
+            flag = ""
+            if change > threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"  {mix:11} {endpoint:36} p50 {old['p50_ms']:>9.2f} -> {stats['p50_ms']:>9.2f}"
+                  f"  p95 {old['p95_ms']:>9.2f} -> {stats['p95_ms']:>9.2f} ({change:+.0%}){flag}")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0, help="dataset size, 1 = 10k users, 1k clubs, 20k books, 200k messages")
+    parser.add_argument("--mix", action="append", choices=sorted(MIXES), help="mixes to run, all by default")
+    parser.add_argument("--requests", type=int, default=2000, help="measured requests per mix")
+    parser.add_argument("--warmup", type=int, default=50, help="unmeasured requests per thread before each mix")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--base-url", help="benchmark a running server instead of the in-process test client")
+    parser.add_argument("--skip-load", action="store_true", help="reuse a dataset loaded by an earlier run")
+    parser.add_argument("--output", help="result file, benchmarks/results/api-<commit>-<database>.json by default")
+    parser.add_argument("--compare", help="earlier result file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="p95 growth counted as a regression")
+    parser.add_argument("--seed", type=int, default=14)
+    args = parser.parse_args()
+
+    if not os.environ.get("DATABASE_URI"):
+        if args.base_url or args.skip_load:
+            parser.error("DATABASE_URI must point at the server's database")
+        os.environ["DATABASE_URI"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "api_bench.db")
+
+    from app import create_app, password_executor, rebuild_rating_aggregates, refresh_member_counts
+    from models import db, User, BookClub, ClubMember, Book, CurrentBook, PrevioislyReadBook, BookComment, Message
+
+    app = create_app()
+    Migrate(app, db)
+    sizes = {table: max(1, int(count * args.scale)) for table, count in SIZES.items()}
+
+    with app.app_context():
+        database = db.engine.dialect.name
+
+        if not args.skip_load:
+            upgrade()
+            started = time.perf_counter()
+            load_dataset(
+                db, (User, BookClub, ClubMember, Book, CurrentBook, PrevioislyReadBook, BookComment, Message),
+                sizes, random.Random(args.seed), password_executor.hash(PASSWORD),
+            )
+            rebuild_rating_aggregates()
+            refresh_member_counts()
+            db.session.commit()
+            print(f"loaded {sizes} in {time.perf_counter() - started:.1f}s", flush=True)
+        else:
+            sizes = {
+                "users": db.session.query(func.count(User.id)).scalar(),
+                "clubs": db.session.query(func.count(BookClub.id)).scalar(),
+                "books": db.session.query(func.count(Book.id)).scalar(),
+            }
+
+        routes = {
+            f"{method} {rule.rule}"
+            for rule in app.url_map.iter_rules() if rule.endpoint != "static"
+            for method in rule.methods - {"HEAD", "OPTIONS"}
+        }
+
+    driver = HTTPDriver(args.base_url) if args.base_url else InProcessDriver(app)
+    result = {
+        "commit": git_commit(),
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "database": database,
+        "driver": "http" if args.base_url else "in-process",
+        "scale": args.scale,
+        "concurrency": args.concurrency,
+        "mixes": {},
+    }
+
+    for mix in args.mix or sorted(MIXES):
+        samples, elapsed = run_mix(driver, sizes, mix, args.requests, args.concurrency, args.warmup, args.seed)
+        summary = result["mixes"][mix] = summarize(samples, elapsed)
+
+        print(f"\n{mix}: {summary['requests']} requests in {summary['elapsed_s']}s, {summary['throughput_rps']} req/s", flush=True)
+        for endpoint, stats in summary["endpoints"].items():
+            print(f"  {endpoint:36} n={stats['count']:<6} p50 {stats['p50_ms']:>8.2f}  p95 {stats['p95_ms']:>8.2f}"
+                  f"  p99 {stats['p99_ms']:>8.2f} ms  {stats['throughput_rps']:>8.1f} req/s"
+                  f"  5xx {stats['errors']}  4xx {stats['client_errors']}", flush=True)
+
+    if not args.mix:
+        measured = {endpoint for summary in result["mixes"].values() for endpoint in summary["endpoints"]}
+        for route in sorted(routes - measured - set(NOT_BENCHMARKED)):
+            print(f"not benchmarked: {route}")
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results", f"api-{result['commit']}-{database}.json",
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nwrote {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(json.load(f), result, args.threshold):
+                raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
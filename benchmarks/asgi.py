@@ -0,0 +1,277 @@
+"""Sync vs async serving benchmark for the chat endpoints.
+
+Loads a scaled synthetic dataset into a scratch database, then starts the current
+setup (gunicorn "run:app") and the async mode (uvicorn "asgi:app") one after the
+other on the same database. Each one gets a chat mix (posting messages, reading club
+feeds, editing profiles) from an increasing number of concurrent keep-alive
+connections while --listeners clients keep /clubs/<id>/stream open, and the report
+gives throughput, p50/p99 latency, failed requests and the chat events the listeners
+received per server and concurrency level. With gunicorn every open stream holds a
+worker thread, so once there are more listeners than threads the rest of the traffic
+has to wait for them.
+
+    python -m benchmarks.asgi                                    # temporary SQLite file
+    DATABASE_URI=postgresql://... python -m benchmarks.asgi --scale 1 --concurrency 64 --concurrency 2048
+    python -m benchmarks.asgi --concurrency 16 --listeners 64    # with open chat streams
+
+The load comes from one asyncio process (httpx), so at the highest levels it can be
+the client that saturates first. Run it on a machine with spare cores. Compare on
+Postgres: SQLite lets one writer in at a time, and aiosqlite adds a thread hop per
+statement, so on SQLite both servers end up waiting on the database lock. Point
+DATABASE_URI at a throwaway database, because the tables are filled with fake rows.
+"""
+import argparse
+import asyncio
+import datetime
+import importlib.util
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from flask_migrate import Migrate, upgrade
+
+from benchmarks.api import PASSWORD, SIZES, git_commit, load_dataset, percentile, skewed
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (weight, endpoint) of the chat mix, these are the routes asgi.py serves itself
+MIX = [(60, "POST /messages"), (30, "GET /clubs/<int:id>/messages"), (10, "PATCH /profile/<string:username>")]
+
+
+def server_command(server, port, workers, threads):
+    if server == "gunicorn":
+        return [
+            sys.executable, "-m", "gunicorn", "run:app", "--bind", f"127.0.0.1:{port}",
+            "--workers", str(workers), "--threads", str(threads), "--backlog", "4096", "--log-level", "warning",
+        ]
+    return [
+        sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers), "--backlog", "4096", "--no-access-log", "--log-level", "warning",
+    ]
+
+
+def start_server(server, port, workers, threads, timeout=60):
+    process = subprocess.Popen(server_command(server, port, workers, threads), cwd=ROOT, env=dict(os.environ))
+
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"{server} exited with {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+
+    stop_server(process)
+    raise SystemExit(f"{server} did not answer on port {port} within {timeout}s")
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def drive(base_url, users, sizes, concurrency, duration, seed, listeners=0):
+    # Returns {endpoint: [(latency_ms, status), ...]}, the measured wall time and how many chat
+    # events the listeners received. Failed connections and timeouts are recorded with status 0
+    import httpx
+
+    samples = {}
+    received = [0]
+    endpoints = [endpoint for _, endpoint in MIX]
+    weights = [weight for weight, _ in MIX]
+    limits = httpx.Limits(max_connections=concurrency + listeners, max_keepalive_connections=concurrency + listeners)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        async def connection(index):
+            rng = random.Random(f"{seed}-{concurrency}-{index}")
+            user_id, username, token = users[index % len(users)]
+            headers = {"Authorization": f"Bearer {token}"}
+            club = skewed(sizes["clubs"], rng)
+            serial = 0
+
+            while time.perf_counter() < deadline:
+                endpoint = rng.choices(endpoints, weights)[0]
+                serial += 1
+
+                if endpoint == "POST /messages":
+                    request = client.post("/messages", headers=headers, json=dict(
+                        sender_id=user_id, club_id=club()[0], message=f"Benchmark chat {index}x{serial}",
+                    ))
+                elif endpoint == "PATCH /profile/<string:username>":
+                    request = client.patch(f"/profile/{username}", headers=headers, json=dict(first_name=f"Reader{serial}"))
+                else:
+                    request = client.get(f"/clubs/{club()[0]}/messages", headers=headers)
+
+                started = time.perf_counter()
+                try:
+                    status = (await request).status_code
+                except httpx.HTTPError:
+                    status = 0
+                samples.setdefault(endpoint, []).append(((time.perf_counter() - started) * 1000, status))
+
+        async def listener(index):
+            club = skewed(sizes["clubs"], random.Random(f"{seed}-listener-{index}"))
+            try:
+                async with client.stream("GET", f"/clubs/{club()[0]}/stream", timeout=None) as response:
+                    async for line in response.aiter_lines():
+                        if line.startswith("event: message"):
+                            received[0] += 1
+            except httpx.HTTPError:
+                pass
+
+        # Listeners connect first and stay connected for the whole run
+        streams = [asyncio.create_task(listener(index)) for index in range(listeners)]
+        await asyncio.sleep(1 if listeners else 0)
+
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(connection(index) for index in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+        for stream in streams:
+            stream.cancel()
+        await asyncio.gather(*streams, return_exceptions=True)
+
+    return samples, elapsed, received[0]
+
+
+def summarize(samples, elapsed, listeners=0, received=0):
+    endpoints = {}
+    for endpoint, values in sorted(samples.items()):
+        latencies = sorted(latency for latency, _ in values)
+        endpoints[endpoint] = {
+            "count": len(values),
+            "failed": sum(1 for _, status in values if status == 0 or status >= 500),
+            "p50_ms": round(percentile(latencies, 0.50), 3),
+            "p99_ms": round(percentile(latencies, 0.99), 3),
+            "throughput_rps": round(len(values) / elapsed, 1),
+        }
+
+    latencies = sorted(latency for values in samples.values() for latency, _ in values)
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "listeners": listeners,
+        "events_received": received,
+        "requests": len(latencies),
+        "failed": sum(stats["failed"] for stats in endpoints.values()),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50), 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99), 3) if latencies else None,
+        "endpoints": endpoints,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=float, default=0.1, help="dataset size, 1 = 10k users, 1k clubs, 200k messages")
+    parser.add_argument("--concurrency", type=int, action="append", help="open connections, 16, 256 and 1024 by default")
+    parser.add_argument("--listeners", type=int, default=0, help="SSE clients kept open on /clubs/<id>/stream")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds measured per server and concurrency")
+    parser.add_argument("--server", action="append", choices=["gunicorn", "uvicorn"], help="both by default")
+    parser.add_argument("--workers", type=int, default=2, help="worker processes for either server")
+    parser.add_argument("--threads", type=int, default=8, help="threads per gunicorn worker")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--skip-load", action="store_true", help="reuse a dataset loaded by an earlier run")
+    parser.add_argument("--output", help="result file, benchmarks/results/asgi-<commit>-<database>.json by default")
+    parser.add_argument("--seed", type=int, default=20)
+    args = parser.parse_args()
+
+    if importlib.util.find_spec("httpx") is None:
+        raise SystemExit("the load generator needs httpx (pip install httpx)")
+
+    if not os.environ.get("DATABASE_URI"):
+        if args.skip_load:
+            parser.error("DATABASE_URI must point at the database loaded earlier")
+        os.environ["DATABASE_URI"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "asgi_bench.db")
+
+    from flask_jwt_extended import create_access_token
+    from sqlalchemy import func
+
+    from app import create_app, password_executor, rebuild_rating_aggregates, refresh_member_counts
+    from models import db, User, BookClub, ClubMember, Book, CurrentBook, PrevioislyReadBook, BookComment, Message
+
+    app = create_app()
+    Migrate(app, db)
+    sizes = {table: max(1, int(count * args.scale)) for table, count in SIZES.items()}
+    levels = args.concurrency or [16, 256, 1024]
+
+    with app.app_context():
+        database = db.engine.dialect.name
+
+        if not args.skip_load:
+            upgrade()
+            started = time.perf_counter()
+            load_dataset(
+                db, (User, BookClub, ClubMember, Book, CurrentBook, PrevioislyReadBook, BookComment, Message),
+                sizes, random.Random(args.seed), password_executor.hash(PASSWORD),
+            )
+            rebuild_rating_aggregates()
+            refresh_member_counts()
+            db.session.commit()
+            print(f"loaded {sizes} in {time.perf_counter() - started:.1f}s", flush=True)
+        else:
+            sizes["users"] = db.session.query(func.count(User.id)).scalar()
+            sizes["clubs"] = db.session.query(func.count(BookClub.id)).scalar()
+
+        # Tokens are minted here, logging in thousands of connections would benchmark password hashing
+        users = [
+            (user_id, f"reader{user_id}", create_access_token(identity=f"reader{user_id}"))
+            for user_id in range(1, min(max(levels), sizes["users"]) + 1)
+        ]
+
+    result = {
+        "commit": git_commit(),
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "database": database,
+        "scale": args.scale,
+        "workers": args.workers,
+        "threads": args.threads,
+        "listeners": args.listeners,
+        "servers": {},
+    }
+
+    for server in args.server or ["gunicorn", "uvicorn"]:
+        process = start_server(server, args.port, args.workers, args.threads)
+        try:
+            for concurrency in levels:
+                samples, elapsed, received = asyncio.run(drive(
+                    f"http://127.0.0.1:{args.port}", users, sizes, concurrency, args.duration, args.seed, args.listeners,
+                ))
+                summary = result["servers"].setdefault(server, {})[str(concurrency)] = summarize(
+                    samples, elapsed, args.listeners, received,
+                )
+
+                print(f"\n{server} x{concurrency}: {summary['requests']} requests, {summary['throughput_rps']} req/s,"
+                      f" p50 {summary['p50_ms']} ms, p99 {summary['p99_ms']} ms, {summary['failed']} failed,"
+                      f" {received} events to {args.listeners} listeners", flush=True)
+                for endpoint, stats in summary["endpoints"].items():
+                    print(f"  {endpoint:36} n={stats['count']:<7} p50 {stats['p50_ms']:>9.2f}  p99 {stats['p99_ms']:>9.2f} ms"
+                          f"  {stats['throughput_rps']:>8.1f} req/s  failed {stats['failed']}", flush=True)
+        finally:
+            stop_server(process)
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results", f"asgi-{result['commit']}-{database}.json",
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nwrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Full-text search benchmark.
+
+Loads a synthetic catalog into a scratch database, migrated to head, and times
+ranked search queries against it, next to the LIKE scan every unindexed lookup
+has to do (counting all matches, which is what ranking them would need).
+
+    python -m benchmarks.search                       # 1M books in a temporary SQLite file
+    DATABASE_URI=postgresql://... python -m benchmarks.search --books 1000000
+
+Point DATABASE_URI at a throwaway database, the books table is filled with fake rows.
+"""
+import argparse
+import itertools
+import math
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from flask_migrate import Migrate, upgrade
+from sqlalchemy import insert, text
+
+SYLLABLES = "ka lo mi ren tor va shi el dor an bel qu ist mor fen ra li sa ton ver".split()
+
+
+def vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def fake_books(count, words, rng):
+    # Word frequencies follow a Zipf-like curve, like real text, so queries range from
+    # very common to rare terms
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+
+    for i in range(count):
+        title = rng.choices(words, cum_weights=cum_weights, k=rng.randint(1, 4))
+        yield {
+            "title": " ".join(title) + f" {i}",
+            "author": " ".join(rng.choices(words, k=2)).title(),
+            "description": " ".join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(12, 40))),
+        }
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, math.ceil(len(samples) * 0.95) - 1)], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=1_000_000)
+    parser.add_argument("--batch", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=13)
+    args = parser.parse_args()
+
+    if not os.environ.get("DATABASE_URI"):
+        os.environ["DATABASE_URI"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "search_bench.db")
+
+    from app import create_app
+    from models import db, Book
+    from search import search
+
+    app = create_app()
+    Migrate(app, db)
+    rng = random.Random(args.seed)
+    words = vocabulary(20_000, rng)
+
+    with app.app_context():
+        upgrade()
+
+        started = time.perf_counter()
+        batch = []
+        for row in fake_books(args.books, words, rng):
+            batch.append(row)
+            if len(batch) == args.batch:
+                db.session.execute(insert(Book), batch)
+                db.session.commit()
+                batch = []
+        if batch:
+            db.session.execute(insert(Book), batch)
+            db.session.commit()
+        print(f"loaded {args.books} books (index maintained on insert) in {time.perf_counter() - started:.1f}s", flush=True)
+
+        if db.engine.dialect.name == "postgresql":
+            db.session.execute(text("ANALYZE books"))
+            db.session.commit()
+
+        # A very common word, a mid-frequency one, a rare one, a two word query and a prefix
+        queries = [words[0], words[500], words[-1], f"{words[10]} {words[2000]}", words[300][:4]]
+        for terms in queries:
+            indexed = timed(lambda: search(db.session, "books", terms, 20), args.repeat)
+            like = timed(
+                lambda: db.session.execute(
+                    text("SELECT count(*) FROM books WHERE title LIKE :q OR author LIKE :q OR description LIKE :q"),
+                    {"q": f"%{terms}%"},
+                ).all(),
+                max(1, args.repeat // 10),
+            )
+            print(f"{terms!r:26} fts {indexed}  like-scan {like}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Serialization micro-benchmark for the list endpoints.
+
+Times building a page of books, clubs and club messages the old way (ORM instances,
+marshmallow dump, pretty-printed stdlib JSON) and through the fast path the endpoints
+use now (column rows, ColumnSerializer, compact orjson), and prints the cost per row
+of each stage.
+
+    python -m benchmarks.serialization                 # temporary SQLite file
+    python -m benchmarks.serialization --rows 100 --rows 1000 --repeat 50
+
+Point DATABASE_URI at a throwaway database, seed.py fills it with fake rows.
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from flask_migrate import Migrate, upgrade
+from sqlalchemy.orm import joinedload
+
+
+def per_row_us(fn, rows, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1e6 / rows)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, action="append", help="page sizes, 100 and 1000 by default")
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+    page_sizes = args.rows or [100, 1000]
+
+    if not os.environ.get("DATABASE_URI"):
+        os.environ["DATABASE_URI"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "serialization_bench.db")
+
+    from app import (
+        create_app, book_columns, bookclub_columns, books_schema, bookClubs_schema, message_data, message_window,
+    )
+    from models import db, Book, BookClub, Message
+    from seed import seed
+    from serialization import dumps, orjson
+
+    app = create_app()
+    Migrate(app, db)
+    largest = max(page_sizes)
+
+    with app.app_context():
+        upgrade()
+        seed({
+            "users": 1000, "clubs": largest, "books": largest, "members": 0, "current_books": 0,
+            "previous_books": 0, "comments": 0, "messages": largest,
+        })
+        club_id = db.session.query(Message.club_id).group_by(Message.club_id).order_by(db.func.count().desc()).limit(1).scalar()
+
+        def old_encode(data):
+            # What jsonify produced with app.json.compact = False
+            return json.dumps(data, indent=2, sort_keys=True, default=app.json.default).encode()
+
+        print(f"\nencoder: {'orjson ' + orjson.__version__ if orjson else 'json (orjson not installed)'}")
+        print(f"{'microseconds per row':34}{'query':>10}{'convert':>10}{'encode':>10}{'total':>10}")
+
+        for rows in page_sizes:
+            old_messages = lambda: Message.query.options(joinedload(Message.sender)).filter(
+                Message.club_id == club_id
+            ).order_by(Message.created_at.desc(), Message.id.desc()).limit(rows).all()
+
+            cases = {
+                "books": (
+                    lambda: Book.query.order_by(Book.id).limit(rows).all(), books_schema.dump,
+                    lambda: db.session.query(*book_columns.columns).order_by(Book.id).limit(rows).all(), book_columns.dump_many,
+                ),
+                "clubs": (
+                    lambda: BookClub.query.order_by(BookClub.id).limit(rows).all(), bookClubs_schema.dump,
+                    lambda: db.session.query(*bookclub_columns.columns).order_by(BookClub.id).limit(rows).all(), bookclub_columns.dump_many,
+                ),
+                "messages": (
+                    old_messages, lambda messages: [message_data(message) for message in messages],
+                    lambda: message_window(club_id, limit=rows)[0], lambda messages: messages,
+                ),
+            }
+
+            for name, (old_query, old_convert, new_query, new_convert) in cases.items():
+                for label, query, convert, encode in (
+                    ("before", old_query, old_convert, old_encode),
+                    ("after", new_query, new_convert, dumps),
+                ):
+                    def run_query():
+                        db.session.expunge_all()  # Every request starts with an empty identity map
+                        return query()
+
+                    loaded = run_query()
+                    converted = convert(loaded)
+                    count = max(1, len(loaded))
+
+                    query_us = per_row_us(run_query, count, args.repeat)
+                    convert_us = per_row_us(lambda: convert(loaded), count, args.repeat)
+                    encode_us = per_row_us(lambda: encode({"items": converted}), count, args.repeat)
+                    total = query_us + convert_us + encode_us
+                    print(f"{name + ' x' + str(len(loaded)) + ' ' + label:34}{query_us:10.2f}{convert_us:10.2f}{encode_us:10.2f}{total:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import asyncio
+import threading
+from collections import deque
+from time import monotonic
+
+
+class InProcessBroker:
+    """Delivers club chat events to listeners running in this process.
+
+    Every club has its own sequence counter and a short ring buffer of recent
+    events, so a listener that reconnects with the last sequence it saw picks up
+    where it left off. Publishing is O(1) and wakes only the listeners of that
+    club; listeners never touch the database. Threads wait with wait(), coroutines
+    (the async handlers in asgi.py) with wait_async(), and publish() wakes both.
+
+    A cross-worker backend (Redis pub/sub, Postgres LISTEN/NOTIFY, ...) only has
+    to provide the same methods and be installed with set_broker().
+    """
+
+    def __init__(self, history=200):
+        self.history = history
+        self._lock = threading.Lock()
+        self._clubs = {}
+        self.published = 0
+        self.waiting = 0
+
+    def _club(self, club_id):
+        # Must be called with self._lock held
+        club = self._clubs.get(club_id)
+        if club is None:
+            club = {
+                "seq": 0,
+                "events": deque(maxlen=self.history),
+                "condition": threading.Condition(self._lock),
+                "waiters": set(),
+            }
+            self._clubs[club_id] = club
+        return club
+
+    def publish(self, club_id, data):
+        # data is an already serialized JSON string, so it is encoded once no matter how many listeners there are
+        with self._lock:
+            club = self._club(club_id)
+            club["seq"] += 1
+            club["events"].append((club["seq"], data))
+            club["condition"].notify_all()
+            for loop, waiter in club["waiters"]:
+                loop.call_soon_threadsafe(_wake, waiter)
+            club["waiters"].clear()
+            self.published += 1
+            return club["seq"]
+
+    def latest(self, club_id):
+        with self._lock:
+            return self._club(club_id)["seq"]
+
+    def wait(self, club_id, after, timeout):
+        # Returns (events, missed) where events are the (seq, data) pairs newer than `after`
+        # and missed is True when some of them already fell out of the history buffer
+        deadline = monotonic() + timeout
+
+        with self._lock:
+            club = self._club(club_id)
+
+            if after > club["seq"]:
+                # A position this process never handed out (another worker's, or from before a
+                # restart) cannot be resumed from, the client has to reload
+                return [], True
+
+            self.waiting += 1
+            try:
+                while club["seq"] <= after:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        return [], False
+                    club["condition"].wait(remaining)
+            finally:
+                self.waiting -= 1
+
+            return self._events_after(club, after)
+
+    async def wait_async(self, club_id, after, timeout):
+        # wait() for coroutines, the event loop keeps running while they wait
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+
+        with self._lock:
+            club = self._club(club_id)
+
+            if after > club["seq"]:
+                return [], True
+            if club["seq"] > after:
+                return self._events_after(club, after)
+
+            club["waiters"].add((loop, waiter))
+            self.waiting += 1
+
+        try:
+            await asyncio.wait([waiter], timeout=timeout)
+        finally:
+            with self._lock:
+                club["waiters"].discard((loop, waiter))
+                self.waiting -= 1
+
+        with self._lock:
+            if club["seq"] <= after:
+                return [], False
+            return self._events_after(club, after)
+
+    def _events_after(self, club, after):
+        # Must be called with self._lock held
+        events = [event for event in club["events"] if event[0] > after]
+        missed = not events or events[0][0] > after + 1
+
+        return events, missed
+
+    def stats(self):
+        with self._lock:
+            return {"clubs": len(self._clubs), "waiting": self.waiting, "published": self.published}
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+_broker = InProcessBroker()
+
+
+def get_broker():
+    return _broker
+
+
+def set_broker(broker):
+    global _broker
+    _broker = broker
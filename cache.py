@@ -0,0 +1,111 @@
+import threading
+import uuid
+from collections import OrderedDict
+from time import monotonic
+
+
+class TTLCache:
+    """Bounded, thread-safe LRU mapping whose entries expire after `ttl` seconds.
+
+    A ttl of None keeps entries until they are evicted to make room for newer ones.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= monotonic():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = monotonic() + ttl if ttl is not None else None
+
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ResponseCache:
+    """Caches rendered response bodies of read endpoints.
+
+    Entries are addressed by a kind ('book', 'clubs', ...), an optional entity id
+    and the request arguments. Both the kind and every entity carry a generation
+    token that is part of the stored key, so invalidate() only has to replace a
+    token: invalidate('club', 5) drops every cached variant of club 5 and
+    invalidate('club') drops all of them, without enumerating keys.
+
+    The backend is any object with get/set/delete, a bounded in-memory TTLCache
+    by default. A shared one (e.g. a thin Redis wrapper) lets several workers
+    share entries and invalidations. A generation token that gets evicted is
+    simply replaced by a new one, which can only cause extra misses.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else TTLCache(maxsize=2048, ttl=300)
+        self.hits = 0
+        self.misses = 0
+
+    def _generation(self, scope):
+        key = ("generation",) + scope
+        generation = self.backend.get(key)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            self.backend.set(key, generation)
+        return generation
+
+    def _key(self, kind, id, args):
+        key = (kind, self._generation((kind,)), id)
+        if id is not None:
+            key += (self._generation((kind, id)),)
+        return key + (args,)
+
+    def get(self, kind, id=None, args=()):
+        value = self.backend.get(self._key(kind, id, args))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, kind, value, id=None, args=()):
+        self.backend.set(self._key(kind, id, args), value)
+
+    def invalidate(self, kind, id=None):
+        scope = (kind,) if id is None else (kind, id)
+        self.backend.set(("generation",) + scope, uuid.uuid4().hex)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "entries": len(self.backend) if hasattr(self.backend, "__len__") else None,
+        }
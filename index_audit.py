@@ -0,0 +1,233 @@
+import json
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+
+import click
+from flask_migrate import Migrate, upgrade
+from sqlalchemy import event
+
+from models import db, Book, BookClub, Message
+
+# `flask index-audit` migrates a scratch database, drives every route of create_app()
+# through the test client and runs each statement the handlers issued through EXPLAIN.
+# It fails when a plan reads a whole table instead of going through an index.
+#
+# Only a scratch database should be used: the walk registers a user, creates clubs,
+# books, messages and comments and deletes some of them again.
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Routes that never touch the database, or never return on their own
+NOT_AUDITED = {
+    'GET /clubs/<int:id>/stream': 'holds the connection open and only reads the broker',
+}
+
+AUDITED_STATEMENTS = re.compile(r'^\s*(SELECT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+
+
+def sqlite_scans(connection, statement, parameters):
+    # Full scans of real tables in SQLite's EXPLAIN QUERY PLAN output
+    tables = set(db.metadata.tables)
+    aliases = {alias: table for table, alias in re.findall(r'\b(\w+) AS (\w+)\b', statement) if table in tables}
+
+    plan = [row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+
+    # A scan without a WHERE clause that stops after LIMIT rows is a bounded first page, not a full scan,
+    # unless the rows have to be sorted first: then every row is read before the first one is returned
+    bounded = (
+        ' WHERE ' not in statement and ' LIMIT ' in statement
+        and not any('USE TEMP B-TREE FOR ORDER BY' in detail for detail in plan)
+    )
+
+    scans = []
+    for detail in plan:
+        match = re.match(r'SCAN (\w+)(?: AS (\w+))?', detail)
+        if not match or 'USING' in detail or 'VIRTUAL TABLE' in detail:
+            continue
+        table = aliases.get(match.group(1), match.group(1))
+        if table in tables and not bounded:
+            scans.append((table, detail))
+    return scans
+
+
+def postgres_scans(connection, statement, parameters):
+    # Sequential scans left in the plan even though the planner was told to avoid them,
+    # meaning there is no index it could use instead. Small scratch tables would
+    # otherwise always be scanned.
+    connection.exec_driver_sql('SET enable_seqscan = off')
+    plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+    connection.exec_driver_sql('RESET enable_seqscan')
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    scans = []
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        if node['Node Type'] == 'Seq Scan':
+            scans.append((node['Relation Name'], f"Seq Scan on {node['Relation Name']}"))
+        nodes.extend(node.get('Plans', []))
+    return scans
+
+
+@contextmanager
+def capture_statements(engine, captured):
+    # Collects (route, statement, parameters) for every statement run while `captured['route']` is set
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if captured['route'] and AUDITED_STATEMENTS.match(statement):
+            if executemany:
+                parameters = parameters[0]
+            captured['statements'].setdefault((captured['route'], statement), parameters)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def walk_routes(client, captured):
+    # Calls every route with real ids, reads before writes and deletes last.
+    # Returns the set of "METHOD rule" strings that were exercised.
+    exercised = set()
+
+    def call(method, rule, url, **kwargs):
+        captured['route'] = f'{method} {rule}'
+        response = client.open(url, method=method, headers=headers, **kwargs)
+        captured['route'] = None
+        if response.status_code >= 500:
+            raise click.ClickException(f'{method} {url} failed with {response.status_code}')
+        exercised.add(f'{method} {rule}')
+        return response
+
+    headers = {}
+    user = dict(username='index-audit', email='index-audit@example.com', first_name='Index', last_name='Audit', profile_pic=None, password='index-audit')
+    call('POST', '/register', '/register', json=user)
+    login = call('POST', '/login', '/login', json=dict(username=user['username'], password=user['password'])).get_json()
+    headers['Authorization'] = f"Bearer {login['access_token']}"
+    user_id = login['user_id']
+
+    call('POST', '/clubs', '/clubs', json=dict(name='Index Audit Club', location='Nowhere', description='Audit', creator_id=user_id))
+    call('POST', '/books', '/books', json=dict(title='Index Audit Book', author='Audit', description='Audit'))
+    call('POST', '/books/bulk', '/books/bulk', data='{"title": "Index Audit Bulk Book"}\n', content_type='application/x-ndjson')
+
+    club_id = db.session.query(db.func.max(BookClub.id)).scalar()
+    book_id = db.session.query(db.func.max(Book.id)).scalar()
+
+    call('POST', '/joinclub', '/joinclub', json=dict(club_id=club_id, user_id=user_id))
+    call('POST', '/joinclub', '/joinclub', json=dict(club_id=club_id, user_id=user_id))
+    call('POST', '/clubs/<int:id>/members', f'/clubs/{club_id}/members', json=dict(member_ids=[user_id]))
+    call('POST', '/currentbook', '/currentbook', json=dict(club_id=club_id, book_id=book_id))
+    call('POST', '/previousbooks', '/previousbooks', json=dict(club_id=club_id, book_id=book_id))
+    call('POST', '/bookcomments', '/bookcomments', json=dict(user_id=user_id, book_id=book_id, comment='Audit', rating=5))
+    call('POST', '/messages', '/messages', json=dict(sender_id=user_id, club_id=club_id, message='Audit'))
+
+    call('GET', '/', '/')
+    call('GET', '/profile/<string:username>', f"/profile/{user['username']}")
+    for rule in ('/clubs', '/books'):
+        first_page = call('GET', rule, f'{rule}?limit=1').get_json() or {}
+        if first_page.get('next'):
+            call('GET', rule, f"{rule}?limit=1&after={first_page['next']}")
+    call('GET', '/clubs/<int:id>', f'/clubs/{club_id}')
+    popular = call('GET', '/clubs/popular', '/clubs/popular?limit=1').get_json() or {}
+    if popular.get('next'):
+        call('GET', '/clubs/popular', f"/clubs/popular?limit=1&after={popular['next']}")
+    mine = call('GET', '/users/<int:id>/clubs', f'/users/{user_id}/clubs?limit=1').get_json() or {}
+    if mine.get('next'):
+        call('GET', '/users/<int:id>/clubs', f"/users/{user_id}/clubs?limit=1&after={mine['next']}")
+    messages = call('GET', '/clubs/<int:id>/messages', f'/clubs/{club_id}/messages?limit=1').get_json() or {}
+    if messages.get('next'):
+        call('GET', '/clubs/<int:id>/messages', f"/clubs/{club_id}/messages?limit=1&before={messages['next']}")
+    call('GET', '/clubs/<int:id>/poll', f'/clubs/{club_id}/poll')
+    call('GET', '/users/<int:id>/unread', f'/users/{user_id}/unread')
+    call('POST', '/clubs/<int:id>/read', f'/clubs/{club_id}/read', json={})
+    message_id = db.session.query(db.func.max(Message.id)).scalar()
+    call('POST', '/clubs/<int:id>/read', f'/clubs/{club_id}/read', json=dict(message_id=message_id))
+    call('GET', '/users/<int:id>/unread', f'/users/{user_id}/unread')
+    call('GET', '/books/<int:id>', f'/books/{book_id}')
+    call('GET', '/books/top', '/books/top')
+    call('GET', '/search', '/search?q=audit')
+    call('GET', '/search', '/search?q=audit&type=clubs')
+    call('GET', '/passwords/stats', '/passwords/stats')
+    call('GET', '/cache/stats', '/cache/stats')
+    call('GET', '/metrics', '/metrics')
+    call('POST', '/batch', '/batch', json=dict(requests=[
+        dict(path=f'/clubs/{club_id}'), dict(path=f'/books/{book_id}'), dict(path=f"/profile/{user['username']}"),
+    ]))
+
+    call('PATCH', '/profile/<string:username>', f"/profile/{user['username']}", json=dict(first_name='Audited'))
+    call('PATCH', '/clubs/<int:id>', f'/clubs/{club_id}', json=dict(description='Audited'))
+    call('PATCH', '/books/<int:id>', f'/books/{book_id}', json=dict(description='Audited'))
+
+    call('DELETE', '/currentbook/<int:id>', f'/currentbook/{club_id}')
+    call('DELETE', '/previousbooks/<int:id>', f'/previousbooks/{club_id}')
+    call('DELETE', '/books/<int:id>', f'/books/{book_id}')
+    call('DELETE', '/clubs/<int:id>/members', f'/clubs/{club_id}/members', json=dict(member_ids=[user_id]))
+    call('DELETE', '/clubs/<int:id>', f'/clubs/{club_id}')
+    call('DELETE', '/profile/<string:username>', f"/profile/{user['username']}")
+
+    return exercised
+
+
+@click.command('index-audit')
+@click.option('--database-url', default=None,
+              help='Scratch database to migrate and audit. Defaults to a temporary SQLite file.')
+def index_audit_command(database_url):
+    """Fail when a route's queries plan a full table scan."""
+    from app import create_app
+
+    scratch = None
+    if database_url is None:
+        scratch = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        scratch.close()
+        database_url = f'sqlite:///{scratch.name}'
+
+    previous_url = os.environ.get('DATABASE_URI')
+    os.environ['DATABASE_URI'] = database_url
+    try:
+        audit_app = create_app()
+    finally:
+        if previous_url is None:
+            del os.environ['DATABASE_URI']
+        else:
+            os.environ['DATABASE_URI'] = previous_url
+    Migrate(audit_app, db, directory=MIGRATIONS)
+
+    captured = {'route': None, 'statements': {}}
+    try:
+        with audit_app.app_context():
+            upgrade(directory=MIGRATIONS)
+
+            with capture_statements(db.engine, captured):
+                exercised = walk_routes(audit_app.test_client(), captured)
+
+            explain = postgres_scans if db.engine.dialect.name == 'postgresql' else sqlite_scans
+            failures = []
+            with db.engine.connect() as connection:
+                for (route, statement), parameters in captured['statements'].items():
+                    for table, detail in explain(connection, statement, parameters):
+                        failures.append((route, table, detail, statement))
+            db.session.remove()
+            db.engine.dispose()
+    finally:
+        if scratch is not None:
+            os.unlink(scratch.name)
+
+    routes = {
+        f'{method} {rule.rule}'
+        for rule in audit_app.url_map.iter_rules() if rule.endpoint != 'static'
+        for method in rule.methods - {'HEAD', 'OPTIONS'}
+    }
+    for route in sorted(routes - exercised - set(NOT_AUDITED)):
+        click.echo(f'NOT EXERCISED  {route}')
+
+    for route, table, detail, statement in failures:
+        click.echo(f'FULL SCAN  {route}  {table}: {detail}\n    {" ".join(statement.split())}')
+
+    click.echo(f'{len(captured["statements"])} statements from {len(exercised)} routes, {len(failures)} full scans')
+
+    if failures or routes - exercised - set(NOT_AUDITED):
+        raise SystemExit(1)
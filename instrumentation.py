@@ -0,0 +1,220 @@
+import bisect
+import contextvars
+import logging
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("story_circle.sql")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Per-request state lives in the WSGI environ rather than on g, which belongs to the app context,
+# so requests dispatched inside another one (POST /batch) are measured on their own
+STATE_KEY = "story_circle.metrics"
+
+# State of a request measured outside Flask, see RequestMetrics.measure. Context variables follow
+# the async handlers into the greenlets their database calls run in
+current_state = contextvars.ContextVar("story_circle_metrics", default=None)
+
+
+class Histogram:
+    # Cumulative Prometheus-style histogram. Not locked, RequestMetrics holds its lock around updates
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            yield f"{name}_bucket", dict(labels, le=format_value(bound)), cumulative
+        yield f"{name}_sum", labels, self.sum
+        yield f"{name}_count", labels, self.count
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+class RequestMetrics:
+    """Per-endpoint request latency, SQL statement counts and database time.
+
+    init_app() times every request of an app, and engine events on every Engine
+    count the statements a request runs and the time spent in them. Statements
+    slower than `slow_query_ms` are logged with the route that issued them.
+    Endpoints are labelled by their URL rule (/clubs/<int:id>), never by the
+    concrete path, so the number of series stays bounded.
+
+    render() returns the Prometheus text format. Other components add their own
+    gauges through add_collector(). Requests that are not served by Flask (the
+    async handlers in asgi.py) are recorded through measure().
+    """
+
+    def __init__(self, slow_query_ms=None):
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._latency = {}
+        self._statements = {}
+        self._db_time = {}
+        self._slow_queries = {}
+        self._collectors = []
+        self._listening = False
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+        if not self._listening:
+            event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+            self._listening = True
+
+    def add_collector(self, collect):
+        # collect() returns (name, type, help, [(labels, value), ...]) tuples
+        self._collectors.append(collect)
+
+    @staticmethod
+    def _new_state():
+        return {"started": perf_counter(), "statements": 0, "db_time": 0.0, "status": None}
+
+    @contextmanager
+    def measure(self, method, route):
+        # Times the block as a request to `route`. The caller sets the yielded state's "status",
+        # the block counts as a 500 when it raises or leaves it unset
+        state = dict(self._new_state(), method=method, route=route)
+        token = current_state.set(state)
+        try:
+            yield state
+        finally:
+            current_state.reset(token)
+            self._observe(method, route, state["status"] or 500, state)
+
+    def _before_request(self):
+        request.environ[STATE_KEY] = self._new_state()
+
+    def _after_request(self, response):
+        state = request.environ.get(STATE_KEY)
+        if state is not None:
+            state["status"] = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        state = request.environ.pop(STATE_KEY, None)
+        if state is None:
+            return
+
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        status = 500 if exc is not None else state["status"] or 500
+        self._observe(request.method, route, status, state)
+
+    def _observe(self, method, route, status, state):
+        elapsed = perf_counter() - state["started"]
+        key = (method, route)
+
+        with self._lock:
+            self._requests[key + (str(status),)] = self._requests.get(key + (str(status),), 0) + 1
+            self._histogram(self._latency, key, LATENCY_BUCKETS).observe(elapsed)
+            self._histogram(self._statements, key, STATEMENT_BUCKETS).observe(state["statements"])
+            self._histogram(self._db_time, key, LATENCY_BUCKETS).observe(state["db_time"])
+
+    @staticmethod
+    def _histogram(histograms, key, buckets):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(buckets)
+        return histogram
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Kept on the execution context, so a failed statement leaves nothing behind
+        if context is not None:
+            context._query_started = perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_query_started", None)
+        if started is None:
+            return
+        elapsed = perf_counter() - started
+
+        method, route, state = "-", "-", None
+        if has_request_context() and STATE_KEY in request.environ:
+            method = request.method
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            state = request.environ[STATE_KEY]
+        elif current_state.get() is not None:
+            # Includes the token checks asgi.py runs in a bare Flask request context
+            state = current_state.get()
+            method, route = state["method"], state["route"]
+        elif has_request_context():
+            method = request.method
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+
+        if state is not None:
+            state["statements"] += 1
+            state["db_time"] += elapsed
+
+        if self.slow_query_ms is not None and elapsed * 1000 >= self.slow_query_ms:
+            with self._lock:
+                self._slow_queries[(method, route)] = self._slow_queries.get((method, route), 0) + 1
+            logger.warning("Slow query (%.1f ms) on %s %s: %s", elapsed * 1000, method, route, " ".join(statement.split()))
+
+    def render(self):
+        lines = []
+
+        def family(name, kind, help, samples):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{format_labels(labels)} {format_value(value)}")
+
+        def histograms(name, help, by_route):
+            family(name, "histogram", help, (
+                sample
+                for (method, route), histogram in sorted(by_route.items())
+                for sample in histogram.samples(name, {"method": method, "route": route})
+            ))
+
+        with self._lock:
+            family("http_requests_total", "counter", "Requests handled, by route and status.", (
+                ("http_requests_total", {"method": method, "route": route, "status": status}, count)
+                for (method, route, status), count in sorted(self._requests.items())
+            ))
+            histograms("http_request_duration_seconds", "Time from the start of a request to its teardown.", self._latency)
+            histograms("http_request_sql_statements", "SQL statements executed per request.", self._statements)
+            histograms("http_request_db_seconds", "Time per request spent executing SQL statements.", self._db_time)
+            family("sql_slow_queries_total", "counter", f"Statements slower than {self.slow_query_ms} ms, by route.", (
+                ("sql_slow_queries_total", {"method": method, "route": route}, count)
+                for (method, route), count in sorted(self._slow_queries.items())
+            ))
+
+        for collect in self._collectors:
+            for name, kind, help, samples in collect():
+                family(name, kind, help, ((name, labels, value) for labels, value in samples))
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,39 @@
+"""Message archive
+
+Revision ID: 19842281f788
+Revises: 607e687211d4
+Create Date: 2026-10-18 16:20:13.504417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '19842281f788'
+down_revision = '607e687211d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('messages_archive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('club_id', sa.Integer(), nullable=True),
+    sa.Column('first_id', sa.Integer(), nullable=False),
+    sa.Column('first_created_at', sa.DateTime(), nullable=False),
+    sa.Column('last_id', sa.Integer(), nullable=False),
+    sa.Column('last_created_at', sa.DateTime(), nullable=False),
+    sa.Column('message_count', sa.Integer(), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.ForeignKeyConstraint(['club_id'], ['bookclubs.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_messages_archive_club_id_last_created_at_last_id', 'messages_archive', ['club_id', 'last_created_at', 'last_id'], unique=False)
+
+
+def downgrade():
+    # Archived messages are lost, run it after moving them back if they are still needed
+    op.drop_index('ix_messages_archive_club_id_last_created_at_last_id', table_name='messages_archive')
+    op.drop_table('messages_archive')
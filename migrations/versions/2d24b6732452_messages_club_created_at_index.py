@@ -0,0 +1,24 @@
+"""Messages club created_at index
+
+Revision ID: 2d24b6732452
+Revises: 9b9ff4eb66eb
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d24b6732452'
+down_revision = '9b9ff4eb66eb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_messages_club_id_created_at_id', 'messages', ['club_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_messages_club_id_created_at_id', table_name='messages')
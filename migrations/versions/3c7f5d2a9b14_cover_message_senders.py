@@ -0,0 +1,28 @@
+"""Cover message senders
+
+Revision ID: 3c7f5d2a9b14
+Revises: ea0a931c44f0
+Create Date: 2026-10-18 18:32:07.415238
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c7f5d2a9b14'
+down_revision = 'ea0a931c44f0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # sender_id is appended so unread counts never read the messages table itself. The new index
+    # serves every seek the old one did, it is built before the old one is dropped
+    op.create_index('ix_messages_club_id_created_at_id_sender_id', 'messages', ['club_id', 'created_at', 'id', 'sender_id'], unique=False)
+    op.drop_index('ix_messages_club_id_created_at_id', table_name='messages')
+
+
+def downgrade():
+    op.create_index('ix_messages_club_id_created_at_id', 'messages', ['club_id', 'created_at', 'id'], unique=False)
+    op.drop_index('ix_messages_club_id_created_at_id_sender_id', table_name='messages')
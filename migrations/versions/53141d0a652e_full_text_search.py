@@ -0,0 +1,77 @@
+"""Full text search
+
+Revision ID: 53141d0a652e
+Revises: e25f1ee6fbda
+Create Date: 2026-10-18 12:02:44.390118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '53141d0a652e'
+down_revision = 'e25f1ee6fbda'
+branch_labels = None
+depends_on = None
+
+
+# table -> indexed text columns, in ranking weight order
+SEARCHED = {
+    'books': ('title', 'author', 'description'),
+    'bookclubs': ('name', 'location', 'description'),
+}
+
+
+def tsvector(columns):
+    weights = ('A', 'B', 'C')
+    return ' || '.join(
+        f"setweight(to_tsvector('english', coalesce({column}, '')), '{weight}')"
+        for column, weight in zip(columns, weights)
+    )
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+
+    for table, columns in SEARCHED.items():
+        if dialect == 'postgresql':
+            op.execute(f"CREATE INDEX ix_{table}_search ON {table} USING gin (({tsvector(columns)}))")
+            continue
+
+        names = ', '.join(columns)
+        new_values = ', '.join(f'new.{column}' for column in columns)
+        old_values = ', '.join(f'old.{column}' for column in columns)
+
+        op.execute(f"CREATE VIRTUAL TABLE {table}_fts USING fts5({names}, content='{table}', content_rowid='id', prefix='2 3 4')")
+        op.execute(f"""
+            CREATE TRIGGER {table}_fts_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {table}_fts(rowid, {names}) VALUES (new.id, {new_values});
+            END
+        """)
+        op.execute(f"""
+            CREATE TRIGGER {table}_fts_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {table}_fts({table}_fts, rowid, {names}) VALUES ('delete', old.id, {old_values});
+            END
+        """)
+        op.execute(f"""
+            CREATE TRIGGER {table}_fts_update AFTER UPDATE OF {names} ON {table} BEGIN
+                INSERT INTO {table}_fts({table}_fts, rowid, {names}) VALUES ('delete', old.id, {old_values});
+                INSERT INTO {table}_fts(rowid, {names}) VALUES (new.id, {new_values});
+            END
+        """)
+        op.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+
+    for table in SEARCHED:
+        if dialect == 'postgresql':
+            op.execute(f"DROP INDEX ix_{table}_search")
+            continue
+
+        op.execute(f"DROP TRIGGER {table}_fts_update")
+        op.execute(f"DROP TRIGGER {table}_fts_delete")
+        op.execute(f"DROP TRIGGER {table}_fts_insert")
+        op.execute(f"DROP TABLE {table}_fts")
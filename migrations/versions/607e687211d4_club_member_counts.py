@@ -0,0 +1,42 @@
+"""Club member counts
+
+Revision ID: 607e687211d4
+Revises: 7a46eff16154
+Create Date: 2026-10-18 15:02:41.236918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '607e687211d4'
+down_revision = '7a46eff16154'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('bookclubs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('member_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill from the existing memberships, `flask repair-member-counts` does the same later on
+    op.execute("""
+        UPDATE bookclubs SET
+            member_count = (SELECT COUNT(*) FROM club_members WHERE club_id = bookclubs.id AND member_id IS NOT NULL)
+    """)
+
+    op.create_index('ix_bookclubs_member_count_id', 'bookclubs', ['member_count', 'id'], unique=False)
+
+    # The composite index also serves every lookup the single column one did
+    op.create_index('ix_club_members_member_id_club_id', 'club_members', ['member_id', 'club_id'], unique=False)
+    op.drop_index('ix_club_members_member_id', table_name='club_members')
+
+
+def downgrade():
+    op.create_index('ix_club_members_member_id', 'club_members', ['member_id'], unique=False)
+    op.drop_index('ix_club_members_member_id_club_id', table_name='club_members')
+    op.drop_index('ix_bookclubs_member_count_id', table_name='bookclubs')
+
+    with op.batch_alter_table('bookclubs', schema=None) as batch_op:
+        batch_op.drop_column('member_count')
@@ -0,0 +1,41 @@
+"""Foreign key indexes
+
+Revision ID: 7a46eff16154
+Revises: 53141d0a652e
+Create Date: 2026-10-18 13:20:07.512846
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a46eff16154'
+down_revision = '53141d0a652e'
+branch_labels = None
+depends_on = None
+
+
+# messages.club_id is already the leading column of ix_messages_club_id_created_at_id
+INDEXES = (
+    ('ix_bookclubs_creator_id', 'bookclubs', ['creator_id']),
+    ('ix_club_members_club_id_member_id', 'club_members', ['club_id', 'member_id']),
+    ('ix_club_members_member_id', 'club_members', ['member_id']),
+    ('ix_current_books_club_id', 'current_books', ['club_id']),
+    ('ix_current_books_book_id', 'current_books', ['book_id']),
+    ('ix_previously_read_books_club_id', 'previously_read_books', ['club_id']),
+    ('ix_previously_read_books_book_id', 'previously_read_books', ['book_id']),
+    ('ix_book_comments_book_id', 'book_comments', ['book_id']),
+    ('ix_book_comments_user_id', 'book_comments', ['user_id']),
+    ('ix_messages_sender_id', 'messages', ['sender_id']),
+)
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,37 @@
+"""Club read cursors
+
+Revision ID: 8abaa88443ac
+Revises: 19842281f788
+Create Date: 2026-10-18 17:05:48.119204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8abaa88443ac'
+down_revision = '19842281f788'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('club_read_cursors',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('member_id', sa.Integer(), nullable=False),
+    sa.Column('club_id', sa.Integer(), nullable=False),
+    sa.Column('last_read_id', sa.Integer(), nullable=False),
+    sa.Column('last_read_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.ForeignKeyConstraint(['club_id'], ['bookclubs.id'], ),
+    sa.ForeignKeyConstraint(['member_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('member_id', 'club_id', name='uq_club_read_cursors_member_id_club_id')
+    )
+    op.create_index('ix_club_read_cursors_club_id', 'club_read_cursors', ['club_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_club_read_cursors_club_id', table_name='club_read_cursors')
+    op.drop_table('club_read_cursors')
@@ -0,0 +1,28 @@
+"""Profile pic verification
+
+Revision ID: d186628cea11
+Revises: 2d24b6732452
+Create Date: 2026-10-18 10:03:17.502791
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd186628cea11'
+down_revision = '2d24b6732452'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('pending_profile_pic', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('profile_pic_status', sa.String(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('profile_pic_status')
+        batch_op.drop_column('pending_profile_pic')
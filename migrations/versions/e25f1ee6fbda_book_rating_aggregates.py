@@ -0,0 +1,57 @@
+"""Book rating aggregates
+
+Revision ID: e25f1ee6fbda
+Revises: e60eac635f67
+Create Date: 2026-10-18 11:20:05.613447
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e25f1ee6fbda'
+down_revision = 'e60eac635f67'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('rating_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('rating_avg', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('rating_1', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('rating_2', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('rating_3', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('rating_4', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('rating_5', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill from the existing comments, `flask repair-ratings` does the same later on
+    op.execute("""
+        UPDATE books SET
+            rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM book_comments WHERE book_id = books.id),
+            rating_count = (SELECT COUNT(*) FROM book_comments WHERE book_id = books.id),
+            rating_avg = (SELECT AVG(rating * 1.0) FROM book_comments WHERE book_id = books.id),
+            rating_1 = (SELECT COUNT(*) FROM book_comments WHERE book_id = books.id AND rating = 1),
+            rating_2 = (SELECT COUNT(*) FROM book_comments WHERE book_id = books.id AND rating = 2),
+            rating_3 = (SELECT COUNT(*) FROM book_comments WHERE book_id = books.id AND rating = 3),
+            rating_4 = (SELECT COUNT(*) FROM book_comments WHERE book_id = books.id AND rating = 4),
+            rating_5 = (SELECT COUNT(*) FROM book_comments WHERE book_id = books.id AND rating = 5)
+    """)
+
+    op.create_index('ix_books_rating_avg_rating_count', 'books', ['rating_avg', 'rating_count'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_books_rating_avg_rating_count', table_name='books')
+
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.drop_column('rating_5')
+        batch_op.drop_column('rating_4')
+        batch_op.drop_column('rating_3')
+        batch_op.drop_column('rating_2')
+        batch_op.drop_column('rating_1')
+        batch_op.drop_column('rating_avg')
+        batch_op.drop_column('rating_count')
+        batch_op.drop_column('rating_sum')
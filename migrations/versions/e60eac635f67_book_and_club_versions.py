@@ -0,0 +1,32 @@
+"""Book and club versions
+
+Revision ID: e60eac635f67
+Revises: d186628cea11
+Create Date: 2026-10-18 10:41:52.884310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e60eac635f67'
+down_revision = 'd186628cea11'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('bookclubs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.drop_column('version')
+
+    with op.batch_alter_table('bookclubs', schema=None) as batch_op:
+        batch_op.drop_column('version')
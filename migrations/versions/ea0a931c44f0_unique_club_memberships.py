@@ -0,0 +1,53 @@
+"""Unique club memberships
+
+Revision ID: ea0a931c44f0
+Revises: 8abaa88443ac
+Create Date: 2026-10-18 17:48:30.662051
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ea0a931c44f0'
+down_revision = '8abaa88443ac'
+branch_labels = None
+depends_on = None
+
+# Duplicates are deleted one range of this many club_members ids per transaction
+BATCH_SIZE = 5000
+
+
+def upgrade():
+    bind = op.get_bind()
+    last_id = bind.execute(sa.text("SELECT MAX(id) FROM club_members")).scalar() or 0
+
+    # Keeps the oldest row of every (club_id, member_id) pair. Each batch commits on its own so
+    # joins are not held up for the whole table, the EXISTS is a seek on ix_club_members_club_id_member_id
+    with op.get_context().autocommit_block():
+        for start in range(0, last_id + 1, BATCH_SIZE):
+            bind.execute(sa.text("""
+                DELETE FROM club_members
+                WHERE id > :start AND id <= :stop AND EXISTS (
+                    SELECT 1 FROM club_members AS kept
+                    WHERE kept.club_id = club_members.club_id
+                      AND kept.member_id = club_members.member_id
+                      AND kept.id < club_members.id
+                )
+            """), dict(start=start, stop=start + BATCH_SIZE))
+
+    # The duplicates were counted too
+    op.execute("""
+        UPDATE bookclubs SET
+            member_count = (SELECT COUNT(*) FROM club_members WHERE club_id = bookclubs.id AND member_id IS NOT NULL)
+    """)
+
+    op.drop_index('ix_club_members_club_id_member_id', table_name='club_members')
+    op.create_index('ix_club_members_club_id_member_id', 'club_members', ['club_id', 'member_id'], unique=True)
+
+
+def downgrade():
+    # Removed duplicates are not restored
+    op.drop_index('ix_club_members_club_id_member_id', table_name='club_members')
+    op.create_index('ix_club_members_club_id_member_id', 'club_members', ['club_id', 'member_id'], unique=False)
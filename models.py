@@ -2,7 +2,10 @@ from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import validates
 from werkzeug.security import generate_password_hash, check_password_hash
 
-db = SQLAlchemy()
+from replicas import RoutingSession
+
+# RoutingSession lets GET requests read from a replica, see replicas.ReplicaRouter
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 # creating instance class user
 class User(db.Model):
@@ -15,9 +18,14 @@ class User(db.Model):
     first_name = db.Column(db.String)
     last_name = db.Column(db.String)
     profile_pic = db.Column(db.String, nullable=True)
+    # A new profile picture waits in pending_profile_pic until its URL has been verified,
+    # profile_pic_status is 'pending', 'valid' or 'invalid' for the last submitted URL
+    pending_profile_pic = db.Column(db.String, nullable=True)
+    profile_pic_status = db.Column(db.String, nullable=True)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     updated_at = db.Column(db.DateTime, onupdate=db.func.now())
 
+    # Request handlers hash through app.password_executor, these are for scripts and the shell
     def set_password(self, password):
         self.password = generate_password_hash(password)
 
@@ -32,12 +40,20 @@ class User(db.Model):
 
 class BookClub(db.Model):
     __tablename__ = 'bookclubs'
+    __table_args__ = (
+        # Serves the most popular clubs first, see PopularClubs
+        db.Index('ix_bookclubs_member_count_id', 'member_count', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, unique=True, nullable=False)
     location = db.Column(db.String, nullable=False)
     description = db.Column(db.String, nullable=False)
-    creator_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    creator_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    # Bumped by every write that changes the club page, used for ETags
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # club_members rows with a member, kept up to date by JoinClub and Profile.delete
+    member_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     updated_at = db.Column(db.DateTime, onupdate=db.func.now())
 
@@ -45,6 +61,12 @@ class BookClub(db.Model):
 
 class ClubMember(db.Model):
     __tablename__ = 'club_members'
+    __table_args__ = (
+        # A user is a member of a club once, JoinClub inserts with ON CONFLICT DO NOTHING
+        db.Index('ix_club_members_club_id_member_id', 'club_id', 'member_id', unique=True),
+        # A user's clubs in club order, see UserClubs
+        db.Index('ix_club_members_member_id_club_id', 'member_id', 'club_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     club_id = db.Column(db.Integer, db.ForeignKey('bookclubs.id'))
@@ -53,6 +75,22 @@ class ClubMember(db.Model):
     member = db.relationship('User', backref=db.backref('club_members', lazy=True))
     club = db.relationship('BookClub', backref=db.backref('club_members', lazy=True))
 
+class ClubReadCursor(db.Model):
+    # How far a member has read a club: the (created_at, id) of the newest message they have seen.
+    # Not a foreign key to messages, archiving moves messages out of that table
+    __tablename__ = 'club_read_cursors'
+    __table_args__ = (
+        # One cursor per member and club, also serves a member's unread counts
+        db.UniqueConstraint('member_id', 'club_id', name='uq_club_read_cursors_member_id_club_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    member_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    club_id = db.Column(db.Integer, db.ForeignKey('bookclubs.id'), nullable=False, index=True)
+    last_read_id = db.Column(db.Integer, nullable=False)
+    last_read_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
+
 class Book(db.Model):
     __tablename__ = 'books'
 
@@ -60,14 +98,34 @@ class Book(db.Model):
     title = db.Column(db.String, unique=True, nullable=False)
     author = db.Column(db.String)
     description = db.Column(db.String)
+    # Bumped by every write that changes the book page, used for ETags
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Rating aggregates maintained by AddBookComment, `flask repair-ratings` rebuilds them
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_avg = db.Column(db.Float, nullable=True)
+    rating_1 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_2 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_3 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_4 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_5 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, server_default=db.func.now())
 
+    __table_args__ = (
+        # Serves the top-rated listing without scanning book_comments
+        db.Index('ix_books_rating_avg_rating_count', 'rating_avg', 'rating_count'),
+    )
+
+    @classmethod
+    def rating_columns(cls):
+        return {1: cls.rating_1, 2: cls.rating_2, 3: cls.rating_3, 4: cls.rating_4, 5: cls.rating_5}
+
 class CurrentBook(db.Model):
     __tablename__ = 'current_books'
 
     id = db.Column(db.Integer, primary_key=True)
-    club_id = db.Column(db.Integer, db.ForeignKey('bookclubs.id'))
-    book_id = db.Column(db.Integer, db.ForeignKey('books.id'))
+    club_id = db.Column(db.Integer, db.ForeignKey('bookclubs.id'), index=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), index=True)
 
     book = db.relationship('Book', backref=db.backref('current_books', lazy=True))
     club = db.relationship('BookClub', backref=db.backref('current_books', lazy=True))
@@ -76,8 +134,8 @@ class PrevioislyReadBook(db.Model):
     __tablename__ = 'previously_read_books'
 
     id = db.Column(db.Integer, primary_key=True)
-    club_id = db.Column(db.Integer, db.ForeignKey('bookclubs.id'))
-    book_id = db.Column(db.Integer, db.ForeignKey('books.id'))
+    club_id = db.Column(db.Integer, db.ForeignKey('bookclubs.id'), index=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), index=True)
 
     book = db.relationship('Book', backref=db.backref('previously_read_books', lazy=True))
     club = db.relationship('BookClub', backref=db.backref('previously_read_books', lazy=True))
@@ -86,8 +144,8 @@ class BookComment(db.Model):
     __tablename__ = 'book_comments'
 
     id = db.Column(db.Integer, primary_key=True)
-    book_id = db.Column(db.Integer, db.ForeignKey('books.id'))
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id')) 
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
     comment = db.Column(db.String, nullable=False)
     rating = db.Column(db.Integer, nullable=False)
 
@@ -102,10 +160,14 @@ class BookComment(db.Model):
 
 class Message(db.Model):
     __tablename__ = 'messages'
+    __table_args__ = (
+        # Serves newest-first keyset seeks over a club's history, and covers unread counts
+        db.Index('ix_messages_club_id_created_at_id_sender_id', 'club_id', 'created_at', 'id', 'sender_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     club_id = db.Column(db.Integer, db.ForeignKey('bookclubs.id'))
-    sender_id = db.Column(db.Integer, db.ForeignKey('users.id')) 
+    sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
     message = db.Column(db.String, nullable=False)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     updated_at = db.Column(db.DateTime, onupdate=db.func.now())
@@ -113,17 +175,21 @@ class Message(db.Model):
     sender = db.relationship('User', backref=db.backref('messages', lazy=True)) 
     club = db.relationship('BookClub', backref=db.backref('messages', lazy=True))
 
+class MessageArchive(db.Model):
+    # Chat history moved out of messages by `flask archive-messages`, see archive.py. Each row is a
+    # compressed chunk of one club's consecutive messages, oldest first
+    __tablename__ = 'messages_archive'
+    __table_args__ = (
+        # Serves newest-first walks over a club's chunks
+        db.Index('ix_messages_archive_club_id_last_created_at_last_id', 'club_id', 'last_created_at', 'last_id'),
+    )
 
-
-
-
-
-
-
-
-
-
-
-
-
-
+    id = db.Column(db.Integer, primary_key=True)
+    club_id = db.Column(db.Integer, db.ForeignKey('bookclubs.id'))
+    first_id = db.Column(db.Integer, nullable=False)
+    first_created_at = db.Column(db.DateTime, nullable=False)
+    last_id = db.Column(db.Integer, nullable=False)
+    last_created_at = db.Column(db.DateTime, nullable=False)
+    message_count = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
@@ -0,0 +1,77 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class ExecutorSaturated(Exception):
+    pass
+
+
+class PasswordExecutor:
+    """Runs password hashing and verification on a dedicated, bounded thread pool.
+
+    Hashing is deliberately expensive, so at most `max_workers` hashes run at once
+    and at most `max_queue` more may wait for a worker. Anything beyond that is
+    rejected immediately with ExecutorSaturated instead of tying up the web worker,
+    which keeps a burst of logins from starving the rest of the API.
+    """
+
+    def __init__(self, max_workers=2, max_queue=16, method="scrypt"):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.method = method
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="passwords")
+        self._lock = threading.Lock()
+        self._prefix = None
+        self.submitted = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _call(self, fn, args):
+        with self._lock:
+            self.active += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+            self._slots.release()
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise ExecutorSaturated()
+
+        with self._lock:
+            self.submitted += 1
+        return self._executor.submit(self._call, fn, args).result()
+
+    def hash(self, password):
+        return self.run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self.run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        # True when the hash was made with other parameters than the configured method,
+        # compared against the exact prefix this Werkzeug version produces for it
+        if self._prefix is None:
+            self._prefix = generate_password_hash("", self.method).split("$", 1)[0]
+        return pwhash.split("$", 1)[0] != self._prefix
+
+    def stats(self):
+        with self._lock:
+            in_flight = self.submitted - self.completed
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "active": self.active,
+                "queued": in_flight - self.active,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
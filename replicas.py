@@ -0,0 +1,139 @@
+import random
+
+from flask import request
+from flask_jwt_extended import decode_token, get_jwt_identity, verify_jwt_in_request
+from flask_sqlalchemy.session import Session
+
+from cache import TTLCache
+
+# Replica engines are ordinary Flask-SQLAlchemy binds named replica_0, replica_1, ...
+REPLICA_BIND_PREFIX = "replica_"
+
+SAFE_METHODS = ("GET", "HEAD")
+
+
+def replica_binds(uris):
+    # SQLALCHEMY_BINDS entries for a comma separated list of replica URIs
+    uris = [uri.strip() for uri in (uris or "").split(",") if uri.strip()]
+    return {f"{REPLICA_BIND_PREFIX}{i}": uri for i, uri in enumerate(uris)}
+
+
+class RoutingSession(Session):
+    """Session that can send the reads of a request to a read replica.
+
+    ReplicaRouter puts the bind key of the replica a request should read from in
+    session.info["replica"]. Statements then run on that replica, except flushes and
+    INSERT/UPDATE/DELETE statements, which always go to the primary. Without a
+    replica in session.info (writes, CLI commands, background threads) everything
+    goes to the primary as before.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get("replica")
+
+        if replica is not None and bind is None and not self._flushing and not getattr(clause, "is_dml", False):
+            engine = self._db.engines.get(replica)
+            if engine is not None:
+                return engine
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    """Routes GET and HEAD requests to a read replica, with read-your-writes stickiness.
+
+    Each safe request reads from one randomly chosen replica bind. After a write
+    request succeeds its caller reads from the primary for `sticky_seconds`, which
+    should be longer than the replicas normally lag. That way people see their own
+    messages, comments and joins right away while everybody else's reads stay on the
+    replicas. Callers are recognised by the identity of their access token only, as
+    many people can share an address. A write without a token (logging in) makes the
+    identity of the token it returns sticky instead, so people who just logged in read
+    their account from the primary. Registering alone is not sticky, a login follows it.
+
+    Requests to `dispatch_endpoints` (POST /batch) only run other requests, which are
+    routed one by one, so they are left alone.
+
+    Writes served outside Flask (asgi.py) call stick() themselves.
+
+    Stickiness lives in a per-process TTLCache by default. Any backend with
+    get(key) and set(key, value, ttl) (e.g. a thin Redis wrapper) makes it hold
+    across workers.
+    """
+
+    def __init__(self, db, sticky_seconds=5, backend=None, dispatch_endpoints=()):
+        self.db = db
+        self.sticky_seconds = sticky_seconds
+        self.dispatch_endpoints = set(dispatch_endpoints)
+        self.backend = backend if backend is not None else TTLCache(maxsize=65536, ttl=sticky_seconds)
+        self.routed = {"replica": 0, "primary": 0, "sticky": 0}
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def replicas(self):
+        return sorted(key for key in self.db.engines if key and key.startswith(REPLICA_BIND_PREFIX))
+
+    @staticmethod
+    def caller():
+        # Identity of the request's access token, None without a valid one. The view checks
+        # the token again and answers for it, a bad token only means no stickiness here
+        try:
+            verify_jwt_in_request(optional=True)
+            return get_jwt_identity()
+        except Exception:
+            return None
+
+    @staticmethod
+    def issued_to(response):
+        # Identity of the access token a response hands out, e.g. a login's
+        if not response.is_json or response.is_streamed:
+            return None
+        body = response.get_json(silent=True)
+        if not isinstance(body, dict) or not body.get("access_token"):
+            return None
+        try:
+            return decode_token(body["access_token"])["sub"]
+        except Exception:
+            return None
+
+    @staticmethod
+    def sticky_key(identity):
+        return f"sticky:{identity}"
+
+    def is_sticky(self, identity):
+        return identity is not None and bool(self.backend.get(self.sticky_key(identity)))
+
+    def stick(self, identity):
+        # Sends `identity`'s reads to the primary for sticky_seconds, after a write of theirs
+        self.backend.set(self.sticky_key(identity), True, self.sticky_seconds)
+
+    def _before_request(self):
+        if request.endpoint in self.dispatch_endpoints:
+            return
+
+        session = self.db.session()
+        session.info.pop("replica", None)
+
+        replicas = self.replicas()
+        if not replicas:
+            return
+
+        if request.method not in SAFE_METHODS:
+            self.routed["primary"] += 1
+        elif self.is_sticky(self.caller()):
+            self.routed["sticky"] += 1
+        else:
+            self.routed["replica"] += 1
+            session.info["replica"] = random.choice(replicas)
+
+    def _after_request(self, response):
+        if request.endpoint in self.dispatch_endpoints:
+            return response
+
+        if request.method not in SAFE_METHODS and response.status_code < 400 and self.replicas():
+            identity = self.caller() or self.issued_to(response)
+            if identity is not None:
+                self.stick(identity)
+        return response
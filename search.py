@@ -0,0 +1,84 @@
+import re
+
+from sqlalchemy import text
+
+# Full-text search over books and book clubs.
+#
+# SQLite uses FTS5 tables (books_fts, bookclubs_fts) with the base tables as external
+# content, kept in sync by triggers and with prefix indexes for type-ahead queries.
+# Postgres uses weighted tsvector expressions with a GIN index on exactly the same
+# expression, so there is nothing to keep in sync. Both are created by the
+# "full text search" migration.
+#
+# Ranking has to score every match, which is fine for selective queries but not for a
+# term that appears in half the catalog. Queries matching more than RANK_LIMIT rows are
+# therefore returned newest first, which the index can answer without scoring.
+RANK_LIMIT = 5000
+
+BOOKS_TSVECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(author, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')"
+)
+
+BOOKCLUBS_TSVECTOR = (
+    "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(location, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')"
+)
+
+TABLES = {
+    "books": ("books", ("id", "title", "author", "description"), BOOKS_TSVECTOR),
+    "clubs": ("bookclubs", ("id", "name", "location", "description"), BOOKCLUBS_TSVECTOR),
+}
+
+
+def fts5_query(terms):
+    # Every word must match, the last one as a prefix so results follow what is being typed.
+    # Words are quoted so FTS5 operators in user input are taken literally
+    words = re.findall(r"\w+", terms)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words) + "*"
+
+
+def sqlite_statements(table, columns):
+    selected = ", ".join(f"{table}.{column}" for column in columns)
+    source = f"FROM {table}_fts JOIN {table} ON {table}.id = {table}_fts.rowid WHERE {table}_fts MATCH :query"
+    return (
+        f"SELECT 1 FROM {table}_fts WHERE {table}_fts MATCH :query LIMIT 1 OFFSET {RANK_LIMIT}",
+        f"SELECT {selected} {source} ORDER BY bm25({table}_fts, 10.0, 5.0, 1.0), {table}.id LIMIT :limit OFFSET :offset",
+        f"SELECT {selected} {source} ORDER BY {table}_fts.rowid DESC LIMIT :limit OFFSET :offset",
+    )
+
+
+def postgres_statements(table, columns, tsvector):
+    selected = ", ".join(columns)
+    source = f"FROM {table}, plainto_tsquery('english', :query) AS query WHERE ({tsvector}) @@ query"
+    return (
+        f"SELECT 1 {source} LIMIT 1 OFFSET {RANK_LIMIT}",
+        f"SELECT {selected} {source} ORDER BY ts_rank({tsvector}, query) DESC, id LIMIT :limit OFFSET :offset",
+        f"SELECT {selected} {source} ORDER BY id DESC LIMIT :limit OFFSET :offset",
+    )
+
+
+def search(session, kind, terms, limit, offset=0):
+    # Returns up to `limit` rows of `kind` ('books' or 'clubs') as dicts, best match first
+    table, columns, tsvector = TABLES[kind]
+
+    if session.get_bind().dialect.name == "postgresql":
+        query = terms if re.search(r"\w", terms) else None
+        broad, ranked, recent = postgres_statements(table, columns, tsvector)
+    else:
+        query = fts5_query(terms)
+        broad, ranked, recent = sqlite_statements(table, columns)
+
+    if not query:
+        return []
+
+    too_broad = session.execute(text(broad), {"query": query}).first() is not None
+    rows = session.execute(
+        text(recent if too_broad else ranked),
+        {"query": query, "limit": limit, "offset": offset},
+    )
+    return [dict(zip(columns, row)) for row in rows]
@@ -1,163 +1,293 @@
 #!/usr/bin/env python3
+"""Fills the database with synthetic users, clubs, books, reviews and messages.
+
+    python seed.py                                   # the small development dataset
+    python seed.py --users 1e6 --clubs 1e5 --books 1e6 --members 1e7 --comments 1e7 --messages 1e8
+    python seed.py --scale 100 --workers 8 --seed 7
+    python seed.py --database-url postgresql://localhost/story_circle --scale 100
+
+The same --seed and --chunk-size always produce the same rows, however many workers
+load them. Picks are skewed the way real traffic is: a few clubs get most members and
+messages, a few users write most messages and reviews, and a few books are read and
+reviewed by everybody. A user never joins the same club twice, so --members is an upper
+bound. All users share one password (--password) that is hashed once.
+
+Rows are generated and loaded in chunks by a pool of worker processes, with COPY on
+Postgres and executemany on SQLite (where the parent does the writing, as SQLite
+has a single writer). The database is --database-url, else DATABASE_URI, else the
+development SQLite database. Existing rows are deleted first.
+"""
+import argparse
+import csv
+import io
+import multiprocessing
+import os
+import random
+import time
+from datetime import datetime, timedelta
 
 from faker import Faker
+from sqlalchemy import create_engine, insert, text
 
-from app import app
-from models import db, User , BookClub , ClubMember , Book , CurrentBook , PrevioislyReadBook , BookComment , Message
+from app import app, create_app, password_executor, rebuild_rating_aggregates, refresh_member_counts
+from models import db, User , BookClub , ClubMember , Book , CurrentBook , PrevioislyReadBook , BookComment , Message , MessageArchive , ClubReadCursor
 
-with app.app_context():
-    fake = Faker()
+DEFAULT_COUNTS = {
+    "users": 50,
+    "clubs": 25,
+    "books": 50,
+    "members": 100,
+    "current_books": 50,
+    "previous_books": 50,
+    "comments": 200,
+    "messages": 200,
+}
 
-    try:
-        User.query.delete()
-    except Exception as e:
-        pass
-    users = []
-    for i in range(50):
-        user = User(
-            username=fake.unique.first_name(),
-            email= fake.email(),
-            password = fake.password(length=12, special_chars=True, digits=True, upper_case=True, lower_case=True),
-            first_name = fake.first_name(),
-            last_name = fake.last_name(),
-            profile_pic = fake.image_url()
-        )
-        users.append(user)
-
-    db.session.add_all(users)
-    db.session.commit()
+# Load order, with the model and the columns each generated row holds
+TABLES = (
+    ("users", User, ("id", "username", "email", "password", "first_name", "last_name", "profile_pic")),
+    ("clubs", BookClub, ("id", "name", "location", "description", "creator_id")),
+    ("books", Book, ("id", "title", "author", "description")),
+    ("members", ClubMember, ("club_id", "member_id")),
+    ("current_books", CurrentBook, ("club_id", "book_id")),
+    ("previous_books", PrevioislyReadBook, ("club_id", "book_id")),
+    ("comments", BookComment, ("book_id", "user_id", "comment", "rating")),
+    ("messages", Message, ("club_id", "sender_id", "message", "created_at")),
+)
 
-    
-    
-    try:
-        BookClub.query.delete()
-    except Exception as e:
-        pass
-
-    bookclubs = []
-    for i in range(25):
-        bookclub = BookClub(
-            name=fake.company(),
-            location = fake.city(),
-            description=fake.paragraph(nb_sentences=5),
-            creator_id = fake.random_element(elements=users).id, 
-        )
-        bookclubs.append(bookclub)
-
-    db.session.add_all(bookclubs)
-    db.session.commit()
+# Tables that are not seeded but reference seeded rows, cleared before them
+CLEARED_FIRST = (ClubReadCursor, MessageArchive)
 
-    
-    
-    
-    
-    try:
-        ClubMember.query.delete()
-    except Exception as e:
-        pass
-    for i in range(100):
-        clubmember = ClubMember(
-            club_id=fake.random_element(elements=bookclubs).id,
-            member_id=fake.random_element(elements=users).id
-        )
-        db.session.add(clubmember)
+# Tables whose ids are generated here rather than by the database
+EXPLICIT_IDS = ("users", "bookclubs", "books")
 
-    db.session.commit()
-    
-    
-    
-    
-    
-    try:
-        Book.query.delete()
-    except Exception as e:
-        pass
-    books = []
-    for i in range(50):
-        book = Book(
-            title=fake.word() + " " + fake.word(),
-            author=fake.name(),
-            description = fake.paragraph(nb_sentences=5),
-        )
-        books.append(book)
-
-    db.session.add_all(books)
-    db.session.commit()
+# Messages are spread evenly over this window, oldest first
+MESSAGE_HISTORY = timedelta(days=365)
+MESSAGE_EPOCH = datetime(2023, 1, 1)
 
-    
-    
-    
-    
-    
-    try:
-        CurrentBook.query.delete()
-    except Exception as e:
-        pass
-    for i in range(50):
-        currentbook = CurrentBook(
-            club_id=fake.random_element(elements=bookclubs).id,
-            book_id=fake.random_element(elements=books).id
-        )
-        db.session.add(currentbook)
+# A prime, so multiplying by it modulo n reorders 0..n-1 without collisions
+SCRAMBLE = 2_147_483_647
 
-    db.session.commit()
+RATING_WEIGHTS = (5, 8, 17, 35, 35)
 
-    
-    
-    
-    
-    
-    
-    try:
-        PrevioislyReadBook.query.delete()
-    except Exception as e:
-        pass
-    for i in range(50):
-        previousbook = PrevioislyReadBook(
-            club_id=fake.random_element(elements=bookclubs).id,
-            book_id=fake.random_element(elements=books).id
-        )
-        db.session.add(previousbook)
 
-    db.session.commit()
+def count(value):
+    # Accepts 1000000, 1e6 or 1_000_000
+    return int(float(value))
 
-    
-    
-    
-    
-    
-    try:
-        BookComment.query.delete()
-    except Exception as e:
-        pass
-    for i in range(200):
-        bookcomment = BookComment(
-            book_id=fake.random_element(elements=books).id,
-            user_id=fake.random_element(elements=users).id,
-            rating=fake.random_int(min=1, max=5),
-            comment = fake.paragraph(nb_sentences=5),
-        )
-        db.session.add(bookcomment)
 
-    db.session.commit()
+def hot(rng, n):
+    # Id in 1..n where the k-th most popular one is picked with probability ~1/k.
+    # The ranking is scrambled so popular ids are spread over the table instead of
+    # all being the oldest rows.
+    rank = int((n + 1) ** rng.random())
+    return (rank - 1) * SCRAMBLE % n + 1
+
+
+_corpus = None
+
+
+def corpus(seed):
+    # Word and name pools drawn once per process, composing rows from them is much
+    # faster than asking Faker for every field
+    global _corpus
+    if _corpus is None:
+        fake = Faker()
+        fake.seed_instance(seed)
+        _corpus = {
+            "first_names": [fake.first_name() for _ in range(500)],
+            "last_names": [fake.last_name() for _ in range(500)],
+            "names": [fake.name() for _ in range(2000)],
+            "companies": [fake.company() for _ in range(2000)],
+            "cities": [fake.city() for _ in range(500)],
+            "words": [fake.word() for _ in range(3000)],
+            "sentences": [fake.sentence() for _ in range(5000)],
+        }
+    return _corpus
+
+
+def paragraph(rng, words, sentences):
+    return " ".join(rng.choices(words["sentences"], k=sentences))
+
+
+def generate(table, start, stop, counts, seed, password_hash):
+    # Rows start..stop-1 of `table` as tuples in TABLES column order. Each chunk has its
+    # own random stream, so the output does not depend on how the work was split up.
+    rng = random.Random(f"{seed}:{table}:{start}")
+    words = corpus(seed)
+    users, clubs, books = counts["users"], counts["clubs"], counts["books"]
+    rows = []
+
+    if table == "users":
+        for i in range(start + 1, stop + 1):
+            first, last = rng.choice(words["first_names"]), rng.choice(words["last_names"])
+            username = f"{first}{i}".lower()
+            rows.append((i, username, f"{username}@example.com", password_hash, first, last, f"https://picsum.photos/seed/{i}/200"))
+
+    elif table == "clubs":
+        for i in range(start + 1, stop + 1):
+            rows.append((i, f"{rng.choice(words['companies'])} {i}", rng.choice(words["cities"]), paragraph(rng, words, 5), hot(rng, users)))
+
+    elif table == "books":
+        for i in range(start + 1, stop + 1):
+            title = " ".join(rng.choices(words["words"], k=rng.randint(1, 4))).title()
+            rows.append((i, f"{title} {i}", rng.choice(words["names"]), paragraph(rng, words, 5)))
+
+    elif table == "members":
+        # Memberships are generated per user so no (club, member) pair repeats across
+        # chunks; `start`..`stop` index users here, not rows
+        per_user, extra = divmod(counts["members"], users)
+        for member_id in range(start + 1, stop + 1):
+            wanted = min(clubs, per_user + (member_id <= extra))
+            joined = {hot(rng, clubs) for _ in range(wanted)}
+            rows.extend((club_id, member_id) for club_id in joined)
 
-    
-    
-    
-    
-    
-    
+    elif table in ("current_books", "previous_books"):
+        for i in range(start, stop):
+            rows.append((i % clubs + 1, hot(rng, books)))
+
+    elif table == "comments":
+        for i in range(start, stop):
+            rating = rng.choices((1, 2, 3, 4, 5), RATING_WEIGHTS)[0]
+            rows.append((hot(rng, books), hot(rng, users), paragraph(rng, words, rng.randint(1, 5)), rating))
+
+    elif table == "messages":
+        step = MESSAGE_HISTORY / max(1, counts["messages"])
+        for i in range(start, stop):
+            rows.append((hot(rng, clubs), hot(rng, users), rng.choice(words["sentences"]), MESSAGE_EPOCH + step * i))
+
+    return rows
+
+
+def chunks(table, counts, chunk_size):
+    # Memberships are generated per user
+    total = counts["users"] if table == "members" and counts["members"] else counts[table]
+    return [(start, min(start + chunk_size, total)) for start in range(0, total, chunk_size)]
+
+
+_engine = None
+
+
+def copy_chunk(job):
+    # Worker side of a Postgres load: generate one chunk and COPY it in
+    global _engine
+    url, table, name, columns, start, stop, counts, seed, password_hash = job
+    if _engine is None:
+        _engine = create_engine(url)
+
+    rows = generate(table, start, stop, counts, seed, password_hash)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(["\\N" if value is None else value for value in row])
+    buffer.seek(0)
+
+    connection = _engine.raw_connection()
     try:
-        Message.query.delete()
-    except Exception as e:
-        pass
-    for i in range(200):
-        messageAR = Message(
-            club_id=fake.random_element(elements=bookclubs).id,
-            sender_id=fake.random_element(elements=users).id,
-            message = fake.paragraph(nb_sentences=5),
-        )
-        db.session.add(messageAR)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+        connection.commit()
+    finally:
+        connection.close()
+    return len(rows)
+
+
+def generate_chunk(job):
+    # Worker side of a SQLite load: only generate, the parent writes
+    return generate(*job)
+
+
+def clear(connection, postgres):
+    models = list(CLEARED_FIRST) + [model for _, model, _ in reversed(TABLES)]
+    names = [model.__tablename__ for model in models]
+    if postgres:
+        connection.execute(text(f"TRUNCATE {', '.join(names)} RESTART IDENTITY CASCADE"))
+    else:
+        for name in names:
+            connection.execute(text(f"DELETE FROM {name}"))
 
+
+def seed(counts, seed_value=1, workers=None, chunk_size=20_000, password="password"):
+    workers = workers or os.cpu_count() or 1
+    password_hash = password_executor.hash(password)
+    postgres = db.engine.dialect.name == "postgresql"
+    url = db.engine.url.render_as_string(hide_password=False)
+
+    with db.engine.begin() as connection:
+        clear(connection, postgres)
+
+    with multiprocessing.get_context("fork").Pool(workers) as pool:
+        for table, model, columns in TABLES:
+            started = time.perf_counter()
+            jobs = chunks(table, counts, chunk_size)
+            loaded = 0
+
+            if postgres:
+                name = model.__tablename__
+                loaded = sum(pool.imap_unordered(copy_chunk, [
+                    (url, table, name, columns, start, stop, counts, seed_value, password_hash) for start, stop in jobs
+                ]))
+            else:
+                statement = insert(model)
+                with db.engine.connect() as connection:
+                    connection.exec_driver_sql("PRAGMA synchronous = OFF")
+                    for rows in pool.imap(generate_chunk, [(table, start, stop, counts, seed_value, password_hash) for start, stop in jobs]):
+                        if rows:
+                            connection.execute(statement, [dict(zip(columns, row)) for row in rows])
+                            connection.commit()
+                        loaded += len(rows)
+
+            elapsed = time.perf_counter() - started
+            print(f"{table:15} {loaded:>12,} rows in {elapsed:7.1f}s ({loaded / max(elapsed, 1e-9):,.0f} rows/s)", flush=True)
+
+    if postgres:
+        # Ids were given explicitly, move the sequences past them
+        with db.engine.begin() as connection:
+            for name in EXPLICIT_IDS:
+                connection.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), coalesce(max(id), 0) + 1, false) FROM {name}"
+                ))
+
+    started = time.perf_counter()
+    rebuild_rating_aggregates()
+    print(f"rating aggregates rebuilt in {time.perf_counter() - started:.1f}s", flush=True)
+
+    started = time.perf_counter()
+    refresh_member_counts()
     db.session.commit()
+    print(f"member counts rebuilt in {time.perf_counter() - started:.1f}s", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    for table, default in DEFAULT_COUNTS.items():
+        parser.add_argument(f"--{table.replace('_', '-')}", type=count, default=None,
+                            help=f"rows to create, {default} times --scale by default")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies every default count")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None, help="generator processes, one per CPU by default")
+    parser.add_argument("--chunk-size", type=count, default=20_000)
+    parser.add_argument("--password", default="password", help="password of every seeded user")
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URI"),
+                        help="database to fill, DATABASE_URI or the development SQLite database by default")
+    args = parser.parse_args()
+
+    counts = {
+        table: getattr(args, table) if getattr(args, table) is not None else int(default * args.scale)
+        for table, default in DEFAULT_COUNTS.items()
+    }
+    if counts["users"] < 1 or counts["clubs"] < 1 or counts["books"] < 1:
+        parser.error("at least one user, club and book is needed")
+
+    seed_app = app
+    if args.database_url:
+        # create_app() reads its database from DATABASE_URI, the worker processes inherit it
+        os.environ["DATABASE_URI"] = args.database_url
+        seed_app = create_app()
+
+    with seed_app.app_context():
+        seed(counts, args.seed, args.workers, args.chunk_size, args.password)
+
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import DateTime
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:
+    # orjson is in requirements.txt, the standard library encoder is the fallback
+    orjson = None
+
+
+def default(o):
+    # The same conversions as Flask's own JSON provider, so responses keep their formats
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o):
+        return dataclasses.asdict(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    # Compact JSON as bytes, with orjson when it is installed. orjson hands dates to `default`
+    # so they come out as HTTP dates like before, and anything it refuses (e.g. non-string
+    # keys) goes through the standard library instead
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            pass
+    return json.dumps(obj, default=default, separators=(",", ":")).encode()
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that writes compact JSON through orjson.
+
+    jsonify() and every other use of app.json go through it. Output is compact
+    unless `compact` is set to False, in which case the standard library
+    pretty-prints it as before.
+    """
+
+    compact = True
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj) + b"\n", mimetype=self.mimetype)
+
+
+class ColumnSerializer:
+    """Dumps rows of a column query exactly like a marshmallow auto schema dumps models.
+
+    `columns` are the model attributes the schema has fields for, in field order,
+    meant to be selected directly (db.session.query(*serializer.columns)) so rows
+    come back as plain tuples without building ORM instances. DateTime values
+    become ISO 8601 strings, the way marshmallow writes them.
+    """
+
+    def __init__(self, schema, model):
+        self.keys = tuple(schema.fields)
+        self.columns = [getattr(model, key) for key in self.keys]
+        self._datetimes = [i for i, column in enumerate(self.columns) if isinstance(column.type, DateTime)]
+
+    def dump(self, row):
+        values = list(row)
+        for i in self._datetimes:
+            if values[i] is not None:
+                values[i] = values[i].isoformat()
+        return dict(zip(self.keys, values))
+
+    def dump_many(self, rows):
+        return [self.dump(row) for row in rows]
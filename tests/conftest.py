@@ -0,0 +1,74 @@
+import importlib
+import os
+import sys
+
+import pytest
+from flask_migrate import Migrate, upgrade
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from index_audit import MIGRATIONS  # noqa: E402
+from models import db  # noqa: E402
+
+
+@pytest.fixture
+def database_uri(tmp_path):
+    return f"sqlite:///{tmp_path / 'test.db'}"
+
+
+@pytest.fixture
+def replica_uris():
+    # DATABASE_REPLICA_URIS, overridden by tests that read through replicas
+    return None
+
+
+@pytest.fixture
+def app(database_uri, replica_uris, monkeypatch):
+    # create_app() on a migrated scratch SQLite database, inside an app context
+    monkeypatch.setenv('DATABASE_URI', database_uri)
+    if replica_uris:
+        monkeypatch.setenv('DATABASE_REPLICA_URIS', replica_uris)
+    else:
+        monkeypatch.delenv('DATABASE_REPLICA_URIS', raising=False)
+    test_app = create_app()
+    Migrate(test_app, db, directory=MIGRATIONS)
+
+    with test_app.app_context():
+        upgrade(directory=MIGRATIONS)
+        yield test_app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def log_in(client):
+    # Registers a user and logs them in, returns (authorization headers, user id)
+    def log_in(username, password='secret'):
+        client.post('/register', json=dict(
+            username=username, email=f'{username}@example.com', first_name=username.title(), last_name='Test',
+            profile_pic=None, password=password,
+        ))
+        login = client.post('/login', json=dict(username=username, password=password)).get_json()
+        return {'Authorization': f"Bearer {login['access_token']}"}, login['user_id']
+    return log_in
+
+
+@pytest.fixture
+def asgi_client(app):
+    # Starlette test client for asgi.py, which builds its Flask app and engine on import from the
+    # environment the app fixture set
+    from starlette.testclient import TestClient
+
+    sys.modules.pop('asgi', None)
+    asgi = importlib.import_module('asgi')
+
+    with TestClient(asgi.app) as client:
+        yield client
+
+    sys.modules.pop('asgi', None)
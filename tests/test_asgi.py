@@ -0,0 +1,73 @@
+import pytest
+
+from app import replica_router
+from cache import TTLCache
+
+
+@pytest.fixture
+def replica_uris(database_uri):
+    # The scratch database doubles as its own replica, only the routing is checked
+    return database_uri
+
+
+def log_in(client, username):
+    client.post('/register', json=dict(
+        username=username, email=f'{username}@example.com', first_name='Async', last_name='Test',
+        profile_pic=None, password='secret',
+    ))
+    login = client.post('/login', json=dict(username=username, password='secret')).json()
+    return {'Authorization': f"Bearer {login['access_token']}"}, login['user_id']
+
+
+def forget_stickiness(monkeypatch):
+    monkeypatch.setattr(replica_router, 'backend', TTLCache(maxsize=100, ttl=60))
+
+
+def test_async_message_makes_the_sender_sticky(asgi_client, monkeypatch):
+    headers, user_id = log_in(asgi_client, 'writer')
+    asgi_client.post('/clubs', headers=headers, json=dict(name='Async club', location='Here', description='Club', creator_id=user_id))
+    forget_stickiness(monkeypatch)
+
+    response = asgi_client.post('/messages', headers=headers, json=dict(sender_id=user_id, club_id=1, message='Hello'))
+
+    assert response.status_code == 201
+    assert replica_router.is_sticky('writer')
+
+
+def test_async_profile_edit_makes_only_that_user_sticky(asgi_client, monkeypatch):
+    headers, _ = log_in(asgi_client, 'editor')
+    log_in(asgi_client, 'bystander')
+    forget_stickiness(monkeypatch)
+
+    response = asgi_client.patch('/profile/editor', headers=headers, json=dict(first_name='Edited'))
+
+    assert response.status_code == 200
+    assert replica_router.is_sticky('editor')
+    assert not replica_router.is_sticky('bystander')
+
+
+def test_failed_async_write_is_not_sticky(asgi_client, monkeypatch):
+    headers, _ = log_in(asgi_client, 'failing')
+    forget_stickiness(monkeypatch)
+
+    response = asgi_client.post('/messages', headers=headers, json=dict(message='No club'))
+
+    assert response.status_code == 400
+    assert not replica_router.is_sticky('failing')
+
+
+def test_async_handlers_are_in_metrics(asgi_client):
+    headers, user_id = log_in(asgi_client, 'measured')
+    asgi_client.post('/clubs', headers=headers, json=dict(name='Measured club', location='Here', description='Club', creator_id=user_id))
+    asgi_client.post('/messages', headers=headers, json=dict(sender_id=user_id, club_id=1, message='Hello'))
+    asgi_client.get('/clubs/1/messages')
+
+    metrics = asgi_client.get('/metrics').text
+
+    assert 'http_requests_total{method="POST",route="/messages",status="201"}' in metrics
+    assert 'http_requests_total{method="GET",route="/clubs/<int:id>/messages",status="200"}' in metrics
+    statements = [
+        line for line in metrics.splitlines()
+        if line.startswith('http_request_sql_statements_sum{method="POST",route="/messages"}')
+    ]
+    assert statements and float(statements[0].split()[-1]) > 0
@@ -0,0 +1,71 @@
+import pytest
+
+from app import BATCH_MAX_REQUESTS
+
+
+@pytest.fixture
+def member(client, log_in):
+    # A user who created club 1 and wrote the catalog's book 1, returns (headers, user id)
+    headers, user_id = log_in('batcher')
+    client.post('/clubs', headers=headers, json=dict(name='Batched', location='Here', description='Club', creator_id=user_id))
+    client.post('/books', headers=headers, json=dict(title='Batched book', author='Author', description='Book'))
+    return headers, user_id
+
+
+def batch(client, requests, headers=None):
+    response = client.post('/batch', headers=headers or {}, json=dict(requests=requests))
+    assert response.status_code == 200
+    return response.get_json()['responses']
+
+
+def test_batch_answers_in_order(client, member):
+    responses = batch(client, [dict(path='/clubs/1'), dict(path='/books/1'), dict(path='/clubs/999')])
+
+    assert [response['status'] for response in responses] == [200, 200, 404]
+    assert responses[0]['body']['name'] == 'Batched'
+    assert responses[1]['body']['title'] == 'Batched book'
+    assert 'ETag' in responses[0]['headers']
+
+
+def test_batch_reads_its_own_writes(client, member):
+    headers, user_id = member
+
+    responses = batch(client, [
+        dict(method='POST', path='/messages', body=dict(sender_id=user_id, club_id=1, message='Batched hello')),
+        dict(path='/clubs/1/messages?limit=1'),
+    ], headers)
+
+    assert responses[0]['status'] == 201
+    assert responses[1]['body']['items'][0]['message'] == 'Batched hello'
+
+
+def test_batch_forwards_its_authorization(client, member):
+    headers, _ = member
+
+    assert batch(client, [dict(path='/profile/batcher')], headers)[0]['status'] == 200
+    assert batch(client, [dict(path='/profile/batcher')])[0]['status'] == 401
+    # A sub-request's own header wins
+    assert batch(client, [dict(path='/profile/batcher', headers={'Authorization': 'Bearer nope'})], headers)[0]['status'] == 422
+
+
+@pytest.mark.parametrize('item, error', [
+    (dict(path='/batch', method='POST'), '/batch cannot be batched'),
+    (dict(path='/clubs/1/stream'), '/clubs/1/stream cannot be batched'),
+    (dict(path='/clubs/1/poll'), '/clubs/1/poll cannot be batched'),
+    (dict(path='/books?stream=1'), '/books?stream=1 cannot be batched'),
+    (dict(path='/clubs/1', method='PUT'), 'PUT requests cannot be batched'),
+    (dict(path='clubs/1'), 'Each request needs a path starting with /'),
+    ('/clubs/1', 'Each request needs a path starting with /'),
+    (dict(path='/clubs/1', headers=['Accept']), 'Request headers must be an object'),
+])
+def test_batch_exclusions_fail_only_their_item(client, member, item, error):
+    responses = batch(client, [item, dict(path='/clubs/1')])
+
+    assert responses[0] == {"status": 400, "headers": {}, "body": {"errors": [error]}}
+    assert responses[1]['status'] == 200
+
+
+def test_batch_needs_a_bounded_list(client, member):
+    assert client.post('/batch', json=dict(requests='/clubs/1')).status_code == 400
+    too_many = [dict(path='/clubs/1')] * (BATCH_MAX_REQUESTS + 1)
+    assert client.post('/batch', json=dict(requests=too_many)).status_code == 413
@@ -0,0 +1,78 @@
+import json
+
+from models import db, Book
+
+
+def catalog(*lines):
+    # One NDJSON body, dicts are dumped and strings are sent as they are
+    return ''.join((line if isinstance(line, str) else json.dumps(line)) + '\n' for line in lines)
+
+
+def bulk_import(client, headers, body, on_duplicate=None):
+    url = '/books/bulk' + (f'?on_duplicate={on_duplicate}' if on_duplicate else '')
+    response = client.post(url, headers=headers, data=body, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    *results, summary = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    return results, summary["summary"]
+
+
+def test_new_titles_are_created_and_existing_ones_skipped(client, log_in):
+    headers, _ = log_in('librarian')
+    bulk_import(client, headers, catalog(dict(title='Dune', author='Herbert')))
+
+    results, summary = bulk_import(client, headers, catalog(
+        dict(title='Dune', author='Someone else'),
+        dict(title='Emma', author='Austen', description='Novel'),
+    ))
+
+    assert [(r["line"], r["status"]) for r in results] == [(1, 'skipped'), (2, 'created')]
+    assert results[0]["error"] == 'title already exists'
+    assert summary == {"created": 1, "updated": 0, "skipped": 1, "error": 0}
+    assert db.session.query(Book.author).filter_by(title='Dune').scalar() == 'Herbert'
+
+
+def test_update_overwrites_existing_titles(client, log_in):
+    headers, _ = log_in('librarian')
+    (created,), _ = bulk_import(client, headers, catalog(dict(title='Dune', author='Herbert')))
+
+    results, summary = bulk_import(client, headers, catalog(dict(title='Dune', author='Frank Herbert')), 'update')
+
+    assert results == [{"line": 1, "status": "updated", "id": created["id"]}]
+    assert summary == {"created": 0, "updated": 1, "skipped": 0, "error": 0}
+    db.session.expire_all()
+    assert db.session.get(Book, created["id"]).author == 'Frank Herbert'
+
+
+def test_bad_lines_are_reported_and_the_rest_imported(client, log_in):
+    headers, _ = log_in('librarian')
+
+    results, summary = bulk_import(client, headers, catalog(
+        '{not json',
+        dict(author='No title'),
+        dict(title='Dune', author=3),
+        '',
+        dict(title='Dune'),
+        dict(title='Dune'),
+    ))
+
+    assert results == [
+        {"line": 1, "status": "error", "error": "invalid JSON"},
+        {"line": 2, "status": "error", "error": "a non-empty title is required"},
+        {"line": 3, "status": "error", "error": "author must be a string"},
+        {"line": 5, "status": "created", "id": results[3]["id"]},
+        {"line": 6, "status": "skipped", "error": "duplicate title in this request"},
+    ]
+    assert summary == {"created": 1, "updated": 0, "skipped": 1, "error": 3}
+
+
+def test_bulk_import_validates_on_duplicate_and_needs_a_token(client, log_in):
+    headers, _ = log_in('librarian')
+    body = catalog(dict(title='Dune'))
+
+    invalid = client.post('/books/bulk?on_duplicate=replace', headers=headers, data=body, content_type='application/x-ndjson')
+    anonymous = client.post('/books/bulk', data=body, content_type='application/x-ndjson')
+
+    assert invalid.status_code == 400
+    assert invalid.get_json() == {"errors": ["on_duplicate must be skip or update"]}
+    assert anonymous.status_code == 401
+    assert db.session.query(Book).count() == 0
@@ -0,0 +1,91 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app import load_club_detail, message_cursor, message_window
+from models import db, User, BookClub, ClubMember, Book, CurrentBook, PrevioislyReadBook, BookComment, Message
+
+
+@contextmanager
+def count_statements():
+    # Counts every statement sent to the database while the block runs
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def make_club(name, members, books, comments_per_book, messages):
+    users = [
+        User(username=f'{name}-{i}', email=f'{name}-{i}@example.com', password='x', first_name=name, last_name=str(i))
+        for i in range(members)
+    ]
+    db.session.add_all(users)
+    db.session.flush()
+
+    club = BookClub(name=name, location='Here', description=name, creator_id=users[0].id, member_count=members)
+    db.session.add(club)
+    db.session.flush()
+
+    read = [Book(title=f'{name} book {i}', author='Author', description='Book') for i in range(books)]
+    db.session.add_all(read)
+    db.session.flush()
+
+    db.session.add_all(ClubMember(club_id=club.id, member_id=user.id) for user in users)
+    db.session.add(CurrentBook(club_id=club.id, book_id=read[0].id))
+    db.session.add_all(PrevioislyReadBook(club_id=club.id, book_id=book.id) for book in read)
+    db.session.add_all(
+        BookComment(book_id=book.id, user_id=users[i % members].id, comment='Good', rating=4)
+        for book in read for i in range(comments_per_book)
+    )
+    db.session.add_all(
+        Message(club_id=club.id, sender_id=users[i % members].id, message=f'Message {i}')
+        for i in range(messages)
+    )
+    db.session.commit()
+
+    return club.id
+
+
+def club_page_statements(club_id):
+    # Statements for the club page plus its first two pages of messages
+    db.session.expire_all()
+
+    with count_statements() as statements:
+        detail = load_club_detail(club_id)
+        messages, next_cursor = message_window(club_id, limit=2)
+        before, before_at = message_cursor(next_cursor)
+        older, _ = message_window(club_id, before=before, limit=2, before_at=before_at)
+
+    assert detail["id"] == club_id
+    assert len(messages) == len(older) == 2
+
+    return len(statements)
+
+
+def test_club_page_statements_do_not_grow_with_the_club(app):
+    small = make_club('small', members=1, books=1, comments_per_book=1, messages=5)
+    large = make_club('large', members=60, books=15, comments_per_book=8, messages=300)
+
+    small_count = club_page_statements(small)
+    large_count = club_page_statements(large)
+
+    assert small_count > 0
+    assert small_count == large_count
+
+
+def test_club_detail_has_every_member_book_and_comment(app):
+    club_id = make_club('large', members=60, books=15, comments_per_book=8, messages=3)
+
+    detail = load_club_detail(club_id)
+
+    assert len(detail["members"]) == 60
+    assert len(detail["previous_books"]) == 15
+    assert all(len(book["comments"]) == 8 for book in detail["previous_books"])
+    assert detail["current_book"]["title"] == 'large book 0'
@@ -0,0 +1,72 @@
+import pytest
+
+from app import refresh_member_counts
+from models import db, BookClub, ClubMember, User
+
+
+@pytest.fixture
+def clubs(app):
+    # Clubs 1-4 with 2, 1, 2 and 0 members out of users 1-3. Returns the users' ids
+    users = [User(username=f'member{i}', email=f'member{i}@example.com', password='x') for i in range(3)]
+    db.session.add_all(users)
+    db.session.flush()
+    db.session.add_all(
+        BookClub(name=f'Club {i}', location='Here', description='Club', creator_id=users[0].id) for i in range(1, 5)
+    )
+    db.session.flush()
+
+    memberships = {1: [0, 1], 2: [2], 3: [0, 2]}
+    db.session.add_all(
+        ClubMember(club_id=club_id, member_id=users[i].id) for club_id, members in memberships.items() for i in members
+    )
+    refresh_member_counts()
+    db.session.commit()
+
+    return [user.id for user in users]
+
+
+def walk(client, url, limit):
+    ids, counts, cursor = [], [], None
+    while True:
+        page = client.get(f'{url}?limit={limit}' + (f'&after={cursor}' if cursor else '')).get_json()
+        ids += [club['id'] for club in page['items']]
+        counts += [club['member_count'] for club in page['items']]
+        cursor = page['next']
+        if cursor is None:
+            return ids, counts
+
+
+@pytest.mark.parametrize('limit', [1, 3, 10])
+def test_popular_clubs_come_by_member_count(client, clubs, limit):
+    assert walk(client, '/clubs/popular', limit) == ([3, 1, 2, 4], [2, 2, 1, 0])
+
+
+@pytest.mark.parametrize('limit', [1, 10])
+def test_user_clubs_are_in_club_order(client, clubs, limit):
+    assert walk(client, f'/users/{clubs[0]}/clubs', limit)[0] == [1, 3]
+    assert walk(client, f'/users/{clubs[2]}/clubs', limit)[0] == [2, 3]
+
+
+def test_user_clubs_of_a_user_without_clubs_or_who_does_not_exist(client, clubs, log_in):
+    _, loner = log_in('loner')
+
+    assert client.get(f'/users/{loner}/clubs').get_json() == {"items": [], "next": None}
+    assert client.get('/users/999/clubs').status_code == 404
+
+
+@pytest.mark.parametrize('url', ['/clubs/popular', '/users/1/clubs'])
+def test_listings_reject_bad_cursors(client, clubs, url):
+    assert client.get(f'{url}?after=not-a-cursor').status_code == 400
+
+
+def test_member_counts_follow_joins_and_can_be_repaired(client, clubs, log_in):
+    headers, user_id = log_in('joiner')
+    client.post('/joinclub', headers=headers, json=dict(club_id=4, user_id=user_id))
+
+    assert walk(client, '/clubs/popular', 10) == ([3, 1, 4, 2], [2, 2, 1, 1])
+
+    BookClub.query.update({BookClub.member_count: 7})
+    assert refresh_member_counts() == 4
+    db.session.commit()
+
+    assert walk(client, '/clubs/popular', 10)[1] == [2, 2, 1, 1]
@@ -0,0 +1,75 @@
+import pytest
+
+from app import MEMBERS_BULK_MAX
+from models import db, BookClub, ClubMember
+
+
+@pytest.fixture
+def creator(client, log_in):
+    # The creator of club 1, returns (headers, user id)
+    headers, user_id = log_in('creator')
+    client.post('/clubs', headers=headers, json=dict(name='Members', location='Here', description='Club', creator_id=user_id))
+    return headers, user_id
+
+
+def member_count(club_id=1):
+    db.session.expire_all()
+    return db.session.get(BookClub, club_id).member_count
+
+
+def members(club_id=1):
+    return sorted(member_id for (member_id,) in db.session.query(ClubMember.member_id).filter_by(club_id=club_id))
+
+
+def test_joining_twice_keeps_one_membership(client, creator):
+    headers, user_id = creator
+
+    first = client.post('/joinclub', headers=headers, json=dict(club_id=1, user_id=user_id))
+    second = client.post('/joinclub', headers=headers, json=dict(club_id=1, user_id=user_id))
+
+    assert (first.status_code, second.status_code) == (201, 200)
+    assert second.get_json() == {"message": "Already a member"}
+    assert members() == [user_id]
+    assert member_count() == 1
+
+
+def test_bulk_add_skips_members_and_unknown_users(client, creator, log_in):
+    headers, user_id = creator
+    others = [log_in(f'reader{i}')[1] for i in range(3)]
+    client.post('/joinclub', headers=headers, json=dict(club_id=1, user_id=user_id))
+
+    response = client.post('/clubs/1/members', headers=headers, json=dict(member_ids=[user_id, *others, others[0], 999]))
+
+    assert response.status_code == 200
+    assert response.get_json() == {"added": 3, "skipped": 2}
+    assert members() == sorted([user_id, *others])
+    assert member_count() == 4
+
+
+def test_bulk_remove_updates_the_count(client, creator, log_in):
+    headers, user_id = creator
+    others = [log_in(f'reader{i}')[1] for i in range(3)]
+    client.post('/clubs/1/members', headers=headers, json=dict(member_ids=others))
+
+    response = client.delete('/clubs/1/members', headers=headers, json=dict(member_ids=[others[0], others[1], user_id]))
+
+    assert response.status_code == 200
+    assert response.get_json() == {"removed": 2, "skipped": 1}
+    assert members() == [others[2]]
+    assert member_count() == 1
+
+
+def test_bulk_changes_are_only_for_the_creator(client, creator, log_in):
+    headers, _ = log_in('stranger')
+
+    assert client.post('/clubs/1/members', headers=headers, json=dict(member_ids=[1])).status_code == 404
+    assert client.delete('/clubs/1/members', headers=headers, json=dict(member_ids=[1])).status_code == 404
+
+
+def test_bulk_changes_validate_the_ids(client, creator):
+    headers, _ = creator
+
+    assert client.post('/clubs/1/members', headers=headers, json=dict(member_ids=['1'])).status_code == 400
+    assert client.post('/clubs/1/members', headers=headers, json=dict(member_ids=1)).status_code == 400
+    too_many = list(range(1, MEMBERS_BULK_MAX + 2))
+    assert client.post('/clubs/1/members', headers=headers, json=dict(member_ids=too_many)).status_code == 413
@@ -0,0 +1,49 @@
+import pytest
+
+
+@pytest.fixture
+def catalog(client, log_in):
+    # A club reading one book, returns the creator's headers
+    headers, user_id = log_in('creator')
+    client.post('/books/bulk', headers=headers, data='{"title": "Dune", "author": "Herbert"}\n', content_type='application/x-ndjson')
+    client.post('/clubs', headers=headers, json=dict(name='Readers', location='Here', description='Club', creator_id=user_id))
+    client.post('/currentbook', headers=headers, json=dict(club_id=1, book_id=1))
+    return headers
+
+
+def revalidate(client, url):
+    # Fetches url, then asks again with its ETag, returns (first response, conditional response)
+    first = client.get(url)
+    assert first.status_code == 200
+    assert first.headers['ETag']
+    return first, client.get(url, headers={'If-None-Match': first.headers['ETag']})
+
+
+@pytest.mark.parametrize('url', ['/clubs/1', '/clubs', '/books/1', '/books'])
+def test_matching_etag_gets_an_empty_304(client, catalog, url):
+    first, again = revalidate(client, url)
+
+    assert again.status_code == 304
+    assert again.get_data() == b''
+    assert again.headers['ETag'] == first.headers['ETag']
+
+
+@pytest.mark.parametrize('url', ['/clubs/1', '/books/1'])
+def test_other_etags_get_the_full_response(client, catalog, url):
+    response = client.get(url, headers={'If-None-Match': '"stale"'})
+
+    assert response.status_code == 200
+    assert response.get_json()["id"] == 1
+
+
+@pytest.mark.parametrize('url', ['/clubs/1', '/clubs', '/books/1', '/books'])
+def test_etag_changes_after_a_write(client, catalog, url):
+    first = client.get(url)
+
+    # Clubs reading the book are bumped along with it
+    assert client.patch('/books/1', headers=catalog, json=dict(author='Frank Herbert')).status_code == 200
+
+    again = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+
+    assert again.status_code == 200
+    assert again.headers['ETag'] != first.headers['ETag']
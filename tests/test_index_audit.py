@@ -0,0 +1,17 @@
+from index_audit import sqlite_scans
+from models import db
+
+
+def scans(statement):
+    with db.engine.connect() as connection:
+        return sqlite_scans(connection, statement, ())
+
+
+def test_first_page_in_index_order_is_not_a_full_scan(app):
+    assert scans('SELECT books.id FROM books ORDER BY books.id LIMIT 20') == []
+
+
+def test_first_page_sorted_in_a_temp_b_tree_is_a_full_scan(app):
+    assert [table for table, detail in scans(
+        'SELECT books.id FROM books ORDER BY books.description LIMIT 20'
+    )] == ['books']
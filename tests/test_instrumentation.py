@@ -0,0 +1,21 @@
+import copy
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from models import db
+
+
+def test_failed_statements_leave_nothing_on_the_connection(app):
+    with db.engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+        info = copy.deepcopy(conn.info)
+
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute(text('SELECT * FROM no_such_table'))
+            conn.rollback()
+
+        assert dict(conn.info) == info
+        assert conn.execute(text('SELECT 1')).scalar() == 1
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import encode_cursor
+from archive import archive_messages
+from models import db, BookClub, Message, MessageArchive, User
+
+CUTOFF = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def history(app):
+    # Club 1 with 12 messages from before CUTOFF and 3 after it, archived in chunks of 5.
+    # Returns every message id, newest first
+    user = User(username='chatter', email='chatter@example.com', password='x')
+    db.session.add(user)
+    db.session.flush()
+    club = BookClub(name='Archived', location='Here', description='Club', creator_id=user.id)
+    db.session.add(club)
+    db.session.flush()
+
+    sent = [CUTOFF - timedelta(days=30 - i) for i in range(12)] + [CUTOFF + timedelta(days=i) for i in range(3)]
+    messages = [Message(club_id=club.id, sender_id=user.id, message=f'Message {i}', created_at=at) for i, at in enumerate(sent)]
+    db.session.add_all(messages)
+    db.session.commit()
+    ids = [message.id for message in reversed(messages)]
+
+    assert archive_messages(CUTOFF, batch_size=5) == (12, 3)
+
+    return ids
+
+
+def pages(client, limit):
+    ids, cursor = [], None
+    while True:
+        query = f'?limit={limit}' + (f'&before={cursor}' if cursor else '')
+        page = client.get(f'/clubs/1/messages{query}').get_json()
+        ids += [message['id'] for message in page['items']]
+        cursor = page['next']
+        if cursor is None:
+            return ids
+
+
+def test_archiving_moves_only_old_messages(history):
+    assert db.session.query(Message.id).count() == 3
+    assert sum(count for (count,) in db.session.query(MessageArchive.message_count)) == 12
+
+
+@pytest.mark.parametrize('limit', [1, 2, 4, 20])
+def test_pages_continue_into_the_archive(client, history, limit):
+    assert pages(client, limit) == history
+
+
+def test_streamed_list_includes_the_archive(client, history):
+    items = client.get('/clubs/1/messages?stream=1').get_json()['items']
+
+    assert [message['id'] for message in items] == history
+    assert items[-1]['sender'] == 'chatter'
+
+
+def test_id_only_cursor_to_a_hot_message_still_works(client, history):
+    page = client.get(f"/clubs/1/messages?limit=3&before={encode_cursor({'id': history[1]})}").get_json()
+
+    assert [message['id'] for message in page['items']] == history[2:5]
+
+
+@pytest.mark.parametrize('stream', ['', '&stream=1'])
+def test_id_only_cursor_to_an_archived_message_is_rejected(client, history, stream):
+    response = client.get(f"/clubs/1/messages?limit=3&before={encode_cursor({'id': history[5]})}{stream}")
+
+    assert response.status_code == 400
+    assert response.get_json() == {"errors": ["Invalid cursor"]}
+
+
+def test_async_list_rejects_an_id_only_cursor_to_an_archived_message(asgi_client, history):
+    cursor = encode_cursor({'id': history[5]})
+
+    for query in (f'before={cursor}', f'before={cursor}&stream=1'):
+        response = asgi_client.get(f'/clubs/1/messages?{query}')
+        assert response.status_code == 400
+        assert response.json() == {"errors": ["Invalid cursor"]}
+
+
+def test_async_pages_continue_into_the_archive(asgi_client, history):
+    ids, cursor = [], None
+    while True:
+        page = asgi_client.get('/clubs/1/messages?limit=4' + (f'&before={cursor}' if cursor else '')).json()
+        ids += [message['id'] for message in page['items']]
+        cursor = page['next']
+        if cursor is None:
+            break
+
+    assert ids == history
@@ -0,0 +1,73 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+@pytest.fixture
+def image_server():
+    # Answers HEAD /ok.png with 200 and anything else with 404, once `release` is set
+    release = threading.Event()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_HEAD(self):
+            release.wait(5)
+            self.send_response(200 if self.path == '/ok.png' else 404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield f'http://127.0.0.1:{server.server_address[1]}', release
+
+    release.set()
+    server.shutdown()
+    server.server_close()
+
+
+def profile(client, username, headers):
+    return client.get(f'/profile/{username}', headers=headers).get_json()
+
+
+def wait_for_verdict(client, username, headers, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        data = profile(client, username, headers)
+        if data['profile_pic_status'] != 'pending':
+            return data
+        time.sleep(0.02)
+    raise AssertionError('profile picture is still pending')
+
+
+@pytest.mark.parametrize('path, status, picture', [
+    ('/ok.png', 'valid', True),
+    ('/missing.png', 'invalid', False),
+])
+def test_profile_pic_is_verified_in_the_background(client, log_in, image_server, path, status, picture):
+    base_url, release = image_server
+    username = f'pic-{status}'
+    headers, _ = log_in(username)
+    url = base_url + path
+
+    response = client.patch(f'/profile/{username}', headers=headers, json=dict(profile_pic=url, first_name='Patched'))
+
+    assert response.status_code == 202
+    assert response.get_json()['profile_pic_status'] == 'pending'
+
+    # The other changes are saved right away, the picture only once the check is done
+    pending = profile(client, username, headers)
+    assert pending['profile_pic_status'] == 'pending'
+    assert pending['first_name'] == 'Patched'
+    assert pending['profile_pic'] is None
+
+    release.set()
+    verified = wait_for_verdict(client, username, headers)
+
+    assert verified['profile_pic_status'] == status
+    assert verified['profile_pic'] == (url if picture else None)
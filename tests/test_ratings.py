@@ -0,0 +1,23 @@
+from app import rebuild_rating_aggregates
+from models import db, Book, BookComment, User
+
+
+def test_rebuild_rating_aggregates_skips_orphan_comments(app):
+    user = User(username='rater', email='rater@example.com', password='x')
+    book = Book(title='Rated', author='Author', description='Book')
+    db.session.add_all([user, book])
+    db.session.flush()
+
+    db.session.add_all([
+        BookComment(book_id=book.id, user_id=user.id, comment='Good', rating=4),
+        BookComment(book_id=book.id, user_id=user.id, comment='Great', rating=5),
+        # Left behind by a book deleted without its comments
+        BookComment(book_id=book.id + 1000, user_id=user.id, comment='Gone', rating=1),
+    ])
+    db.session.commit()
+
+    assert rebuild_rating_aggregates() == 1
+
+    book = db.session.get(Book, book.id)
+    assert (book.rating_count, book.rating_sum, book.rating_avg) == (2, 9, 4.5)
+    assert (book.rating_1, book.rating_4, book.rating_5) == (0, 1, 1)
@@ -0,0 +1,80 @@
+import pytest
+
+from app import UNREAD_COUNT_MAX
+from models import db, Message
+
+
+@pytest.fixture
+def club(client, log_in):
+    # A club with a reader and a poster who are both members, returns (club id, reader, poster)
+    reader, reader_id = log_in('reader')
+    poster, poster_id = log_in('poster')
+    client.post('/clubs', headers=poster, json=dict(name='Readers', location='Here', description='Club', creator_id=poster_id))
+    for headers, user_id in ((reader, reader_id), (poster, poster_id)):
+        client.post('/joinclub', headers=headers, json=dict(club_id=1, user_id=user_id))
+    return 1, (reader, reader_id), (poster, poster_id)
+
+
+def post(client, headers, user_id, text):
+    assert client.post('/messages', headers=headers, json=dict(sender_id=user_id, club_id=1, message=text)).status_code == 201
+
+
+def unread(client, headers, user_id):
+    return client.get(f'/users/{user_id}/unread', headers=headers).get_json()
+
+
+def test_unread_counts_skip_own_messages_and_follow_the_cursor(client, club):
+    club_id, (reader, reader_id), (poster, poster_id) = club
+    post(client, poster, poster_id, 'one')
+    post(client, poster, poster_id, 'two')
+    post(client, reader, reader_id, 'mine')
+
+    assert unread(client, reader, reader_id) == {"items": [{"club_id": club_id, "unread": 2}], "total": 2}
+    assert unread(client, poster, poster_id)["total"] == 1
+
+    read = client.post(f'/clubs/{club_id}/read', headers=reader).get_json()
+    assert read["unread"] == 0
+    assert unread(client, reader, reader_id)["total"] == 0
+
+    post(client, poster, poster_id, 'three')
+    assert unread(client, reader, reader_id)["total"] == 1
+
+
+def test_read_cursor_never_moves_back(client, club):
+    club_id, (reader, reader_id), (poster, poster_id) = club
+    for text in ('one', 'two', 'three'):
+        post(client, poster, poster_id, text)
+    oldest, middle, newest = reversed([m["id"] for m in client.get(f'/clubs/{club_id}/messages').get_json()["items"]])
+
+    assert client.post(f'/clubs/{club_id}/read', headers=reader, json=dict(message_id=middle)).get_json() == {
+        "club_id": club_id, "last_read_id": middle, "unread": 1,
+    }
+    assert client.post(f'/clubs/{club_id}/read', headers=reader, json=dict(message_id=oldest)).get_json()["last_read_id"] == middle
+    assert client.post(f'/clubs/{club_id}/read', headers=reader).get_json()["last_read_id"] == newest
+
+
+def test_read_requires_membership_and_a_message_of_the_club(client, club, log_in):
+    club_id, (reader, _), _ = club
+    outsider, _ = log_in('outsider')
+
+    assert client.post(f'/clubs/{club_id}/read', headers=outsider).status_code == 403
+    assert client.post(f'/clubs/{club_id}/read', headers=reader, json=dict(message_id=999)).status_code == 404
+    assert client.post(f'/clubs/{club_id}/read', headers=reader, json=dict(message_id='1')).status_code == 400
+
+
+def test_unread_counts_are_only_for_the_user_themselves(client, club):
+    _, (reader, _), (_, poster_id) = club
+
+    assert client.get(f'/users/{poster_id}/unread', headers=reader).status_code == 401
+
+
+def test_unread_counts_stop_at_the_cap(client, club):
+    club_id, (reader, reader_id), (poster, poster_id) = club
+    db.session.add_all(
+        Message(club_id=club_id, sender_id=poster_id, message=f'Message {i}') for i in range(UNREAD_COUNT_MAX + 20)
+    )
+    db.session.commit()
+
+    counts = unread(client, reader, reader_id)
+
+    assert counts == {"items": [{"club_id": club_id, "unread": f"{UNREAD_COUNT_MAX}+"}], "total": f"{UNREAD_COUNT_MAX}+"}
@@ -0,0 +1,43 @@
+import pytest
+
+from app import replica_router
+from cache import TTLCache
+
+
+@pytest.fixture
+def replica_uris(database_uri):
+    # The scratch database doubles as its own replica, only the routing is checked
+    return database_uri
+
+
+@pytest.fixture
+def stickiness(monkeypatch):
+    backend = TTLCache(maxsize=100, ttl=60)
+    monkeypatch.setattr(replica_router, 'backend', backend)
+    return backend
+
+
+def routed_as(client, headers):
+    before = dict(replica_router.routed)
+    client.get('/clubs', headers=headers)
+    return next(target for target, count in replica_router.routed.items() if count != before[target])
+
+
+def test_logging_in_makes_only_that_user_sticky(log_in, stickiness):
+    log_in('alice')
+
+    assert replica_router.is_sticky('alice')
+    assert not replica_router.is_sticky('bob')
+
+
+def test_writes_are_sticky_per_user_not_per_address(client, log_in, stickiness, monkeypatch):
+    (alice, _), (bob, _) = log_in('alice'), log_in('bob')
+    monkeypatch.setattr(replica_router, 'backend', TTLCache(maxsize=100, ttl=60))
+
+    # Both come from the test client's address
+    response = client.patch('/profile/alice', headers=alice, json=dict(first_name='Alice'))
+    assert response.status_code == 200
+
+    assert routed_as(client, alice) == 'sticky'
+    assert routed_as(client, bob) == 'replica'
+    assert routed_as(client, {}) == 'replica'
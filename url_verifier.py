@@ -0,0 +1,75 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cache import TTLCache
+
+
+class URLVerifier:
+    """Checks that URLs answer a HEAD request with 200, off the request path.
+
+    Checks run on a fixed pool of worker threads sharing one pooled HTTP session
+    with strict connect/read timeouts. Verdicts are cached for `ttl` seconds and
+    concurrent checks of the same URL share a single request.
+    """
+
+    def __init__(self, max_workers=4, max_pending=256, timeout=(2, 3), ttl=3600, maxsize=4096, session=None):
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.verdicts = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.session = session or self._make_session(max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="url-verifier")
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    @staticmethod
+    def _make_session(pool_size):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def cached(self, url):
+        # True or False when the URL was checked recently, None when it has to be checked
+        return self.verdicts.get(url)
+
+    def pending(self):
+        return len(self._inflight)
+
+    def saturated(self):
+        return self.pending() >= self.max_pending
+
+    def check(self, url):
+        verdict = self.cached(url)
+        if verdict is not None:
+            return verdict
+
+        try:
+            response = self.session.head(url, timeout=self.timeout, allow_redirects=True)
+            verdict = response.status_code == 200
+        except Exception as e:
+            verdict = False
+
+        self.verdicts.set(url, verdict)
+        return verdict
+
+    def submit(self, url, callback=None):
+        # Schedules a check and returns its future, callback(url, verdict) runs on the worker thread
+        with self._lock:
+            future = self._inflight.get(url)
+            if future is None:
+                future = self._executor.submit(self.check, url)
+                self._inflight[url] = future
+                future.add_done_callback(lambda done: self._forget(url))
+
+        if callback is not None:
+            future.add_done_callback(lambda done: callback(url, done.result()))
+
+        return future
+
+    def _forget(self, url):
+        with self._lock:
+            self._inflight.pop(url, None)